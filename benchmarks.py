@@ -0,0 +1,683 @@
+#!/usr/bin/env python3
+"""
+Benchmarks and equivalence checks for alternative implementations
+
+    python benchmarks.py pdf-backends [--count N] [--repeat N]
+    python benchmarks.py pack-read [--documents N] [--reads N]
+    python benchmarks.py fast-path [--count N] [--dangerous]
+    python benchmarks.py image-assets [--count N] [--repeat N]
+    python benchmarks.py compression [--count N] [--threads N]
+    python benchmarks.py page-transforms [--count N] [--repeat N]
+
+Each benchmark first checks that the alternatives produce equivalent output
+on seeded rendered invoices (exit status 1 if not), then measures throughput.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ContentStream
+
+from generate_invoices import ROTATION_ANGLES, InvoiceGenerator, invoice_seed
+from pdf_backends import multiply, page_matrix
+
+
+def _squash(text: str) -> str:
+    return "".join(text.split())
+
+
+def render_samples(count: int, seed: int, flatten: bool = False, multi_page_ratio: float = 0.3,
+                   rotated: bool = False) -> List[Dict[str, Any]]:
+    """
+    Seeded invoices with a spread of page counts and transforms (all rotated and
+    offset with rotated=True); PDFs unflattened by default
+    """
+    samples = []
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as scratch:
+        generator = InvoiceGenerator(output_dir=scratch)
+        for i in range(count):
+            random.seed(invoice_seed(seed, i))
+            params = generator.sample_invoice_params(multi_page_ratio=multi_page_ratio, rotation_ratio=0.0,
+                                                     offset_ratio=0.0)
+            # Cycle through identity, offset-only, rotation-only and combined transforms
+            kind = 3 if rotated else i % 4
+            params["rotation"] = random.choice(ROTATION_ANGLES) if kind in (2, 3) else 0
+            if kind in (1, 3):
+                params["offset_x"], params["offset_y"] = random.uniform(-20, 20), random.uniform(-20, 20)
+            rendered = generator.render_invoice(**params, flatten=flatten)
+            samples.append({"params": params, "pdf_bytes": rendered["pdf_bytes"], "pages": rendered["page_count"]})
+    return samples
+
+
+def leading_matrix(page) -> tuple:
+    """Product of the cm operators before the first drawing operator of a page"""
+    ctm = (1, 0, 0, 1, 0, 0)
+    for operands, operator in ContentStream(page.get_contents(), page.pdf).operations:
+        if operator == b"q":
+            continue
+        if operator != b"cm":
+            break
+        ctm = multiply(tuple(float(v) for v in operands), ctm)
+    return ctm
+
+
+def check_pdf_equivalence(raw: bytes, reference: bytes, candidate: bytes, params: Dict[str, Any]) -> List[str]:
+    """Differences between a backend's output and the reference backend's; empty when equivalent"""
+    problems = []
+    raw_pdf, ref_pdf, out_pdf = (PdfReader(io.BytesIO(b)) for b in (raw, reference, candidate))
+    if len(out_pdf.pages) != len(ref_pdf.pages):
+        return [f"page count {len(out_pdf.pages)} != {len(ref_pdf.pages)}"]
+    if "/AcroForm" in out_pdf.trailer["/Root"]:
+        problems.append("AcroForm left in catalog")
+    for number, (raw_page, ref_page, out_page) in enumerate(zip(raw_pdf.pages, ref_pdf.pages, out_pdf.pages), 1):
+        if "/Annots" in out_page:
+            problems.append(f"page {number}: annotations left")
+        box = [float(v) for v in out_page.mediabox]
+        if box != [float(v) for v in ref_page.mediabox]:
+            problems.append(f"page {number}: media box {box}")
+        # The backend's transform is applied on top of whatever the layout set up itself
+        expected = leading_matrix(raw_page)
+        transform = page_matrix(box[2] - box[0], box[3] - box[1], params["rotation"],
+                                params["offset_x"], params["offset_y"])
+        if transform is not None:
+            expected = multiply(expected, transform)
+        actual = leading_matrix(out_page)
+        if any(abs(a - e) > 1e-3 for a, e in zip(actual, expected)):
+            problems.append(f"page {number}: transform {actual} != {expected}")
+        if _squash(out_page.extract_text()) != _squash(ref_page.extract_text()):
+            problems.append(f"page {number}: extracted text differs")
+    return problems
+
+
+def _time(fn: Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_pdf_backends(argv: List[str]) -> int:
+    """Flatten backends: equivalence against PyPDF2, then flatten throughput"""
+    from pdf_backends import BACKENDS, DEFAULT_BACKEND, available_backends, get_backend
+
+    parser = argparse.ArgumentParser(prog="benchmarks.py pdf-backends", description=bench_pdf_backends.__doc__)
+    parser.add_argument("--count", type=int, default=40, help="Rendered invoices to flatten (default: 40)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    backends = available_backends()
+    missing = [name for name in BACKENDS if name not in backends]
+    print(f"Backends: {', '.join(backends)}" + (f" (not installed: {', '.join(missing)})" if missing else ""))
+    samples = render_samples(args.count, args.seed)
+    pages = sum(s["pages"] for s in samples)
+
+    reference = get_backend(DEFAULT_BACKEND)
+    references = [reference.flatten(s["pdf_bytes"], s["params"]["rotation"], s["params"]["offset_x"],
+                                    s["params"]["offset_y"]) for s in samples]
+
+    failed = False
+    results = []
+    for name in backends:
+        backend = get_backend(name)
+        outputs = []
+
+        def run():
+            outputs.clear()
+            for s in samples:
+                p = s["params"]
+                outputs.append(backend.flatten(s["pdf_bytes"], p["rotation"], p["offset_x"], p["offset_y"]))
+
+        elapsed = _time(run, args.repeat)
+        problems = []
+        for s, ref, out in zip(samples, references, outputs):
+            problems += [f"document {s['params']['document_id']}: {p}"
+                         for p in check_pdf_equivalence(s["pdf_bytes"], ref, out, s["params"])]
+        failed = failed or bool(problems)
+        results.append((name, elapsed, sum(len(o) for o in outputs), problems))
+
+    print(f"{len(samples)} invoices, {pages} pages; best of {args.repeat}")
+    print()
+    baseline = results[0][1]
+    for name, elapsed, size, problems in results:
+        status = "equivalent" if not problems else f"{len(problems)} DIFFERENCES"
+        print(f"  {name:<8} {len(samples) / elapsed:8.1f} docs/s  {pages / elapsed:8.1f} pages/s  "
+              f"{baseline / elapsed:5.2f}x  {size / len(samples) / 1024:6.1f} KiB/doc  {status}")
+        for problem in problems[:10]:
+            print(f"      {problem}")
+    return 1 if failed else 0
+
+
+def _percentiles(samples: List[float]) -> str:
+    samples = sorted(samples)
+
+    def pick(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+
+    return f"p50 {pick(0.5):8.1f}us  p99 {pick(0.99):8.1f}us  max {samples[-1] * 1e6:8.1f}us"
+
+
+def _drop_caches() -> bool:
+    # Needs root; otherwise the comparison is with a warm page cache
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def bench_pack_read(argv: List[str]) -> int:
+    """Random-read latency: pack files (mmap index, memoryview records) against loose files"""
+    from pack_files import PackReader, PackWriter
+
+    parser = argparse.ArgumentParser(prog="benchmarks.py pack-read", description=bench_pack_read.__doc__)
+    parser.add_argument("--documents", type=int, default=20000, help="Documents in the corpus (default: 20000)")
+    parser.add_argument("--reads", type=int, default=5000, help="Random reads per layout (default: 5000)")
+    parser.add_argument("--unique", type=int, default=50,
+                        help="Distinct rendered invoices, repeated under new documentIDs (default: 50)")
+    parser.add_argument("--dir", type=str, default=None, help="Scratch directory (default: system temp)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    samples = render_samples(args.unique, args.seed, flatten=True)
+    for sample in samples:
+        sample["json_bytes"] = json.dumps({"documentID": sample["params"]["document_id"],
+                                           "params": sample["params"]}, indent=2).encode("utf-8")
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="pack-bench-", dir=args.dir) as scratch:
+        loose = os.path.join(scratch, "loose")
+        os.makedirs(os.path.join(loose, "pdfs"))
+        os.makedirs(os.path.join(loose, "json"))
+        writer = PackWriter(os.path.join(scratch, "pack"))
+        for document_id in range(args.documents):
+            sample = samples[document_id % len(samples)]
+            with open(os.path.join(loose, "pdfs", f"invoice_{document_id}.pdf"), "wb") as f:
+                f.write(sample["pdf_bytes"])
+            with open(os.path.join(loose, "json", f"invoice_{document_id}.json"), "wb") as f:
+                f.write(sample["json_bytes"])
+            writer.append(document_id, sample["pdf_bytes"], sample["json_bytes"])
+        writer.close()
+
+        rng = random.Random(args.seed)
+        picks = [rng.randrange(args.documents) for _ in range(args.reads)]
+        cold = _drop_caches()
+
+        loose_times = []
+        loose_checksums = []
+        for document_id in picks:
+            start = time.perf_counter()
+            with open(os.path.join(loose, "pdfs", f"invoice_{document_id}.pdf"), "rb") as f:
+                pdf = f.read()
+            with open(os.path.join(loose, "json", f"invoice_{document_id}.json"), "rb") as f:
+                metadata = f.read()
+            # Touch every byte, as a consumer would
+            checksum = zlib.crc32(metadata, zlib.crc32(pdf))
+            loose_times.append(time.perf_counter() - start)
+            loose_checksums.append(checksum)
+
+        if cold:
+            _drop_caches()
+        pack_times = []
+        pack_checksums = []
+        with PackReader(os.path.join(scratch, "pack")) as pack:
+            for document_id in picks:
+                start = time.perf_counter()
+                record = pack.get(document_id)
+                checksum = zlib.crc32(record.json, zlib.crc32(record.pdf))
+                pack_times.append(time.perf_counter() - start)
+                pack_checksums.append(checksum)
+                del record
+
+        failed = loose_checksums != pack_checksums
+        print(f"{args.documents} documents, {args.reads} random reads, "
+              f"{'cold' if cold else 'warm (run as root for cold)'} page cache")
+        print(f"  loose  {_percentiles(loose_times)}  {args.reads / sum(loose_times):9.0f} reads/s")
+        print(f"  pack   {_percentiles(pack_times)}  {args.reads / sum(pack_times):9.0f} reads/s  "
+              f"{'identical bytes' if not failed else 'CONTENT MISMATCH'}")
+    return 1 if failed else 0
+
+
+def page_geometry(page) -> Dict[str, list]:
+    """
+    Text runs, filled rectangles and stroked lines of a page in page coordinates,
+    from a small interpreter for the operators ReportLab and the templates emit
+    """
+    fonts = {name: str(font.get_object()["/BaseFont"]).split("+")[-1]
+             for name, font in page["/Resources"]["/Font"].items()}
+    ctm = (1, 0, 0, 1, 0, 0)
+    stack = []
+    line_matrix = (1, 0, 0, 1, 0, 0)
+    leading = 0.0
+    font = size = None
+    fill = None
+    path = []
+    # Consecutive Tj operators continue a line (platypus splits lines at entities)
+    continued = False
+    geometry: Dict[str, list] = {"text": [], "rects": [], "lines": []}
+
+    def point(x: float, y: float, matrix: tuple = None) -> tuple:
+        a, b, c, d, e, f = matrix or ctm
+        return round(a * x + c * y + e, 2), round(b * x + d * y + f, 2)
+
+    for operands, operator in ContentStream(page.get_contents(), page.pdf).operations:
+        values = [float(v) for v in operands if isinstance(v, (int, float)) or type(v).__name__ in
+                  ("FloatObject", "NumberObject")]
+        if operator == b"q":
+            stack.append(ctm)
+        elif operator == b"Q":
+            ctm = stack.pop()
+        elif operator == b"cm":
+            ctm = multiply(tuple(values), ctm)
+        elif operator == b"BT":
+            line_matrix = (1, 0, 0, 1, 0, 0)
+            continued = False
+        elif operator == b"Tm":
+            line_matrix = tuple(values)
+            continued = False
+        elif operator == b"Td":
+            line_matrix = multiply((1, 0, 0, 1, values[0], values[1]), line_matrix)
+            continued = False
+        elif operator == b"TL":
+            leading = values[0]
+        elif operator == b"T*":
+            line_matrix = multiply((1, 0, 0, 1, 0, -leading), line_matrix)
+            continued = False
+        elif operator == b"Tf":
+            font, size = fonts[operands[0]], values[0]
+        elif operator == b"Tj":
+            text = operands[0]
+            text = text.decode("latin-1") if isinstance(text, bytes) else str(text)
+            if continued:
+                run = geometry["text"][-1]
+                geometry["text"][-1] = (run[0] + text,) + run[1:]
+            else:
+                geometry["text"].append((text, font, size, fill, point(0, 0, multiply(line_matrix, ctm))))
+            continued = True
+        elif operator == b"rg":
+            fill = tuple(round(v, 3) for v in values)
+        elif operator == b"re":
+            x, y, w, h = values
+            geometry["rects"].append((fill, tuple(sorted(point(px, py) for px, py in
+                                                          ((x, y), (x + w, y), (x, y + h), (x + w, y + h))))))
+        elif operator == b"m":
+            path = [point(*values)]
+        elif operator == b"l":
+            path.append(point(*values))
+        elif operator == b"S":
+            geometry["lines"].append(tuple(sorted(path)))
+            path = []
+    for items in geometry.values():
+        items.sort(key=repr)
+    return geometry
+
+
+def _close(a, b, tolerance: float = 0.05) -> bool:
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(_close(x, y, tolerance) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) <= tolerance
+    return a == b
+
+
+def check_layout_equivalence(reference: bytes, candidate: bytes) -> List[str]:
+    """Differences in page count, media box, text and geometry between two renders"""
+    ref_pdf, out_pdf = PdfReader(io.BytesIO(reference)), PdfReader(io.BytesIO(candidate))
+    if len(out_pdf.pages) != len(ref_pdf.pages):
+        return [f"page count {len(out_pdf.pages)} != {len(ref_pdf.pages)}"]
+    problems = []
+    for number, (ref_page, out_page) in enumerate(zip(ref_pdf.pages, out_pdf.pages), 1):
+        if [float(v) for v in out_page.mediabox] != [float(v) for v in ref_page.mediabox]:
+            problems.append(f"page {number}: media box differs")
+        if _squash(out_page.extract_text()) != _squash(ref_page.extract_text()):
+            problems.append(f"page {number}: extracted text differs")
+        expected, actual = page_geometry(ref_page), page_geometry(out_page)
+        for kind in expected:
+            # Sorting can order near-equal coordinates differently, so match each item by its closest peer
+            unmatched = list(actual[kind])
+            for item in expected[kind]:
+                match = next((other for other in unmatched if _close(item, other)), None)
+                if match is None:
+                    problems.append(f"page {number}: {kind} {item} missing")
+                else:
+                    unmatched.remove(match)
+            problems += [f"page {number}: unexpected {kind} {item}" for item in unmatched]
+    return problems
+
+
+def bench_fast_path(argv: List[str]) -> int:
+    """Single-page template fast path: layout equivalence against platypus, then render throughput"""
+    import template_fastpath
+    from generate_invoices import PAGE_SIZES
+
+    parser = argparse.ArgumentParser(prog="benchmarks.py fast-path", description=bench_fast_path.__doc__)
+    parser.add_argument("--count", type=int, default=100, help="Single-page invoices to render (default: 100)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, best is reported (default: 3)")
+    parser.add_argument("--dangerous", action="store_true", help="Include injected payloads (more fallbacks)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as scratch:
+        platypus = InvoiceGenerator(output_dir=scratch, inject_dangerous_html=args.dangerous)
+        fast = InvoiceGenerator(output_dir=scratch, inject_dangerous_html=args.dangerous, fast_path=True)
+    if not fast.fast_path:
+        print("Fast path unavailable (DejaVu fonts not registered)")
+        return 1
+
+    samples = []
+    for i in range(args.count):
+        random.seed(invoice_seed(args.seed, i))
+        params = platypus.sample_invoice_params(multi_page_ratio=0.0, rotation_ratio=0.3, offset_ratio=0.3)
+        params["page_size"] = random.choice(list(PAGE_SIZES))
+        rendered = platypus.render_invoice(**params, flatten=False)
+        samples.append({k: params[k] for k in ("rotation", "offset_x", "offset_y", "page_size")}
+                       | {"invoice": rendered["invoice"], "document_id": params["document_id"]})
+    fallbacks = sum(template_fastpath.get_template(PAGE_SIZES[s["page_size"]]).fill(
+        s["invoice"], fast._escape_html_for_pdf) is None for s in samples)
+
+    results = []
+    for name, generator in (("platypus", platypus), ("template", fast)):
+        outputs = []
+
+        def run():
+            outputs.clear()
+            for s in samples:
+                outputs.append(generator.create_invoice_pdf(s["invoice"], rotation=s["rotation"],
+                                                            offset_x=s["offset_x"], offset_y=s["offset_y"],
+                                                            page_size=s["page_size"]))
+
+        results.append((name, _time(run, args.repeat), list(outputs)))
+
+    problems = []
+    for s, reference, candidate in zip(samples, results[0][2], results[1][2]):
+        problems += [f"document {s['document_id']}: {p}" for p in check_layout_equivalence(reference, candidate)]
+
+    print(f"{len(samples)} single-page invoices ({fallbacks} fall back to platypus); best of {args.repeat}")
+    print()
+    baseline = results[0][1]
+    for name, elapsed, outputs in results:
+        print(f"  {name:<9} {len(samples) / elapsed:8.1f} docs/s  {baseline / elapsed:6.2f}x  "
+              f"{sum(map(len, outputs)) / len(outputs) / 1024:6.1f} KiB/doc")
+    print(f"  layout: {'equivalent' if not problems else f'{len(problems)} DIFFERENCES'}")
+    for problem in problems[:10]:
+        print(f"      {problem}")
+    return 1 if problems else 0
+
+
+def _image_objects(pdf_bytes: bytes) -> List[set]:
+    """Per page, the object numbers of the image XObjects it draws (directly or through forms)"""
+    pages = []
+    for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+        found, pending = set(), [page.get("/Resources")]
+        while pending:
+            resources = pending.pop()
+            resources = resources.get_object() if resources is not None else {}
+            xobjects = resources.get("/XObject")
+            for ref in (xobjects.get_object() if xobjects is not None else {}).values():
+                xobject = ref.get_object()
+                if xobject.get("/Subtype") == "/Image":
+                    found.add(ref.idnum)
+                elif xobject.get("/Subtype") == "/Form":
+                    pending.append(xobject.get("/Resources"))
+        pages.append(found)
+    return pages
+
+
+def bench_image_assets(argv: List[str]) -> int:
+    """Logos, stamps and signatures: one shared XObject per image, then the per-invoice cost of images"""
+    parser = argparse.ArgumentParser(prog="benchmarks.py image-assets", description=bench_image_assets.__doc__)
+    parser.add_argument("--count", type=int, default=100, help="Invoices to render (default: 100)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as scratch:
+        plain = InvoiceGenerator(output_dir=scratch)
+        images = InvoiceGenerator(output_dir=scratch, images=True)
+
+    results = []
+    for name, generator in (("plain", plain), ("images", images)):
+        outputs = []
+
+        def run():
+            outputs.clear()
+            for i in range(args.count):
+                random.seed(invoice_seed(args.seed, i))
+                params = generator.sample_invoice_params(multi_page_ratio=0.3)
+                outputs.append(generator.render_invoice(**params))
+
+        # The first pass includes decoding and compressing every image once
+        start = time.perf_counter()
+        run()
+        first = time.perf_counter() - start
+        results.append((name, first, min(first, _time(run, args.repeat - 1)) if args.repeat > 1 else first,
+                        list(outputs)))
+
+    problems = []
+    for rendered in results[1][3]:
+        assets = rendered["invoice"].image_assets
+        expected = 1 + ("stamp" in assets) + ("signature" in assets)
+        pages = _image_objects(rendered["pdf_bytes"])
+        document = rendered["metadata"]["documentID"]
+        if len(set().union(*pages)) != expected:
+            problems.append(f"document {document}: {len(set().union(*pages))} image XObjects, expected {expected}")
+        if len(pages) > 1 and len(set.intersection(*pages)) != 1:
+            problems.append(f"document {document}: pages don't share one logo XObject")
+    for plain_rendered, image_rendered in zip(results[0][3], results[1][3]):
+        if plain_rendered["page_count"] != image_rendered["page_count"]:
+            problems.append(f"document {plain_rendered['metadata']['documentID']}: page count changed")
+
+    pages = sum(r["page_count"] for r in results[1][3])
+    print(f"{args.count} invoices ({pages} pages); best of {args.repeat}")
+    print()
+    baseline = results[0][2]
+    for name, first, elapsed, outputs in results:
+        print(f"  {name:<7} {args.count / elapsed:8.1f} docs/s  {(elapsed - baseline) / args.count * 1000:+7.2f} ms/doc  "
+              f"{sum(len(r['pdf_bytes']) for r in outputs) / len(outputs) / 1024:6.1f} KiB/doc  "
+              f"(first pass {args.count / first:.1f} docs/s)")
+    print(f"  sharing: {'one XObject per image' if not problems else f'{len(problems)} PROBLEMS'}")
+    for problem in problems[:10]:
+        print(f"      {problem}")
+    return 1 if problems else 0
+
+
+def bench_compression(argv: List[str]) -> int:
+    """Compressed metadata: round trip of every format, then ratio and write cost per format and level"""
+    from compressed_output import MetadataSink, iter_shard, open_metadata
+    from generate_invoices import atomic_write
+
+    parser = argparse.ArgumentParser(prog="benchmarks.py compression", description=bench_compression.__doc__)
+    parser.add_argument("--count", type=int, default=500, help="Invoices to write (default: 500)")
+    parser.add_argument("--threads", type=int, default=2, help="Compression threads (default: 2)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    configs = [("json", None), ("json.gz", 1), ("json.gz", 6), ("json.gz", 9),
+               ("ndjson.gz", 1), ("ndjson.gz", 6), ("ndjson.xz", 0), ("ndjson.xz", 1), ("ndjson.xz", 6)]
+    problems = []
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as scratch:
+        generator = InvoiceGenerator(output_dir=os.path.join(scratch, "render"))
+        rendered = []
+        for i in range(args.count):
+            random.seed(invoice_seed(args.seed, i))
+            params = generator.sample_invoice_params(multi_page_ratio=0.3)
+            rendered.append(generator.render_invoice(**params, flatten=False))
+        # Only metadata is compared, so keep the PDF writes cheap
+        for r in rendered:
+            r["pdf_bytes"] = b"%PDF-1.4\n"
+
+        print(f"{args.count} invoices, {args.threads} compression threads")
+        print()
+        plain_bytes = None
+        for metadata_format, level in configs:
+            out = Path(scratch) / f"{metadata_format}-{level}"
+            (out / "pdfs").mkdir(parents=True)
+            (out / "json").mkdir()
+            start = time.perf_counter()
+            if metadata_format == "json":
+                for r in rendered:
+                    atomic_write(out / "pdfs" / r["pdf_filename"], r["pdf_bytes"])
+                    atomic_write(out / "json" / r["json_filename"],
+                                 json.dumps(r["metadata"], indent=2).encode("utf-8"))
+                cpu = 0.0
+            else:
+                sink = MetadataSink(generator, out / "pdfs", out / "json", metadata_format, level, args.threads,
+                                    shard_size=max(1, args.count // 4))
+                for r in rendered:
+                    sink.write(r)
+                sink.close()
+                cpu = sink.compress_seconds
+            elapsed = time.perf_counter() - start
+            size = sum(f.stat().st_size for f in (out / "json").iterdir())
+            plain_bytes = plain_bytes or size
+
+            # Round trip: every record decompresses to the metadata that was written
+            if metadata_format == "json.gz":
+                records = []
+                for r in rendered:
+                    with open_metadata(str(out / "json" / f"{r['json_filename']}.gz")) as f:
+                        records.append(json.load(f))
+            elif metadata_format != "json":
+                records = [json.loads(text) for shard in sorted((out / "json").iterdir())
+                           for _, text in iter_shard(str(shard))]
+            else:
+                records = [r["metadata"] for r in rendered]
+            if records != [r["metadata"] for r in rendered]:
+                problems.append(f"{metadata_format} level {level}: records differ after decompression")
+
+            label = metadata_format if level is None else f"{metadata_format} -{level}"
+            print(f"  {label:<13} {args.count / elapsed:8.0f} docs/s  {plain_bytes / size:5.1f}x  "
+                  f"{size / args.count / 1024:6.2f} KiB/doc  {cpu / args.count * 1000:6.3f} ms/doc compressing")
+    print(f"  round trip: {'identical' if not problems else f'{len(problems)} DIFFERENCES'}")
+    for problem in problems:
+        print(f"      {problem}")
+    return 1 if problems else 0
+
+
+def legacy_flatten(pdf_bytes: bytes, rotation: float = 0, offset_x: float = 0, offset_y: float = 0) -> bytes:
+    """The PyPDF2 flatten before page_transforms.py: three add_transformation calls per rotated page"""
+    import math
+    from PyPDF2 import PdfWriter, Transformation
+
+    input_pdf = PdfReader(io.BytesIO(pdf_bytes))
+    output_pdf = PdfWriter()
+    for page in input_pdf.pages:
+        if "/Annots" in page:
+            del page["/Annots"]
+        page_width = float(page.mediabox.width)
+        page_height = float(page.mediabox.height)
+        if rotation != 0 or offset_x != 0 or offset_y != 0:
+            center_x, center_y = page_width / 2, page_height / 2
+            if rotation != 0:
+                angle_rad = math.radians(rotation)
+                cos_angle, sin_angle = math.cos(angle_rad), math.sin(angle_rad)
+                page.add_transformation(Transformation().translate(tx=-center_x, ty=-center_y))
+                page.add_transformation(Transformation((cos_angle, sin_angle, -sin_angle, cos_angle, 0, 0)))
+                page.add_transformation(Transformation().translate(tx=center_x + offset_x, ty=center_y + offset_y))
+            else:
+                page.add_transformation(Transformation().translate(tx=offset_x, ty=offset_y))
+        output_pdf.add_page(page)
+    buffer = io.BytesIO()
+    output_pdf.write(buffer)
+    return buffer.getvalue()
+
+
+def bench_page_transforms(argv: List[str]) -> int:
+    """Page transforms: cached matrix and one content wrap per page against chained add_transformation"""
+    from page_transforms import rotation_matrix
+    from pdf_backends import get_backend
+
+    parser = argparse.ArgumentParser(prog="benchmarks.py page-transforms", description=bench_page_transforms.__doc__)
+    parser.add_argument("--count", type=int, default=30, help="Rotated multi-page invoices (default: 30)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    samples = render_samples(args.count, args.seed, multi_page_ratio=1.0, rotated=True)
+    pages = sum(s["pages"] for s in samples)
+    backend = get_backend("pypdf2")
+    engines = {"chained": legacy_flatten, "wrapped": backend.flatten}
+
+    problems = []
+    for s in samples:
+        p = s["params"]
+        reference = legacy_flatten(s["pdf_bytes"], p["rotation"], p["offset_x"], p["offset_y"])
+        candidate = backend.flatten(s["pdf_bytes"], p["rotation"], p["offset_x"], p["offset_y"])
+        problems += [f"document {p['document_id']}: {problem}"
+                     for problem in check_pdf_equivalence(s["pdf_bytes"], reference, candidate, p)]
+
+    # Each path's own untransformed pass measures its read/write cost, subtracted to isolate the transform
+    print(f"{len(samples)} rotated invoices, {pages} pages; best of {args.repeat}")
+    results = {}
+    for name, flatten in engines.items():
+        outputs = []
+
+        def run():
+            outputs.clear()
+            for s in samples:
+                p = s["params"]
+                outputs.append(flatten(s["pdf_bytes"], p["rotation"], p["offset_x"], p["offset_y"]))
+
+        untransformed = _time(lambda: [flatten(s["pdf_bytes"]) for s in samples], args.repeat)
+        elapsed = _time(run, args.repeat)
+        results[name] = (elapsed, elapsed - untransformed)
+        transform = f"{(elapsed - untransformed) / pages * 1000:7.3f}" if elapsed > untransformed else "    ≈ 0"
+        print(f"  {name:<9} flatten   {elapsed / pages * 1000:7.3f} ms/page, read/write only "
+              f"{untransformed / pages * 1000:7.3f} ms/page, transform {transform} ms/page, "
+              f"{sum(len(o) for o in outputs) / len(samples) / 1024:6.1f} KiB/doc")
+    (chained, chained_transform), (wrapped, wrapped_transform) = results["chained"], results["wrapped"]
+    if chained_transform > 0 and wrapped_transform > 0:
+        transform = f"{chained_transform / wrapped_transform:.1f}x transform"
+    else:
+        # A transform cheaper than the timing noise leaves nothing to divide by
+        transform = "transform cost within timing noise"
+    print(f"  speedup   {chained / wrapped:.2f}x flatten, {transform}")
+
+    # Matrix setup alone: recomputed per page before, one cache lookup now
+    calls = 100000
+    uncached = _time(lambda: [rotation_matrix.__wrapped__(612.0, 792.0, ROTATION_ANGLES[i % 10])
+                              for i in range(calls)], args.repeat)
+    cached = _time(lambda: [rotation_matrix(612.0, 792.0, ROTATION_ANGLES[i % 10]) for i in range(calls)], args.repeat)
+    print(f"  matrix    {uncached / calls * 1e6:.2f} µs computed, {cached / calls * 1e6:.2f} µs cached")
+
+    print(f"  {'equivalent' if not problems else f'{len(problems)} DIFFERENCES'}")
+    for problem in problems[:10]:
+        print(f"      {problem}")
+    return 1 if problems else 0
+
+
+BENCHMARKS: Dict[str, Callable[[List[str]], int]] = {
+    "pdf-backends": bench_pdf_backends,
+    "pack-read": bench_pack_read,
+    "fast-path": bench_fast_path,
+    "image-assets": bench_image_assets,
+    "compression": bench_compression,
+    "page-transforms": bench_page_transforms,
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in BENCHMARKS:
+        print(f"usage: benchmarks.py {{{','.join(BENCHMARKS)}}} [options]")
+        for name, fn in BENCHMARKS.items():
+            print(f"  {name:<14} {fn.__doc__}")
+        sys.exit(2)
+    sys.exit(BENCHMARKS[argv[0]](argv[1:]))
+
+
+if __name__ == "__main__":
+    main()
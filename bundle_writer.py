@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Batch-scan bundles
+Streams many rendered invoices into one multi-invoice PDF, the way intake
+receives batch scans, plus a sidecar index mapping page ranges to documentIDs
+and their JSON ground truth.
+
+Each invoice's page objects are copied into the bundle as soon as it is
+rendered and immediately forgotten; only the cross-reference offsets and the
+page list are kept, so memory stays bounded for bundles of thousands of pages.
+"""
+
+import io
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
+
+from checksum_manifest import HashingFile
+from invoice_records import retarget_metadata
+
+# Fixed object numbers for the bundle's page tree root and catalog
+PAGES_ROOT_ID = 1
+CATALOG_ID = 2
+
+
+class StreamingPdfWriter:
+    """Minimal append-only PDF writer that copies pages from finished PDFs straight to disk"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        # Written under a temp name and renamed on close, so readers never see a partial bundle
+        self.tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        # Hashed as written, for the checksum manifest
+        self.file = HashingFile(open(self.tmp_path, "wb"))
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.offsets: Dict[int, int] = {}
+        self.page_ids: List[int] = []
+        self.next_id = CATALOG_ID + 1
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_ids)
+
+    def _write_object(self, object_id: int, obj):
+        self.offsets[object_id] = self.file.tell()
+        buffer = io.BytesIO()
+        buffer.write(f"{object_id} 0 obj\n".encode("ascii"))
+        obj.write_to_stream(buffer, None)
+        buffer.write(b"\nendobj\n")
+        self.file.write(buffer.getvalue())
+
+    def add_pdf(self, pdf_bytes: bytes) -> Tuple[int, int]:
+        """Append every page of a PDF; returns the 1-based (first, last) page numbers in the bundle"""
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        mapping: Dict[Tuple[int, int], int] = {}
+        pending: List[Tuple[int, Any]] = []
+
+        def remap(ref: IndirectObject) -> IndirectObject:
+            key = (ref.idnum, ref.generation)
+            if key not in mapping:
+                mapping[key] = self.next_id
+                self.next_id += 1
+                pending.append((mapping[key], ref))
+            return IndirectObject(mapping[key], 0, None)
+
+        def copy(obj):
+            if isinstance(obj, IndirectObject):
+                return remap(obj)
+            if isinstance(obj, StreamObject):
+                clone = obj.__class__()
+                clone._data = obj._data
+                for key, value in obj.items():
+                    clone[key] = copy(value)
+                return clone
+            if isinstance(obj, DictionaryObject):
+                clone = DictionaryObject()
+                for key, value in obj.items():
+                    clone[key] = copy(value)
+                return clone
+            if isinstance(obj, ArrayObject):
+                return ArrayObject(copy(value) for value in obj)
+            return obj
+
+        first_page = self.page_count + 1
+        for page in reader.pages:
+            page_id = remap(page.indirect_reference).idnum
+            self.page_ids.append(page_id)
+
+        page_id_set = set(self.page_ids[first_page - 1:])
+        while pending:
+            object_id, ref = pending.pop()
+            obj = reader.get_object(ref)
+            if object_id in page_id_set:
+                page = DictionaryObject()
+                for key, value in obj.items():
+                    # Pages hang off the bundle's page tree; annotations are stripped as in flatten_pdf
+                    if key in ("/Parent", "/Annots"):
+                        continue
+                    page[key] = copy(value)
+                page[NameObject("/Parent")] = IndirectObject(PAGES_ROOT_ID, 0, None)
+                obj = page
+            else:
+                obj = copy(obj)
+            self._write_object(object_id, obj)
+
+        return first_page, self.page_count
+
+    def close(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.offsets[PAGES_ROOT_ID] = self.file.tell()
+        self.file.write(
+            f"{PAGES_ROOT_ID} 0 obj\n<< /Type /Pages /Kids [ {kids} ] /Count {self.page_count} >>\nendobj\n"
+            .encode("ascii")
+        )
+        self.offsets[CATALOG_ID] = self.file.tell()
+        self.file.write(
+            f"{CATALOG_ID} 0 obj\n<< /Type /Catalog /Pages {PAGES_ROOT_ID} 0 R >>\nendobj\n".encode("ascii")
+        )
+
+        xref_offset = self.file.tell()
+        size = self.next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, size):
+            lines.append(f"{self.offsets[object_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {size} /Root {CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self.file.write("".join(lines).encode("ascii"))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class BundleSink:
+    """
+    Output sink writing invoices back to back into bundle PDFs of `bundle_size`
+    invoices each, with a sidecar NDJSON index per bundle. Each index line holds
+    the page range, IDs and full JSON ground truth of one invoice.
+    """
+
+    def __init__(self, output_dir: Path, bundle_size: int = 100, prefix: str = "bundle", manifest=None):
+        self.bundle_dir = Path(output_dir) / "bundles"
+        self.bundle_dir.mkdir(parents=True, exist_ok=True)
+        self.bundle_size = max(1, bundle_size)
+        self.prefix = prefix
+        self.bundle_number = 0
+        self.writer: Optional[StreamingPdfWriter] = None
+        self.index_file = None
+        self.in_bundle = 0
+        self.bundles: List[str] = []
+        # Optional checksum_manifest.Manifest recording finished bundles and indexes
+        self.manifest = manifest
+
+    def _open_bundle(self):
+        self.bundle_number += 1
+        name = f"{self.prefix}_{self.bundle_number:05d}"
+        self.writer = StreamingPdfWriter(self.bundle_dir / f"{name}.pdf")
+        self.index_path = self.bundle_dir / f"{name}.index.ndjson"
+        tmp_index = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+        self.index_file = HashingFile(open(tmp_index, "wb"))
+        self.in_bundle = 0
+        self.bundles.append(str(self.writer.path))
+
+    def _close_bundle(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.index_file.close()
+            os.replace(self.index_file.name, self.index_path)
+            if self.manifest is not None:
+                self.manifest.add(*self.writer.file.checksum(self.writer.path))
+                self.manifest.add(*self.index_file.checksum(self.index_path))
+            self.writer = None
+            self.index_file = None
+
+    def write(self, rendered: Dict[str, Any]) -> Dict[str, Any]:
+        """Append one rendered invoice (see InvoiceGenerator.render_invoice)"""
+        if self.writer is None:
+            self._open_bundle()
+
+        first_page, last_page = self.writer.add_pdf(rendered["pdf_bytes"])
+        bundle_path = self.writer.path.absolute()
+        pdf_url = f"file://{bundle_path}#page={first_page}"
+        metadata = retarget_metadata(rendered["metadata"], pdf_url, self.writer.path.name)
+
+        self.index_file.write(json.dumps({
+            "documentID": metadata["documentID"],
+            "entityID": metadata["entityID"],
+            "invoiceNumber": rendered["invoice"].invoice_number,
+            "first_page": first_page,
+            "last_page": last_page,
+            "metadata": metadata,
+        }).encode("utf-8") + b"\n")
+
+        result = {
+            # Page range fragment keeps bundle members distinct (e.g. as corpus index keys)
+            "pdf_path": f"{bundle_path}#pages={first_page}-{last_page}",
+            "json_path": str(self.index_path.absolute()),
+            "metadata": metadata,
+            "invoice": rendered["invoice"],
+            "page_count": last_page - first_page + 1,
+            "injections": rendered["injections"],
+            "profile": rendered["profile"],
+            "render_cache": rendered["render_cache"],
+        }
+
+        self.in_bundle += 1
+        if self.in_bundle >= self.bundle_size:
+            self._close_bundle()
+        return result
+
+    def close(self):
+        self._close_bundle()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "bundle_directory": str(self.bundle_dir.absolute()),
+            "bundles": [Path(path).name for path in self.bundles],
+        }
+
+    def describe(self) -> str:
+        return f"Bundles: {self.bundle_dir} ({len(self.bundles)} PDFs with page-range indexes)"
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Host calibration
+Runs a short seeded sample through the real generation path at several
+concurrency levels, within the CPU and memory limits of the container (cgroup
+v2 or v1), then through each candidate output sink at the best of them; picks
+the fastest settings and predicts wall time and output bytes for a requested
+corpus size and workload mix.
+
+Trials use the generator settings of the run being calibrated (PDF backend,
+fast path, images, dangerous payloads, render cache). A render cache is given
+to each trial empty, so trials measure a first run rather than one another's
+cache hits.
+
+The chosen settings are saved to a calibration file that generation runs load
+with --calibration.
+"""
+
+import contextlib
+import io
+import json
+import math
+import os
+import resource
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from generate_invoices import InvoiceGenerator, atomic_write
+from memory_governor import current_rss_bytes
+
+# Fraction of the memory limit calibrated settings may plan to use
+MEMORY_HEADROOM = 0.8
+
+# Memory limits at or above this are "unlimited" (cgroup v1 reports a huge number)
+_UNLIMITED = 1 << 60
+
+# Output sinks calibration can try, as generate_batch arguments
+SINKS: Dict[str, Dict[str, Any]] = {
+    "files": {},
+    "json.gz": {"metadata_format": "json.gz"},
+    "ndjson.gz": {"metadata_format": "ndjson.gz"},
+    "ndjson.xz": {"metadata_format": "ndjson.xz"},
+    "pack": {"pack_segment_mb": 1024},
+    "bundle": {"bundle_size": 100},
+}
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota in cores from cgroup v2 cpu.max or v1 cfs quota, None if unlimited"""
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max":
+            return int(quota) / int(period or 100000)
+        return None
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cgroup_memory_limit() -> Optional[int]:
+    """Memory limit in bytes from cgroup v2 memory.max or v1 limit_in_bytes, None if unlimited"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        if value and value != "max" and int(value) < _UNLIMITED:
+            return int(value)
+    return None
+
+
+def host_limits() -> Dict[str, Any]:
+    """Visible CPUs, cgroup limits and the resulting usable CPU count"""
+    try:
+        visible = len(os.sched_getaffinity(0))
+    except AttributeError:
+        visible = os.cpu_count() or 1
+    cpu_limit = cgroup_cpu_limit()
+    effective = visible if cpu_limit is None else max(1, min(visible, math.floor(cpu_limit)))
+    return {
+        "cpus_visible": visible,
+        "cpu_limit": cpu_limit,
+        "memory_limit_bytes": cgroup_memory_limit(),
+        "effective_cpus": effective,
+    }
+
+
+def _children_peak_rss() -> int:
+    # Peak RSS of the largest reaped child process (worker processes)
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+
+def _directory_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def _worker_candidates(cpus: int) -> List[int]:
+    candidates = {0, 1, cpus}
+    n = 2
+    while n < cpus:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+def run_trial(
+    scratch_dir: Path,
+    settings: Dict[str, Any],
+    sample: int,
+    seed: int,
+    workload=None,
+    generator_config: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Generate `sample` invoices with the given settings in a throwaway directory;
+    generator_config holds the InvoiceGenerator arguments of the run being calibrated
+    """
+    trial_dir = Path(tempfile.mkdtemp(prefix="calibration-", dir=scratch_dir))
+    cache_dir = Path(tempfile.mkdtemp(prefix="calibration-cache-", dir=scratch_dir))
+    try:
+        config = {**(generator_config or {}), "output_dir": str(trial_dir), "run_id": None}
+        if config.get("render_cache"):
+            config["render_cache"] = str(cache_dir)
+        generator = InvoiceGenerator(**config)
+        pipeline = settings.get("pipeline")
+        # Per-invoice progress lines would drown the calibration output
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            results = generator.generate_batch(
+                count=sample,
+                seed=seed,
+                workload=workload,
+                workers=settings.get("workers", 0),
+                chunk_size=settings.get("chunk_size", 8),
+                pipeline={name: tuple(spec) for name, spec in pipeline.items()} if pipeline else None,
+                **SINKS[settings.get("sink", "files")]
+            )
+            elapsed = time.perf_counter() - start
+        output_bytes = _directory_bytes(trial_dir)
+        return {
+            "settings": settings,
+            "invoices": sample,
+            "pages": sum(r["page_count"] for r in results),
+            "elapsed_seconds": elapsed,
+            "invoices_per_second": sample / elapsed,
+            "output_bytes": output_bytes,
+            "bytes_per_invoice": output_bytes / sample,
+            "parent_rss_bytes": current_rss_bytes(),
+            "worker_peak_rss_bytes": _children_peak_rss(),
+        }
+    finally:
+        shutil.rmtree(trial_dir, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _describe(settings: Dict[str, Any]) -> str:
+    if settings.get("pipeline"):
+        return "pipeline " + " ".join(f"{name}={n}{kind[0]}" for name, (n, kind) in settings["pipeline"].items())
+    description = f"{settings['workers']} workers, chunk size {settings['chunk_size']}" if settings.get("workers") \
+        else "in-process"
+    return description + (f", {settings['sink']}" if settings.get("sink", "files") != "files" else "")
+
+
+def calibrate(
+    scratch_dir: str,
+    sample: int = 200,
+    count: int = 10_000_000,
+    seed: int = 1,
+    workload=None,
+    workload_description: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    generator_config: Optional[Dict[str, Any]] = None,
+    sinks: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Measure candidate settings on this host and return the calibration (see module
+    docstring). sinks are the SINKS to try (default: all); output is loose files
+    unless another sink wins.
+    """
+    from invoice_pipeline import default_stages
+
+    limits = host_limits()
+    cpus = limits["effective_cpus"] if max_workers is None else min(limits["effective_cpus"], max_workers)
+    memory_limit = limits["memory_limit_bytes"]
+    scratch = Path(scratch_dir)
+    scratch.mkdir(parents=True, exist_ok=True)
+
+    print(f"Calibrating on {cpus} usable CPUs (visible: {limits['cpus_visible']}, "
+          f"cgroup quota: {limits['cpu_limit'] or 'none'}), memory limit: "
+          f"{f'{memory_limit / 2**20:.0f} MiB' if memory_limit else 'none'}")
+    print(f"  - {sample} invoices per trial, seed {seed}")
+    sinks = list(SINKS) if sinks is None else sinks
+    print()
+
+    trials: List[Dict[str, Any]] = []
+
+    def trial(settings: Dict[str, Any]) -> Dict[str, Any]:
+        result = run_trial(scratch, settings, sample, seed, workload, generator_config)
+        trials.append(result)
+        print(f"  {_describe(settings):<56} {result['invoices_per_second']:7.1f} invoices/s  "
+              f"{result['bytes_per_invoice'] / 1024:6.1f} KiB/invoice")
+        return result
+
+    def fits_memory(workers: int) -> bool:
+        if memory_limit is None or not trials:
+            return True
+        worker_rss = max(t["worker_peak_rss_bytes"] for t in trials) or current_rss_bytes()
+        return current_rss_bytes() + workers * worker_rss <= memory_limit * MEMORY_HEADROOM
+
+    # Worker counts at the default chunk size, then chunk sizes at the best worker count
+    for workers in _worker_candidates(cpus):
+        if not fits_memory(workers):
+            print(f"  {workers} workers would exceed the memory limit; stopping")
+            break
+        trial({"workers": workers, "chunk_size": 8})
+
+    best = max(trials, key=lambda t: t["invoices_per_second"])
+    if best["settings"]["workers"]:
+        for chunk_size in (2, 4, 16, 32):
+            if chunk_size * 2 <= sample:
+                trial({"workers": best["settings"]["workers"], "chunk_size": chunk_size})
+
+    # Output sinks at the best worker settings (the staged pipeline only writes loose files)
+    best = max(trials, key=lambda t: t["invoices_per_second"])
+    for sink in sinks:
+        if sink != "files":
+            trial({**best["settings"], "sink": sink})
+
+    stages = default_stages()
+    stages["render"] = (max(1, cpus - 1), "process")
+    if "files" in sinks and fits_memory(stages["render"][0] + stages["transform"][0]):
+        trial({"pipeline": stages})
+
+    best = max((t for t in trials if t["settings"].get("sink", "files") in sinks),
+               key=lambda t: t["invoices_per_second"])
+    settings = dict(best["settings"])
+    workers = settings.get("workers") or 0
+    if workers and best["worker_peak_rss_bytes"]:
+        # Recycle workers well before they could crowd each other out of the memory limit
+        ceiling = best["worker_peak_rss_bytes"] * 2
+        if memory_limit is not None:
+            ceiling = min(ceiling, memory_limit * MEMORY_HEADROOM / (workers + 1))
+        settings["max_rss_mb"] = round(ceiling / 2**20)
+
+    rate = best["invoices_per_second"]
+    calibration = {
+        "host": limits,
+        "sample": sample,
+        "seed": seed,
+        "workload": workload_description,
+        "generator": {name: value for name, value in (generator_config or {}).items()
+                      if name not in ("output_dir", "run_id")},
+        "trials": trials,
+        "settings": settings,
+        "prediction": {
+            "count": count,
+            "invoices_per_second": rate,
+            "wall_seconds": count / rate,
+            "output_bytes": int(count * best["bytes_per_invoice"]),
+            "pages": int(count * best["pages"] / best["invoices"]),
+        },
+        "calibrated_at": datetime.now().isoformat(),
+    }
+    return calibration
+
+
+def save_calibration(path: str, calibration: Dict[str, Any]):
+    atomic_write(Path(path), json.dumps(calibration, indent=2).encode("utf-8"))
+
+
+def load_settings(path: str) -> Dict[str, Any]:
+    """Generation settings from a calibration file, as generate_invoices.py argument defaults"""
+    with open(path) as f:
+        settings = json.load(f)["settings"]
+    defaults: Dict[str, Any] = {}
+    if settings.get("pipeline"):
+        defaults["pipeline"] = True
+        defaults["stage"] = [f"{name}={n}:{kind}" for name, (n, kind) in settings["pipeline"].items()]
+    else:
+        defaults["workers"] = settings.get("workers", 0)
+        defaults["chunk_size"] = settings.get("chunk_size", 8)
+        if settings.get("max_rss_mb"):
+            defaults["max_rss_mb"] = settings["max_rss_mb"]
+        sink = SINKS[settings.get("sink", "files")]
+        if "pack_segment_mb" in sink:
+            defaults["pack"] = True
+            defaults["pack_segment_mb"] = sink["pack_segment_mb"]
+        else:
+            defaults.update(sink)
+    return defaults
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Checksum manifests
+SHA-256 digests of every output file, computed from the bytes as they are
+written, so shipping a corpus needs no second read pass:
+
+- <output>/manifest.sha256, or <output>/manifests/<run ID>.sha256 for --run-id runs
+- coreutils format (`<digest>  <path>`), paths relative to the output directory:
+
+    cd generated_invoices && sha256sum -c manifest.sha256
+
+- Files rewritten later (e.g. a pack index after appending) get a new line;
+  the last line for a path wins
+
+verify-manifest re-hashes the files on a thread pool (hashlib and file reads
+release the GIL) on the receiving side.
+"""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MANIFEST_NAME = "manifest.sha256"
+
+# (path, hex digest, size) of one written file
+Checksum = Tuple[str, str, int]
+
+
+class HashingFile:
+    """File wrapper hashing everything written through it"""
+
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.hash.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def checksum(self, path: Path) -> Checksum:
+        return str(path), self.hash.hexdigest(), self.size
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class Manifest:
+    """Appends checksum lines for files under an output directory"""
+
+    def __init__(self, output_dir: Path, run_id: Optional[str] = None):
+        self.output_dir = Path(output_dir).absolute()
+        if run_id:
+            self.path = self.output_dir / "manifests" / f"{run_id}.sha256"
+            self.path.parent.mkdir(exist_ok=True)
+        else:
+            self.path = self.output_dir / MANIFEST_NAME
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.entries = 0
+        self.bytes = 0
+
+    def add(self, path: str, digest: str, size: int):
+        relative = os.path.relpath(Path(path).absolute(), self.output_dir)
+        self.file.write(f"{digest}  {relative}\n")
+        self.entries += 1
+        self.bytes += size
+
+    def add_all(self, checksums: Iterable[Checksum]):
+        for checksum in checksums:
+            self.add(*checksum)
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def summary(self) -> Dict[str, Any]:
+        return {"manifest": str(self.path), "manifest_entries": self.entries, "manifest_bytes": self.bytes}
+
+
+def find_manifests(output_dir: Path) -> List[Path]:
+    """The manifest and per-run manifests of an output directory"""
+    output_dir = Path(output_dir)
+    manifests = sorted((output_dir / "manifests").glob("*.sha256")) if (output_dir / "manifests").is_dir() else []
+    if (output_dir / MANIFEST_NAME).exists():
+        manifests.insert(0, output_dir / MANIFEST_NAME)
+    return manifests
+
+
+def read_manifests(manifests: Iterable[Path]) -> Dict[str, str]:
+    """relative path -> expected digest; later lines override earlier ones"""
+    expected: Dict[str, str] = {}
+    for manifest in manifests:
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    digest, path = line.split("  ", 1)
+                    expected[path] = digest
+    return expected
+
+
+def _hash_file(path: Path) -> Tuple[Optional[str], int]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest(), f.tell()
+    except FileNotFoundError:
+        return None, 0
+
+
+def verify_manifest(output_dir: str, manifests: Optional[List[Path]] = None,
+                    workers: Optional[int] = None) -> Dict[str, Any]:
+    """Re-hash every file listed in the manifests; returns the report"""
+    output_dir = Path(output_dir)
+    manifests = manifests or find_manifests(output_dir)
+    expected = read_manifests(manifests)
+    workers = workers or min(32, (os.cpu_count() or 1) * 2)
+    start = time.perf_counter()
+    missing: List[str] = []
+    mismatched: List[str] = []
+    total_bytes = 0
+
+    def check(item: Tuple[str, str]) -> Tuple[str, str, Optional[str], int]:
+        path, digest = item
+        actual, size = _hash_file(output_dir / path)
+        return path, digest, actual, size
+
+    checked = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, digest, actual, size in pool.map(check, expected.items()):
+            checked += 1
+            total_bytes += size
+            if actual is None:
+                missing.append(path)
+            elif actual != digest:
+                mismatched.append(path)
+            if checked % 10000 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"[{checked}/{len(expected)}] verified ({total_bytes / 2**20 / elapsed:.0f} MiB/s)")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "output_directory": str(output_dir.absolute()),
+        "manifests": [str(m) for m in manifests],
+        "files_checked": checked,
+        "bytes_checked": total_bytes,
+        "missing": missing,
+        "mismatched": mismatched,
+        "elapsed_seconds": elapsed,
+        "mb_per_second": total_bytes / 2**20 / elapsed if elapsed > 0 else 0.0,
+    }
+
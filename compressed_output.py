@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Compressed metadata output
+Writes the metadata JSON compressed instead of as pretty-printed text:
+
+- json.gz: one gzip file per invoice (json/<name>.json.gz), same content as the .json
+- ndjson.gz / ndjson.xz: rolling shards of one compact JSON record per line
+  (json/metadata_00001.ndjson.gz, ...), a new shard every --ndjson-shard-size invoices
+
+Compression runs on a thread pool (zlib and lzma release the GIL), so it
+overlaps rendering. Shards are written as a sequence of independently
+compressed members of about 1 MiB each; gzip and xz readers
+(gzip.open, lzma.open, zcat, xzcat) decompress concatenated members as one
+stream, which is what lets members be compressed in parallel and appended in
+order. Shards are renamed into place when complete.
+
+The summary reports the compression ratio, the CPU time spent compressing and
+how long the render loop waited for the compressor.
+"""
+
+import gzip
+import json
+import lzma
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from checksum_manifest import HashingFile
+from generate_invoices import InvoiceGenerator, atomic_write
+
+FORMATS = ["json", "json.gz", "ndjson.gz", "ndjson.xz"]
+
+# Default levels: gzip's and xz's own defaults trade ratio for speed differently
+DEFAULT_LEVELS = {"gz": 6, "xz": 1}
+
+
+def _compressor(codec: str, level: int) -> Callable[[bytes], bytes]:
+    if codec == "gz":
+        # mtime=0 keeps output reproducible for seeded runs
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    return lambda data: lzma.compress(data, preset=level)
+
+
+def open_metadata(path: str):
+    """Open a (possibly compressed) metadata file or shard for reading as text"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_shard(path: str) -> Iterator[Tuple[int, str]]:
+    """(line number, JSON text) for every record of an NDJSON shard"""
+    with open_metadata(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield line_number, line
+
+
+class MetadataSink:
+    """
+    Output sink for generate_batch writing PDFs as loose files and metadata compressed
+    (see the module docstring for the formats). PDFs are written by the generator,
+    so render cache hits are linked as in generate_invoice.
+    """
+
+    def __init__(self, generator: InvoiceGenerator, pdf_dir: Path, json_dir: Path, metadata_format: str = "json.gz",
+                 level: Optional[int] = None, threads: int = 2, shard_size: int = 10000,
+                 member_bytes: int = 1 << 20, shard_prefix: str = "metadata", manifest=None):
+        if metadata_format not in FORMATS[1:]:
+            raise ValueError(f"Unknown compressed metadata format {metadata_format!r}; choose from {FORMATS[1:]}")
+        self.pdf_dir = Path(pdf_dir)
+        self.json_dir = Path(json_dir)
+        self.format = metadata_format
+        self.codec = metadata_format.rsplit(".", 1)[1]
+        self.level = DEFAULT_LEVELS[self.codec] if level is None else level
+        self._compress = _compressor(self.codec, self.level)
+        self.threads = max(1, threads)
+        self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="compress")
+        # Bounded backlog, so a slow compressor slows the producer rather than growing memory
+        self.max_pending = self.threads * 4
+        self.pending: Deque[Future] = deque()
+        self.generator = generator
+        # Optional checksum_manifest.Manifest; only written from the generation thread
+        self.manifest = manifest
+
+        self.shard_size = max(1, shard_size)
+        self.member_bytes = member_bytes
+        self.shard_prefix = shard_prefix
+        self.shard_number = 0
+        self.shard_file = None
+        self.shard_path: Optional[Path] = None
+        self.in_shard = 0
+        self.member: List[bytes] = []
+        self.member_size = 0
+        self.shards: List[str] = []
+
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_seconds = 0.0
+        self.stall_seconds = 0.0
+
+    def _compress_timed(self, data: bytes) -> bytes:
+        start = time.perf_counter()
+        compressed = self._compress(data)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.raw_bytes += len(data)
+            self.compressed_bytes += len(compressed)
+            self.compress_seconds += elapsed
+        return compressed
+
+    def _write_file(self, path: Path, data: bytes):
+        compressed = self._compress_timed(data)
+        return "file", (str(path), atomic_write(path, compressed), len(compressed))
+
+    def _submit(self, fn, *args) -> Future:
+        if len(self.pending) >= self.max_pending:
+            self._drain(self.max_pending // 2)
+        future = self.pool.submit(fn, *args)
+        self.pending.append(future)
+        return future
+
+    def _drain(self, keep: int = 0):
+        """
+        Wait for the oldest tasks until at most `keep` are pending, appending finished shard
+        members in order and recording written files in the manifest
+        """
+        start = time.perf_counter()
+        while len(self.pending) > keep:
+            future = self.pending.popleft()
+            kind, result = future.result()
+            if kind == "member":
+                shard_file, compressed = result
+                shard_file.write(compressed)
+            elif self.manifest is not None:
+                self.manifest.add(*result)
+        self.stall_seconds += time.perf_counter() - start
+
+    def _open_shard(self):
+        self.shard_number += 1
+        self.shard_path = self.json_dir / f"{self.shard_prefix}_{self.shard_number:05d}.{self.format}"
+        self.shard_file = HashingFile(open(self.shard_path.with_name(f".{self.shard_path.name}.{os.getpid()}.tmp"),
+                                           "wb"))
+        self.in_shard = 0
+        self.shards.append(self.shard_path.name)
+
+    def _flush_member(self):
+        if not self.member:
+            return
+        data = b"".join(self.member)
+        shard_file = self.shard_file
+        self._submit(lambda: ("member", (shard_file, self._compress_timed(data))))
+        self.member = []
+        self.member_size = 0
+
+    def _close_shard(self):
+        if self.shard_file is None:
+            return
+        self._flush_member()
+        # Members are appended in submission order, so everything pending must land first
+        self._drain()
+        self.shard_file.close()
+        os.replace(self.shard_file.name, self.shard_path)
+        if self.manifest is not None:
+            self.manifest.add(*self.shard_file.checksum(self.shard_path))
+        self.shard_file = None
+
+    def write(self, rendered: Dict[str, Any]) -> Dict[str, Any]:
+        """Write one rendered invoice (see InvoiceGenerator.render_invoice)"""
+        pdf_path = self.pdf_dir / rendered["pdf_filename"]
+        cache_status, digest = self.generator.write_pdf(rendered, pdf_path)
+        if self.manifest is not None:
+            self.manifest.add(str(pdf_path), digest, len(rendered["pdf_bytes"]))
+
+        if self.format == "json.gz":
+            json_path = self.json_dir / f"{rendered['json_filename']}.gz"
+            self._submit(self._write_file, json_path,
+                         json.dumps(rendered["metadata"], indent=2).encode("utf-8"))
+            json_ref = str(json_path)
+        else:
+            if self.shard_file is None:
+                self._open_shard()
+            line = json.dumps(rendered["metadata"], separators=(",", ":")).encode("utf-8") + b"\n"
+            self.member.append(line)
+            self.member_size += len(line)
+            self.in_shard += 1
+            # Record position within the decompressed shard
+            json_ref = f"{self.shard_path.absolute()}#line={self.in_shard}"
+            if self.member_size >= self.member_bytes:
+                self._flush_member()
+            if self.in_shard >= self.shard_size:
+                self._close_shard()
+        self.documents += 1
+
+        return {
+            "pdf_path": str(pdf_path),
+            "json_path": json_ref,
+            "metadata": rendered["metadata"],
+            "invoice": rendered["invoice"],
+            "page_count": rendered["page_count"],
+            "injections": rendered["injections"],
+            "profile": rendered["profile"],
+            "render_cache": cache_status,
+        }
+
+    def close(self):
+        if self.format == "json.gz":
+            self._drain()
+        else:
+            self._close_shard()
+        self.pool.shutdown()
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            "metadata_format": self.format,
+            "metadata_compression": {
+                "level": self.level,
+                "threads": self.threads,
+                "raw_bytes": self.raw_bytes,
+                "compressed_bytes": self.compressed_bytes,
+                "ratio": self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0,
+                "compress_cpu_seconds": round(self.compress_seconds, 3),
+                "compress_mb_per_second": self.raw_bytes / 2**20 / self.compress_seconds
+                if self.compress_seconds else 0.0,
+                # Time the generation loop spent blocked on the compressor
+                "stall_seconds": round(self.stall_seconds, 3),
+            },
+        }
+        if self.format != "json.gz":
+            summary["metadata_shards"] = self.shards
+        return summary
+
+    def describe(self) -> str:
+        stats = self.summary()["metadata_compression"]
+        where = f"{len(self.shards)} {self.format} shards" if self.shards else f"{self.documents} {self.format} files"
+        return (f"PDFs: {self.pdf_dir}\n  - Metadata: {self.json_dir} ({where}; {stats['ratio']:.1f}x smaller, "
+                f"{stats['compress_cpu_seconds']:.1f}s compressing at {stats['compress_mb_per_second']:.0f} MiB/s, "
+                f"{stats['stall_seconds']:.1f}s stalled)")
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+SQLite corpus index
+Records every generated invoice (IDs, file locations, page count, transforms,
+totals and injected payloads) in an SQLite database so downstream validators
+can select documents without parsing the JSON files.
+
+Rows are keyed by PDF path, so indexes from parallel or sharded runs merge
+cleanly: merging the same run twice is idempotent, and a file regenerated at
+the same path replaces its old row.
+
+Example query - all 3-page invoices rotated -2 degrees with SQL in the vendor name:
+
+    index = CorpusIndex("generated_invoices/corpus_index.sqlite")
+    rows = index.find(page_count=3, rotation=-2, field="vendorName", injection_type="sql")
+"""
+
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from invoice_records import Invoice
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    pdf_path TEXT PRIMARY KEY,
+    json_path TEXT NOT NULL,
+    document_id INTEGER NOT NULL,
+    entity_id INTEGER NOT NULL,
+    invoice_number TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    requested_pages INTEGER NOT NULL,
+    line_item_count INTEGER NOT NULL,
+    rotation INTEGER NOT NULL,
+    offset_x REAL NOT NULL,
+    offset_y REAL NOT NULL,
+    page_size TEXT NOT NULL,
+    profile TEXT,
+    subtotal REAL NOT NULL,
+    tax REAL NOT NULL,
+    shipping REAL NOT NULL,
+    total REAL NOT NULL,
+    seed TEXT,
+    indexed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS injections (
+    pdf_path TEXT NOT NULL,
+    field TEXT NOT NULL,
+    injection_type TEXT NOT NULL,
+    position TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_shape ON documents (page_count, rotation);
+CREATE INDEX IF NOT EXISTS idx_documents_document_id ON documents (document_id);
+CREATE INDEX IF NOT EXISTS idx_documents_invoice_number ON documents (invoice_number);
+CREATE INDEX IF NOT EXISTS idx_injections_lookup ON injections (injection_type, field, pdf_path);
+CREATE INDEX IF NOT EXISTS idx_injections_pdf ON injections (pdf_path);
+"""
+
+DOCUMENT_COLUMNS = (
+    "pdf_path", "json_path", "document_id", "entity_id", "invoice_number", "page_count",
+    "requested_pages", "line_item_count", "rotation", "offset_x", "offset_y", "page_size",
+    "profile", "subtotal", "tax", "shipping", "total", "seed", "indexed_at",
+)
+INJECTION_COLUMNS = ("pdf_path", "field", "injection_type", "position", "payload")
+
+
+class CorpusIndex:
+    """Append-mostly SQLite index of generated invoices with batched inserts in WAL mode"""
+
+    def __init__(self, path: str, batch_size: int = 500):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(str(self.path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._documents: List[tuple] = []
+        self._injections: List[tuple] = []
+        self._pending_paths = set()
+
+    def add(
+        self,
+        params: Dict[str, Any],
+        pdf_path: str,
+        json_path: str,
+        invoice: Invoice,
+        page_count: int,
+        injections: Sequence[Dict[str, str]] = ()
+    ):
+        """Queue one invoice for insertion; rows are written in batches"""
+        pdf_path = str(Path(pdf_path).absolute())
+        if pdf_path in self._pending_paths:
+            # Same file written twice in one batch: keep replace semantics simple
+            self.flush()
+        self._pending_paths.add(pdf_path)
+        seed = params.get("seed")
+        self._documents.append((
+            pdf_path,
+            str(Path(json_path).absolute()),
+            params["document_id"],
+            params["entity_id"],
+            str(invoice.invoice_number),
+            page_count,
+            params.get("num_pages", 1),
+            len(invoice.line_items),
+            params.get("rotation", 0),
+            params.get("offset_x", 0),
+            params.get("offset_y", 0),
+            params.get("page_size", "letter"),
+            params.get("profile"),
+            invoice.subtotal,
+            invoice.tax,
+            invoice.shipping,
+            invoice.total,
+            None if seed is None else str(seed),
+            datetime.now().isoformat(),
+        ))
+        for injection in injections:
+            self._injections.append((
+                pdf_path,
+                injection["field"],
+                injection["injection_type"],
+                injection["position"],
+                injection["payload"],
+            ))
+        if len(self._documents) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write queued rows in a single transaction"""
+        if not self._documents:
+            return
+        with self.conn:
+            # A regenerated file replaces its previous row and injections
+            self.conn.executemany(
+                "DELETE FROM injections WHERE pdf_path = ?",
+                ((row[0],) for row in self._documents)
+            )
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO documents ({', '.join(DOCUMENT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(DOCUMENT_COLUMNS))})",
+                self._documents
+            )
+            self.conn.executemany(
+                f"INSERT INTO injections ({', '.join(INJECTION_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(INJECTION_COLUMNS))})",
+                self._injections
+            )
+        self._documents.clear()
+        self._injections.clear()
+        self._pending_paths.clear()
+
+    def merge(self, source: str) -> int:
+        """Merge another index (e.g. from a shard) into this one; returns documents merged"""
+        self.flush()
+        self.conn.execute("ATTACH DATABASE ? AS source", (str(source),))
+        try:
+            with self.conn:
+                count = self.conn.execute("SELECT COUNT(*) FROM source.documents").fetchone()[0]
+                self.conn.execute(
+                    "DELETE FROM injections WHERE pdf_path IN (SELECT pdf_path FROM source.documents)"
+                )
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO documents ({', '.join(DOCUMENT_COLUMNS)}) "
+                    f"SELECT {', '.join(DOCUMENT_COLUMNS)} FROM source.documents"
+                )
+                self.conn.execute(
+                    f"INSERT INTO injections ({', '.join(INJECTION_COLUMNS)}) "
+                    f"SELECT {', '.join(INJECTION_COLUMNS)} FROM source.injections"
+                )
+        finally:
+            self.conn.execute("DETACH DATABASE source")
+        return count
+
+    def find(
+        self,
+        page_count: Optional[int] = None,
+        rotation: Optional[int] = None,
+        field: Optional[str] = None,
+        injection_type: Optional[str] = None,
+        profile: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Find documents by shape and injected payloads (field matches exactly, or by prefix with '%')"""
+        self.flush()
+        clauses, args = [], []
+        for column, value in (("page_count", page_count), ("rotation", rotation), ("profile", profile)):
+            if value is not None:
+                clauses.append(f"d.{column} = ?")
+                args.append(value)
+        if field is not None or injection_type is not None:
+            sub, sub_args = [], []
+            if injection_type is not None:
+                sub.append("i.injection_type = ?")
+                sub_args.append(injection_type)
+            if field is not None:
+                sub.append("i.field LIKE ?" if "%" in field else "i.field = ?")
+                sub_args.append(field)
+            clauses.append(
+                f"d.pdf_path IN (SELECT i.pdf_path FROM injections i WHERE {' AND '.join(sub)})"
+            )
+            args.extend(sub_args)
+
+        query = "SELECT * FROM documents d"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        cursor = self.conn.execute(query, args)
+        names = [c[0] for c in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def count(self) -> int:
+        self.flush()
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def merge_indexes(target: str, sources: Sequence[str]) -> int:
+    """Merge shard indexes into target; returns the total document count afterwards"""
+    with CorpusIndex(target) as index:
+        for source in sources:
+            merged = index.merge(source)
+            print(f"  - Merged {merged} documents from {source}")
+        return index.count()
@@ -12,13 +12,21 @@ Generates randomized PDF invoices with realistic data, supporting:
 """
 
 import argparse
+import contextlib
+import hashlib
 import json
+import os
 import random
+import re
+import socket
+import sys
+import tempfile
+import time
 import uuid
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Any
-from reportlab.lib.pagesizes import letter
+from typing import List, Dict, Any, Optional, Tuple
+from reportlab.lib.pagesizes import letter, legal, A4
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
@@ -27,9 +35,12 @@ from reportlab.lib.enums import TA_LEFT, TA_RIGHT, TA_CENTER
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from PyPDF2 import PdfReader, PdfWriter, Transformation
 import io
 
+import template_fastpath
+from invoice_records import Invoice, LineItem, serialize_metadata
+from pdf_backends import BACKENDS, DEFAULT_BACKEND, get_backend, page_matrix
+
 
 # Sample data pools for randomization
 COMPANY_NAMES = [
@@ -286,11 +297,108 @@ DANGEROUS_CSV_FORMULA_PAYLOADS = [
     "=IFERROR(1/0, cmd|'/c notepad'!A1)",
 ]
 
+# Rotation angles (degrees) used for rotated invoices in batch generation
+ROTATION_ANGLES = [-5, -4, -3, -2, -1, 1, 2, 3, 4, 5]
+
+# Line-item rows per page of the platypus layout: single-page invoices have room for
+# fewer, since the totals share the page
+ITEMS_PER_SINGLE_PAGE = 15
+ITEMS_PER_PAGE = 20
+
+
+def min_pages(num_items: int) -> int:
+    """Fewest pages the layout needs to show every line item"""
+    if num_items <= ITEMS_PER_SINGLE_PAGE:
+        return 1
+    return max(2, -(-num_items // ITEMS_PER_PAGE))
+
+
+# Page sizes available as invoice layouts
+PAGE_SIZES = {
+    "letter": letter,
+    "A4": A4,
+    "legal": legal,
+}
+
+# Default per-field probability of dangerous payload injection (pen testing mode)
+DEFAULT_INJECTION_RATES = {
+    "vendorName": 0.2,
+    "customerName": 0.2,
+    "street": 0.1,
+    "city": 0.1,
+    "invoiceNumber": 0.15,
+    "poNumber": 0.1,
+    "description": 0.15,
+    "productCode": 0.1,
+}
+
+
+def invoice_seed(base_seed: int, index: int) -> int:
+    """Derive a reproducible per-invoice RNG seed from a batch seed and invoice index"""
+    rng = random.Random(f"{base_seed}:{index}")
+    return rng.getrandbits(64)
+
+
+def _read_umask() -> int:
+    # os.umask can only be read by setting it; done once at import, before any threads start
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+# Permissions of every output file (mkstemp would leave them 0600); shared by
+# atomic_file, pack_files and render_cache, whose entries are linked into outputs
+FILE_MODE = 0o666 & ~_read_umask()
+
+
+@contextlib.contextmanager
+def atomic_file(path: Path, mode: str = "wb"):
+    """
+    Open a temp file next to path that replaces path when the block exits
+    without an exception (and is removed otherwise). Readers watching the
+    directory never observe a partially written file, and concurrent writers
+    of the same path never interleave: the last rename wins.
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(path: Path, data: bytes) -> str:
+    """
+    Write bytes to path atomically (temp file in the same directory plus rename);
+    returns the SHA-256 hex digest of the bytes written (see checksum_manifest.py)
+    """
+    with atomic_file(path) as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def default_run_id() -> str:
+    """Run ID unique across concurrent processes and hosts: host, process and start time"""
+    host = re.sub(r"[^A-Za-z0-9-]", "-", socket.gethostname().split(".")[0])
+    return f"{host}-{os.getpid()}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
 
 class InvoiceGenerator:
     """Generates randomized financial invoices"""
     
-    def __init__(self, output_dir: str = "generated_invoices", inject_dangerous_html: bool = False):
+    def __init__(self, output_dir: str = "generated_invoices", inject_dangerous_html: bool = False,
+                 pdf_backend: str = DEFAULT_BACKEND, fast_path: bool = False,
+                 render_cache: Optional[str] = None, render_cache_mb: float = 2048,
+                 images: bool = False, image_dir: Optional[str] = None, run_id: Optional[str] = None):
+        if run_id is not None and not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9_.-]*", run_id):
+            raise ValueError(f"Run ID {run_id!r} must be letters, digits, '-', '_' and '.'")
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.pdf_dir = self.output_dir / "pdfs"
@@ -298,14 +406,47 @@ class InvoiceGenerator:
         self.pdf_dir.mkdir(exist_ok=True)
         self.json_dir.mkdir(exist_ok=True)
         self.inject_dangerous_html = inject_dangerous_html
+        # Namespaces output file names and the summary, so processes can share an output directory
+        self.run_id = run_id
+        # Library used by flatten_pdf (see pdf_backends.py)
+        self.pdf_backend = get_backend(pdf_backend)
         
         # Enable all injection types when dangerous mode is enabled
         self.inject_dangerous_sql = inject_dangerous_html  # SQL injection
         self.inject_dangerous_csv = inject_dangerous_html  # CSV formula injection
         
+        # Per-field injection probabilities; workload profiles may override them per invoice
+        self.injection_rates = dict(DEFAULT_INJECTION_RATES)
+        # Payloads injected into the invoice currently being rendered
+        self.injections: List[Dict[str, str]] = []
+        # Actual page count of the last PDF built by create_invoice_pdf
+        self.last_page_count = 0
+        # Seconds per phase ("layout", "flatten", "cache") of the last PDF built by create_invoice_pdf
+        self.last_timings: Dict[str, float] = {}
+        
         # Register TrueType fonts that will be embedded in PDF
         # This ensures pdfjs can render them without needing standardFontDataUrl
         self._register_fonts()
+        
+        # Single-page invoices from precompiled content-stream templates (see template_fastpath.py)
+        self.fast_path = fast_path and template_fastpath.available()
+        if fast_path and not self.fast_path:
+            print("[FastPath] Warning: DejaVu fonts not registered, rendering every invoice with platypus")
+        
+        # On-disk cache of rendered PDFs shared by all processes (see render_cache.py)
+        self.render_cache = None
+        if render_cache is not None:
+            from render_cache import RenderCache
+            self.render_cache = RenderCache(render_cache, int(render_cache_mb * 2**20))
+        # Logos, stamps and signatures, decoded once per process (see image_assets.py)
+        self.image_assets = None
+        if images:
+            from image_assets import ImageAssets
+            self.image_assets = ImageAssets(image_dir)
+        
+        # Cache entry and outcome ("hit", "miss") of the last PDF built by create_invoice_pdf
+        self.last_cache_path = None
+        self.last_cache_status = None
     
     def _inject_html_payload(self, text: str, injection_probability: float = 0.3) -> str:
         """Randomly inject dangerous HTML payload into text for pen testing"""
@@ -364,7 +505,8 @@ class InvoiceGenerator:
         
         return text
     
-    def _inject_payload(self, text: str, injection_probability: float = 0.3, injection_types: List[str] = None) -> str:
+    def _inject_payload(self, text: str, injection_probability: float = 0.3, injection_types: List[str] = None,
+                        field: Optional[str] = None) -> str:
         """
         Randomly inject dangerous payloads into text for pen testing.
         
@@ -372,6 +514,7 @@ class InvoiceGenerator:
             text: The text to potentially inject into
             injection_probability: Probability of injection (0.0-1.0)
             injection_types: List of injection types to use ['html', 'sql', 'csv']. If None, randomly chooses.
+            field: Name of the invoice field, recorded in self.injections when a payload is injected
         
         Returns:
             Text with potential injection
@@ -408,6 +551,14 @@ class InvoiceGenerator:
         # Randomly choose injection position
         position = random.choice(['append', 'prepend', 'replace'])
         
+        if field is not None:
+            self.injections.append({
+                "field": field,
+                "injection_type": injection_type,
+                "position": position,
+                "payload": payload
+            })
+        
         if position == 'append':
             return f"{text} {payload}"
         elif position == 'prepend':
@@ -446,7 +597,7 @@ class InvoiceGenerator:
         random_days = random.randint(0, delta.days)
         return start + timedelta(days=random_days)
     
-    def generate_address(self) -> str:
+    def generate_address(self, field: str = "address") -> str:
         """Generate a random address"""
         street_num = random.randint(100, 9999)
         street = random.choice(STREET_NAMES)
@@ -455,8 +606,10 @@ class InvoiceGenerator:
         
         # Inject dangerous payloads into address components
         # SQL injection for numeric/search fields, HTML for display fields
-        street = self._inject_payload(street, injection_probability=0.1, injection_types=['html', 'sql'])
-        city = self._inject_payload(city, injection_probability=0.1, injection_types=['html', 'sql'])
+        street = self._inject_payload(street, injection_probability=self.injection_rates['street'], injection_types=['html', 'sql'],
+                                      field=f"{field}.street")
+        city = self._inject_payload(city, injection_probability=self.injection_rates['city'], injection_types=['html', 'sql'],
+                                    field=f"{field}.city")
         
         return f"{street_num} {street}\n{city}, {state} {zipcode}"
     
@@ -497,17 +650,18 @@ class InvoiceGenerator:
         
         return " ".join(parts)
     
-    def generate_line_items(self, num_items: int = None) -> List[Dict[str, Any]]:
+    def generate_line_items(self, num_items: int = None) -> List[LineItem]:
         """Generate random line items for invoice with completely random products"""
         if num_items is None:
             num_items = random.randint(3, 15)
         
         line_items = []
-        for _ in range(num_items):
+        for item_idx in range(num_items):
             description = self.generate_random_product_name()
             # Inject dangerous payloads into descriptions
             # HTML for display, CSV for exports, SQL for database queries
-            description = self._inject_payload(description, injection_probability=0.15)
+            description = self._inject_payload(description, injection_probability=self.injection_rates['description'],
+                                               field=f"lineItems[{item_idx}].description")
             
             quantity = random.randint(1, 10)
             # Generate completely random price between $5 and $500
@@ -517,32 +671,20 @@ class InvoiceGenerator:
             
             # Occasionally inject into product codes - SQL and CSV are more relevant for codes
             if product_code:
-                product_code = self._inject_payload(product_code, injection_probability=0.1, injection_types=['sql', 'csv'])
+                product_code = self._inject_payload(product_code, injection_probability=self.injection_rates['productCode'], injection_types=['sql', 'csv'],
+                                                    field=f"lineItems[{item_idx}].productCode")
             
-            line_item = {
-                "lineID": str(uuid.uuid4()),
-                "description": description,
-                "invoiceDescription": description,
-                "quantity": quantity,
-                "invoiceQuantity": quantity,
-                "unitPrice": unit_price,
-                "invoiceUnitPrice": unit_price,
-                "total": total,
-                "invoiceAmount": total,
-                "productCode": product_code,
-                "invoiceProductCode": product_code,
-                "unit": "",
-                "invoiceUnit": "",
-                "poID": None,
-                "poNumber": None
-            }
-            line_items.append(line_item)
+            line_items.append(LineItem(
+                # Drawn from the seeded RNG so seeded runs reproduce line IDs too
+                str(uuid.UUID(int=random.getrandbits(128), version=4)),
+                description, quantity, unit_price, total, product_code
+            ))
         
         return line_items
     
-    def calculate_totals(self, line_items: List[Dict[str, Any]]) -> Dict[str, float]:
+    def calculate_totals(self, line_items: List[LineItem]) -> Dict[str, float]:
         """Calculate invoice totals"""
-        subtotal = sum(item["total"] for item in line_items)
+        subtotal = sum(item.total for item in line_items)
         shipping = round(random.uniform(0, 25), 2) if random.random() > 0.3 else 0
         tax_rate = random.choice([0.05, 0.06, 0.07, 0.08, 0.0825, 0.09, 0.095])
         tax = round(subtotal * tax_rate, 2)
@@ -557,19 +699,75 @@ class InvoiceGenerator:
     
     def create_invoice_pdf(
         self, 
-        invoice_data: Dict[str, Any], 
+        invoice: Invoice, 
         num_pages: int = 1,
         rotation: int = 0,
         offset_x: float = 0,
-        offset_y: float = 0
+        offset_y: float = 0,
+        page_size: str = "letter",
+        flatten: bool = True
+    ) -> bytes:
+        """
+        Create PDF invoice with specified characteristics.
+        flatten=False returns the layout before flatten_pdf, for callers that
+        run the transform separately (see invoice_pipeline.py).
+        With a render cache, identical inputs are served from the cache.
+        """
+        self.last_cache_path = self.last_cache_status = None
+        self.last_timings = {}
+        if self.render_cache is None:
+            return self._layout_invoice_pdf(invoice, num_pages, rotation, offset_x, offset_y, page_size, flatten)
+        
+        from render_cache import cache_key
+        key = cache_key(invoice.values(), num_pages=num_pages, rotation=rotation, offset_x=offset_x,
+                        offset_y=offset_y, page_size=page_size, flatten=flatten,
+                        renderer="template" if self.fast_path else "platypus",
+                        pdf_backend=self.pdf_backend.name if flatten else None,
+                        image_dir=str(self.image_assets.directory)
+                        if self.image_assets is not None and self.image_assets.directory else None)
+        start = time.perf_counter()
+        cached = self.render_cache.get(key, num_pages)
+        self.last_timings["cache"] = time.perf_counter() - start
+        if cached is not None:
+            self.last_cache_path, pdf_bytes, self.last_page_count = cached
+            self.last_cache_status = "hit"
+            return pdf_bytes
+        
+        pdf_bytes = self._layout_invoice_pdf(invoice, num_pages, rotation, offset_x, offset_y, page_size, flatten)
+        start = time.perf_counter()
+        self.last_cache_path = self.render_cache.put(key, pdf_bytes, self.last_page_count)
+        self.last_timings["cache"] += time.perf_counter() - start
+        self.last_cache_status = "miss"
+        return pdf_bytes
+    
+    def _layout_invoice_pdf(
+        self,
+        invoice: Invoice,
+        num_pages: int,
+        rotation: int,
+        offset_x: float,
+        offset_y: float,
+        page_size: str,
+        flatten: bool
     ) -> bytes:
-        """Create PDF invoice with specified characteristics"""
+        """Render the PDF: the single-page template when enabled and it fits, platypus otherwise"""
+        start = time.perf_counter()
+        # The template has no image slots
+        if self.fast_path and num_pages == 1 and not invoice.image_assets:
+            template = template_fastpath.get_template(PAGE_SIZES[page_size])
+            matrix = page_matrix(template.width, template.height, rotation, offset_x, offset_y) if flatten else None
+            pdf_bytes = template.fill(invoice, self._escape_html_for_pdf, matrix)
+            if pdf_bytes is not None:
+                self.last_page_count = 1
+                self.last_timings["layout"] = time.perf_counter() - start
+                return pdf_bytes
+        
         buffer = io.BytesIO()
         
         # Create PDF
         doc = SimpleDocTemplate(
             buffer,
-            pagesize=letter,
+            pagesize=PAGE_SIZES[page_size],
             rightMargin=0.75*inch,
             leftMargin=0.75*inch,
             topMargin=0.75*inch,
@@ -606,10 +804,10 @@ class InvoiceGenerator:
         story.append(Spacer(1, 0.3*inch))
         
         # Vendor and customer info - escape HTML for safe PDF rendering
-        vendor_name_safe = self._escape_html_for_pdf(invoice_data['vendorName'])
-        customer_name_safe = self._escape_html_for_pdf(invoice_data['customerName'])
-        vendor_address_safe = self._escape_html_for_pdf(invoice_data['vendorAddress']).replace(chr(10), '<br/>')
-        customer_address_safe = self._escape_html_for_pdf(invoice_data['customerAddress']).replace(chr(10), '<br/>')
+        vendor_name_safe = self._escape_html_for_pdf(invoice.vendor_name)
+        customer_name_safe = self._escape_html_for_pdf(invoice.customer_name)
+        vendor_address_safe = self._escape_html_for_pdf(invoice.vendor_address).replace(chr(10), '<br/>')
+        customer_address_safe = self._escape_html_for_pdf(invoice.customer_address).replace(chr(10), '<br/>')
         
         header_data = [
             [
@@ -628,16 +826,16 @@ class InvoiceGenerator:
         story.append(Spacer(1, 0.2*inch))
         
         # Invoice details - escape HTML for safe PDF rendering
-        invoice_number_safe = self._escape_html_for_pdf(str(invoice_data['invoiceNumber']))
-        po_number_safe = self._escape_html_for_pdf(str(invoice_data.get('poNumber', '')))
+        invoice_number_safe = self._escape_html_for_pdf(str(invoice.invoice_number))
+        po_number_safe = self._escape_html_for_pdf(str(invoice.po_number))
         
         detail_data = [
             ["Invoice Number:", invoice_number_safe],
-            ["Invoice Date:", invoice_data['invoiceDate']],
-            ["Due Date:", invoice_data['dueDate']],
+            ["Invoice Date:", invoice.invoice_date],
+            ["Due Date:", invoice.due_date],
         ]
         
-        if invoice_data.get('poNumber'):
+        if invoice.po_number:
             detail_data.append(["PO Number:", po_number_safe])
         
         detail_table = Table(detail_data, colWidths=[2*inch, 4.5*inch])
@@ -651,13 +849,13 @@ class InvoiceGenerator:
         story.append(Spacer(1, 0.3*inch))
         
         # Line items - split across pages if needed
-        items_per_page = 15 if num_pages == 1 else 20
-        line_items = invoice_data['lineItems']
+        items_per_page = ITEMS_PER_SINGLE_PAGE if num_pages == 1 else ITEMS_PER_PAGE
+        line_items = invoice.line_items
         
         for page_idx in range(num_pages):
             if page_idx > 0:
                 story.append(PageBreak())
-                story.append(Paragraph(f"INVOICE {invoice_data['invoiceNumber']} (Continued)", title_style))
+                story.append(Paragraph(f"INVOICE {invoice.invoice_number} (Continued)", title_style))
                 story.append(Spacer(1, 0.3*inch))
             
             start_idx = page_idx * items_per_page
@@ -671,21 +869,21 @@ class InvoiceGenerator:
             table_data = [["Description", "Qty", "Unit Price", "Amount"]]
             
             for item in page_items:
-                description_safe = self._escape_html_for_pdf(item['description'])
+                description_safe = self._escape_html_for_pdf(item.description)
                 table_data.append([
                     description_safe,
-                    str(item['quantity']),
-                    f"${item['unitPrice']:.2f}",
-                    f"${item['total']:.2f}"
+                    str(item.quantity),
+                    f"${item.unit_price:.2f}",
+                    f"${item.total:.2f}"
                 ])
             
             # Add totals on last page
             if page_idx == num_pages - 1 or end_idx >= len(line_items):
-                table_data.append(["", "", "Subtotal:", f"${invoice_data['invoiceSubtotal']:.2f}"])
-                if invoice_data.get('invoiceShipping', 0) > 0:
-                    table_data.append(["", "", "Shipping:", f"${invoice_data['invoiceShipping']:.2f}"])
-                table_data.append(["", "", "Tax:", f"${invoice_data['invoiceTax']:.2f}"])
-                table_data.append(["", "", "Total:", f"${invoice_data['invoiceTotal']:.2f}"])
+                table_data.append(["", "", "Subtotal:", f"${invoice.subtotal:.2f}"])
+                if invoice.shipping > 0:
+                    table_data.append(["", "", "Shipping:", f"${invoice.shipping:.2f}"])
+                table_data.append(["", "", "Tax:", f"${invoice.tax:.2f}"])
+                table_data.append(["", "", "Total:", f"${invoice.total:.2f}"])
             
             items_table = Table(table_data, colWidths=[3.5*inch, 0.75*inch, 1*inch, 1.25*inch])
             items_table.setStyle(TableStyle([
@@ -706,13 +904,22 @@ class InvoiceGenerator:
             story.append(items_table)
         
         # Build PDF
+        assets = invoice.image_assets
+        if assets and self.image_assets is not None:
+            # After the page's flowables, so stamps sit on top of the table
+            doc.afterPage = lambda: self.image_assets.draw_page(doc.canv, doc, assets)
         doc.build(story)
+        self.last_page_count = doc.page
         pdf_bytes = buffer.getvalue()
         buffer.close()
+        self.last_timings["layout"] = time.perf_counter() - start
         
         # Always flatten PDF to ensure no editable content
         # This removes any form fields, annotations, or interactive elements
-        pdf_bytes = self.flatten_pdf(pdf_bytes, rotation, offset_x, offset_y)
+        if flatten:
+            start = time.perf_counter()
+            pdf_bytes = self.flatten_pdf(pdf_bytes, rotation, offset_x, offset_y)
+            self.last_timings["flatten"] = time.perf_counter() - start
         
         return pdf_bytes
     
@@ -720,202 +927,272 @@ class InvoiceGenerator:
         """
         Flatten PDF to ensure all content is non-editable and apply transformations.
         This removes any form fields, annotations, or interactive elements.
+        The work is done by the selected PDF backend (see pdf_backends.py).
         """
-        import math
-        input_pdf = PdfReader(io.BytesIO(pdf_bytes))
-        output_pdf = PdfWriter()
-        
-        for page in input_pdf.pages:
-            # Remove any form fields or annotations to ensure content is flattened
-            if '/Annots' in page:
-                del page['/Annots']
-            if '/AcroForm' in page:
-                del page['/AcroForm']
-            
-            # Get page dimensions
-            page_width = float(page.mediabox.width)
-            page_height = float(page.mediabox.height)
-            
-            # Apply transformations if specified
-            if rotation != 0 or offset_x != 0 or offset_y != 0:
-                # Calculate center point for rotation
-                center_x = page_width / 2
-                center_y = page_height / 2
-                
-                if rotation != 0:
-                    # Convert rotation to radians
-                    angle_rad = math.radians(rotation)
-                    cos_angle = math.cos(angle_rad)
-                    sin_angle = math.sin(angle_rad)
-                    
-                    # Create custom transformation matrix for arbitrary rotation
-                    # Rotation matrix around center: translate to origin, rotate, translate back
-                    op = Transformation().translate(tx=-center_x, ty=-center_y)
-                    page.add_transformation(op)
-                    
-                    # Apply rotation matrix manually
-                    op = Transformation((cos_angle, sin_angle, -sin_angle, cos_angle, 0, 0))
-                    page.add_transformation(op)
-                    
-                    # Translate back and apply offset
-                    op = Transformation().translate(tx=center_x + offset_x, ty=center_y + offset_y)
-                    page.add_transformation(op)
-                else:
-                    # Apply only translation
-                    page.add_transformation(Transformation().translate(tx=offset_x, ty=offset_y))
-            
-            output_pdf.add_page(page)
-        
-        # Ensure the output PDF doesn't contain form data
-        # PyPDF2 PdfWriter doesn't copy form fields by default, but be explicit
-        output_pdf._root_object.get('/AcroForm', None)  # This ensures no form exists
-        
-        output_buffer = io.BytesIO()
-        output_pdf.write(output_buffer)
-        output_buffer.seek(0)
-        return output_buffer.getvalue()
+        return self.pdf_backend.flatten(pdf_bytes, rotation, offset_x, offset_y)
     
-    def generate_invoice(
-        self, 
+    def render_invoice(
+        self,
         entity_id: int,
         document_id: int,
         num_pages: int = 1,
         rotation: int = 0,
         offset_x: float = 0,
-        offset_y: float = 0
+        offset_y: float = 0,
+        seed: Optional[int] = None,
+        num_items: Optional[int] = None,
+        page_size: str = "letter",
+        injection_rates: Optional[Dict[str, float]] = None,
+        profile: Optional[str] = None,
+        flatten: bool = True
     ) -> Dict[str, Any]:
-        """Generate a complete invoice with PDF and metadata"""
+        """
+        Generate invoice data, PDF bytes and metadata without writing any files.
+        
+        If seed is given the global RNG is reseeded first, so the same arguments
+        always produce the same invoice (also across worker processes).
+        num_items, page_size and injection_rates come from workload profiles;
+        profile is only carried through to the result. With flatten=False the
+        PDF bytes are the unflattened, untransformed layout. The result's timings
+        give the seconds spent per phase (see tail_tracer.py).
+        """
+        start = time.perf_counter()
+        if seed is not None:
+            random.seed(seed)
+        
+        if injection_rates is not None:
+            default_rates = self.injection_rates
+            self.injection_rates = {**default_rates, **injection_rates}
+            try:
+                return self.render_invoice(
+                    entity_id, document_id, num_pages, rotation, offset_x, offset_y,
+                    num_items=num_items, page_size=page_size, profile=profile, flatten=flatten
+                )
+            finally:
+                self.injection_rates = default_rates
+        
+        self.injections = []
         
         # Generate random invoice data
         invoice_date = self.generate_random_date()
         due_date = invoice_date + timedelta(days=random.randint(15, 45))
         
         vendor_name = random.choice(COMPANY_NAMES)
+        vendor_company = vendor_name
         customer_name = random.choice([c for c in COMPANY_NAMES if c != vendor_name])
         
         # Inject dangerous payloads into vendor/customer names
         # HTML for display, SQL for database queries
-        vendor_name = self._inject_payload(vendor_name, injection_probability=0.2, injection_types=['html', 'sql'])
-        customer_name = self._inject_payload(customer_name, injection_probability=0.2, injection_types=['html', 'sql'])
+        vendor_name = self._inject_payload(vendor_name, injection_probability=self.injection_rates['vendorName'], injection_types=['html', 'sql'],
+                                           field="vendorName")
+        customer_name = self._inject_payload(customer_name, injection_probability=self.injection_rates['customerName'], injection_types=['html', 'sql'],
+                                             field="customerName")
         
         invoice_number = f"{random.randint(1000000, 9999999)}"
         po_number = f"{random.randint(100, 999)}" if random.random() > 0.5 else ""
         
         # Inject dangerous payloads into invoice/PO numbers
         # SQL for database queries, CSV for exports
-        invoice_number = self._inject_payload(invoice_number, injection_probability=0.15, injection_types=['sql', 'csv'])
+        invoice_number = self._inject_payload(invoice_number, injection_probability=self.injection_rates['invoiceNumber'], injection_types=['sql', 'csv'],
+                                              field="invoiceNumber")
         if po_number:
-            po_number = self._inject_payload(po_number, injection_probability=0.1, injection_types=['sql', 'csv'])
+            po_number = self._inject_payload(po_number, injection_probability=self.injection_rates['poNumber'], injection_types=['sql', 'csv'],
+                                             field="poNumber")
         
         # Generate line items based on number of pages
-        base_items = 8 if num_pages == 1 else 15
-        variance = random.randint(-3, 5)
-        num_items = max(3, base_items + variance + (num_pages - 1) * 15)
+        if num_items is None:
+            base_items = 8 if num_pages == 1 else 15
+            variance = random.randint(-3, 5)
+            num_items = max(3, base_items + variance + (num_pages - 1) * 15)
+        # Never fewer pages than the items need, or the PDF would drop items the JSON lists
+        num_pages = max(num_pages, min_pages(num_items))
         
         line_items = self.generate_line_items(num_items)
         totals = self.calculate_totals(line_items)
         
-        invoice_data = {
-            "invoiceNumber": invoice_number,
-            "invoiceDate": invoice_date.strftime("%b %d, %Y"),
-            "dueDate": due_date.strftime("%b %d, %Y"),
-            "vendorName": vendor_name,
-            "vendorAddress": self.generate_address(),
-            "customerName": customer_name,
-            "customerAddress": self.generate_address(),
-            "invoiceTotal": totals["total"],
-            "totalAmount": totals["total"],
-            "invoiceSubtotal": totals["subtotal"],
-            "subTotal": totals["subtotal"],
-            "invoiceTax": totals["tax"],
-            "taxAmount": totals["tax"],
-            "invoiceShipping": totals["shipping"],
-            "shippingFreight": totals["shipping"],
-            "lineItems": line_items,
-            "poNumber": po_number,
-            "purchaseOrderNumber": po_number,
-            "customer": customer_name,
-            "vendor": vendor_name,
-        }
+        invoice = Invoice(
+            invoice_number=invoice_number,
+            invoice_date=invoice_date.strftime("%b %d, %Y"),
+            due_date=due_date.strftime("%b %d, %Y"),
+            vendor_name=vendor_name,
+            vendor_address=self.generate_address("vendorAddress"),
+            customer_name=customer_name,
+            customer_address=self.generate_address("customerAddress"),
+            po_number=po_number,
+            subtotal=totals["subtotal"],
+            tax=totals["tax"],
+            shipping=totals["shipping"],
+            total=totals["total"],
+            line_items=line_items
+        )
+        
+        # Image assets are drawn last so invoices without them are unchanged
+        if self.image_assets is not None:
+            invoice.image_assets = self.image_assets.choose(vendor_company)
         
         # Generate PDF
+        timings = {"data": time.perf_counter() - start}
         pdf_bytes = self.create_invoice_pdf(
-            invoice_data, 
+            invoice, 
             num_pages=num_pages,
             rotation=rotation,
             offset_x=offset_x,
-            offset_y=offset_y
+            offset_y=offset_y,
+            page_size=page_size,
+            flatten=flatten
         )
+        timings.update(self.last_timings)
+        start = time.perf_counter()
         
-        # Save PDF - add '_dangerous_' label if HTML injection is enabled
+        # Name output files - add '_dangerous_' label if HTML injection is enabled
         # Clean invoice_number for filename (remove special characters)
         clean_invoice_number = ''.join(c if c.isalnum() else '_' for c in str(invoice_number))
         dangerous_label = "_dangerous_" if self.inject_dangerous_html else ""
-        pdf_filename = f"invoice{dangerous_label}_{document_id}_{clean_invoice_number}.pdf"
+        run_label = f"_{self.run_id}" if self.run_id else ""
+        pdf_filename = f"invoice{dangerous_label}{run_label}_{document_id}_{clean_invoice_number}.pdf"
+        json_filename = f"invoice{dangerous_label}{run_label}_{document_id}_{clean_invoice_number}.json"
         pdf_path = self.pdf_dir / pdf_filename
-        with open(pdf_path, "wb") as f:
-            f.write(pdf_bytes)
         
-        # Create metadata JSON
+        # Create metadata JSON; the schema dict only exists while it is serialized
         processing_date = datetime.now().isoformat() + "Z"
-        extracted_data = {
-            **invoice_data,
-            "extractionMethod": "hybrid",
-            "processingDate": processing_date,
-            "shippingFreightAllowance": 0,
-            "surcharges": 0,
-            "paymentTerms": "",
-            "invoicePaymentTerm": "",
-            "id": str(document_id),
-            "invoiceID": str(document_id),
-            "invoiceSubtotalTaxShipping": round(totals["tax"] + totals["shipping"], 2),
-            "imageUrls": [f"file://{pdf_path.absolute()}"],
-            "imagePrefixes": [pdf_filename],
-            "pdfImages": {
-                "imageUrls": [f"file://{pdf_path.absolute()}"],
-                "boundingBoxesUrl": ""
-            }
-        }
+        metadata = serialize_metadata(invoice, entity_id, document_id, f"file://{pdf_path.absolute()}",
+                                      pdf_filename, processing_date)
+        timings["metadata"] = time.perf_counter() - start
         
-        metadata = {
-            "entityID": entity_id,
-            "documentID": document_id,
-            "extractedEntitiesPayload": json.dumps({
-                "success": True,
-                "documentId": str(document_id),
-                "extractedEntityId": str(entity_id),
-                "extractedData": extracted_data,
-                "processingSteps": {
-                    "imagesGenerated": True,
-                    "boundingRegionsExtracted": True,
-                    "aiExtractionCompleted": True,
-                    "invoiceMapped": True,
-                    "transformationCompleted": True,
-                    "postProcessingCompleted": True
-                },
-                "completedAt": processing_date
-            }),
-            "stage": "intake",
-            "status": "completed",
-            "substatus": "Extraction Successful",
-            "createdOn": processing_date,
-            "modifiedOn": processing_date,
-            "dateExported": None,
-            "dateFiled": None
+        return {
+            "pdf_bytes": pdf_bytes,
+            "pdf_filename": pdf_filename,
+            "json_filename": json_filename,
+            "metadata": metadata,
+            "invoice": invoice,
+            "page_count": self.last_page_count,
+            "injections": self.injections,
+            "profile": profile,
+            "cache_path": self.last_cache_path,
+            "render_cache": self.last_cache_status,
+            "timings": timings
         }
+    
+    def write_pdf(self, rendered: Dict[str, Any], pdf_path: Path) -> Tuple[Optional[str], str]:
+        """
+        Write a rendered invoice's PDF; cache hits are linked rather than copied.
+        Returns the render cache status ("linked" when linked) and the SHA-256 of the PDF.
+        """
+        cache_status = rendered["render_cache"]
+        if cache_status == "hit" and self.render_cache.link(rendered["cache_path"], pdf_path):
+            return "linked", hashlib.sha256(rendered["pdf_bytes"]).hexdigest()
+        return cache_status, atomic_write(pdf_path, rendered["pdf_bytes"])
+    
+    def generate_invoice(
+        self, 
+        entity_id: int,
+        document_id: int,
+        num_pages: int = 1,
+        rotation: int = 0,
+        offset_x: float = 0,
+        offset_y: float = 0,
+        seed: Optional[int] = None,
+        **render_options
+    ) -> Dict[str, Any]:
+        """Generate a complete invoice with PDF and metadata"""
+        rendered = self.render_invoice(
+            entity_id=entity_id,
+            document_id=document_id,
+            num_pages=num_pages,
+            rotation=rotation,
+            offset_x=offset_x,
+            offset_y=offset_y,
+            seed=seed,
+            **render_options
+        )
         
-        # Save metadata JSON - add '_dangerous_' label if HTML injection is enabled
-        dangerous_label = "_dangerous_" if self.inject_dangerous_html else ""
-        json_filename = f"invoice{dangerous_label}_{document_id}_{clean_invoice_number}.json"
-        json_path = self.json_dir / json_filename
-        with open(json_path, "w") as f:
-            json.dump(metadata, f, indent=2)
+        # Save PDF and metadata JSON atomically
+        start = time.perf_counter()
+        pdf_path = self.pdf_dir / rendered["pdf_filename"]
+        pdf_bytes = rendered["pdf_bytes"]
+        cache_status, pdf_digest = self.write_pdf(rendered, pdf_path)
+        
+        json_path = self.json_dir / rendered["json_filename"]
+        json_bytes = json.dumps(rendered["metadata"], indent=2).encode("utf-8")
+        json_digest = atomic_write(json_path, json_bytes)
+        rendered["timings"]["write"] = time.perf_counter() - start
         
         return {
             "pdf_path": str(pdf_path),
             "json_path": str(json_path),
-            "metadata": metadata,
-            "invoice_data": invoice_data
+            "metadata": rendered["metadata"],
+            "invoice": rendered["invoice"],
+            "page_count": rendered["page_count"],
+            "injections": rendered["injections"],
+            "profile": rendered["profile"],
+            "render_cache": cache_status,
+            # (path, SHA-256, size) of the files written, for the checksum manifest
+            "checksums": [(str(pdf_path), pdf_digest, len(pdf_bytes)), (str(json_path), json_digest, len(json_bytes))],
+            "timings": rendered["timings"]
+        }
+    
+    def sample_invoice_params(
+        self,
+        multi_page_ratio: float = 0.3,
+        rotation_ratio: float = 0.2,
+        offset_ratio: float = 0.2,
+        workload=None
+    ) -> Dict[str, Any]:
+        """
+        Sample the generation parameters (IDs, pages, transforms, data seed) for one invoice.
+        When a compiled workload (see workload_profiles.py) is given it replaces the ratios.
+        """
+        entity_id = random.randint(1, 100000)
+        document_id = random.randint(1, 100000)
+        
+        if workload is not None:
+            params = workload.sample()
+            params["entity_id"] = entity_id
+            params["document_id"] = document_id
+            params["seed"] = random.getrandbits(64)
+            return params
+        
+        # Determine characteristics
+        num_pages = random.randint(2, 4) if random.random() < multi_page_ratio else 1
+        
+        rotation = 0
+        if random.random() < rotation_ratio:
+            rotation = random.choice(ROTATION_ANGLES)
+        
+        offset_x = 0
+        offset_y = 0
+        if random.random() < offset_ratio:
+            offset_x = random.uniform(-20, 20)
+            offset_y = random.uniform(-20, 20)
+        
+        return {
+            "entity_id": entity_id,
+            "document_id": document_id,
+            "num_pages": num_pages,
+            "rotation": rotation,
+            "offset_x": offset_x,
+            "offset_y": offset_y,
+            # Seed for the invoice content, so any process can render it identically
+            "seed": random.getrandbits(64)
+        }
+    
+    def run_path(self, name: str) -> Path:
+        """<output>/<name>, with the run ID (if any) added to the file name's stem"""
+        path = self.output_dir / name
+        return path.with_name(f"{path.stem}_{self.run_id}{path.suffix}") if self.run_id else path
+    
+    def config(self) -> Dict[str, Any]:
+        """Constructor arguments that recreate an equivalent generator (e.g. in a worker process)"""
+        return {
+            "output_dir": str(self.output_dir),
+            "inject_dangerous_html": self.inject_dangerous_html,
+            "pdf_backend": self.pdf_backend.name,
+            "fast_path": self.fast_path,
+            "render_cache": str(self.render_cache.directory) if self.render_cache else None,
+            "render_cache_mb": self.render_cache.max_bytes / 2**20 if self.render_cache else 2048,
+            "images": self.image_assets is not None,
+            "image_dir": str(self.image_assets.directory) if self.image_assets and self.image_assets.directory else None,
+            "run_id": self.run_id,
         }
     
     def generate_batch(
@@ -923,82 +1200,755 @@ class InvoiceGenerator:
         count: int,
         multi_page_ratio: float = 0.3,
         rotation_ratio: float = 0.2,
-        offset_ratio: float = 0.2
+        offset_ratio: float = 0.2,
+        seed: Optional[int] = None,
+        workload=None,
+        index=None,
+        workers: int = 0,
+        chunk_size: int = 8,
+        max_invoices_per_worker: Optional[int] = None,
+        max_rss_mb: Optional[float] = None,
+        tracemalloc_interval: Optional[int] = None,
+        keep_results: bool = True,
+        bundle_size: Optional[int] = None,
+        pipeline: Optional[Dict[str, Any]] = None,
+        queue_size: int = 16,
+        report_interval: float = 10.0,
+        start: int = 0,
+        summary_path: Optional[str] = None,
+        pack_segment_mb: Optional[float] = None,
+        metadata_format: str = "json",
+        compress_level: Optional[int] = None,
+        compress_threads: int = 2,
+        ndjson_shard_size: int = 10000,
+        manifest: bool = False,
+        trace_slowest: Optional[int] = None,
+        trace_path: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Generate a batch of invoices"""
+        """
+        Generate a batch of invoices.
+        
+        index is an optional CorpusIndex (see corpus_index.py) updated as invoices are written.
+        With workers > 0 invoices are rendered by a pool of worker processes that are
+        recycled after max_invoices_per_worker invoices or when their RSS exceeds
+        max_rss_mb (see memory_governor.py). tracemalloc_interval reports the top
+        allocation growth every N invoices. For very long runs pass keep_results=False
+        so results aren't accumulated in memory; the summary is streamed to disk either way.
+        With bundle_size set, invoices are streamed into multi-invoice "batch scan" PDFs of
+        that many invoices each with a page-range index (see bundle_writer.py) instead of
+        being written as individual files. With pack_segment_mb set, invoices are appended
+        to pack segments of that size with an mmap-able index (see pack_files.py).
+        metadata_format other than "json" writes the metadata compressed on
+        compress_threads threads: json.gz files or NDJSON shards of ndjson_shard_size
+        invoices (see compressed_output.py).
+        With manifest set, the SHA-256 and size of every file written are recorded as the
+        bytes are written, in <output>/manifest.sha256 (see checksum_manifest.py).
+        With trace_slowest set, per-invoice latency is traced and the parameters of the
+        trace_slowest slowest invoices written to trace_path (default
+        <output>/slow_invoices.json) for the replay command (see tail_tracer.py).
+        pipeline runs generation as a staged pipeline instead (see invoice_pipeline.py);
+        it maps stage names to (workers, "thread" | "process").
+        start offsets the invoice indices, so a seeded batch can be generated in ranges
+        (see work_queue.py); summary_path replaces <output>/generation_summary.json.
+        With a run ID the summary is a fragment, <output>/summaries/<run ID>.json, that
+        merge-summaries combines with those of other runs sharing the output directory.
+        """
+        if sum(map(bool, (bundle_size, pack_segment_mb, metadata_format != "json"))) > 1:
+            raise ValueError("Choose one of bundles, a pack or compressed metadata as output")
+        render_only = bool(bundle_size or pack_segment_mb or metadata_format != "json")
+        if pipeline is not None and (workers or render_only):
+            raise ValueError("The staged pipeline can't be combined with workers, bundles, packs or compressed metadata")
+        
         results = []
         
         print(f"Generating {count} invoices...")
-        print(f"  - Multi-page ratio: {multi_page_ratio*100:.0f}%")
-        print(f"  - Rotation ratio: {rotation_ratio*100:.0f}%")
-        print(f"  - Offset ratio: {offset_ratio*100:.0f}%")
+        if workload is not None:
+            print(f"  - Workload profiles: {workload.describe()}")
+        else:
+            print(f"  - Multi-page ratio: {multi_page_ratio*100:.0f}%")
+            print(f"  - Rotation ratio: {rotation_ratio*100:.0f}%")
+            print(f"  - Offset ratio: {offset_ratio*100:.0f}%")
+        if seed is not None:
+            print(f"  - Seed: {seed}")
+        if start:
+            print(f"  - Invoice indices: {start}-{start + count - 1}")
+        if workers:
+            print(f"  - Workers: {workers} (chunk size {chunk_size})")
+        if bundle_size:
+            print(f"  - Bundles of {bundle_size} invoices")
+        if pack_segment_mb:
+            print(f"  - Pack output, {pack_segment_mb:g} MiB segments")
+        if metadata_format != "json":
+            print(f"  - Metadata as {metadata_format} ({compress_threads} compression threads)")
         print()
         
-        for i in range(count):
-            entity_id = random.randint(1, 100000)
-            document_id = random.randint(1, 100000)
-            
-            # Determine characteristics
-            num_pages = random.randint(2, 4) if random.random() < multi_page_ratio else 1
-            
-            rotation = 0
-            if random.random() < rotation_ratio:
-                rotation = random.choice([-5, -4, -3, -2, -1, 1, 2, 3, 4, 5])
-            
-            offset_x = 0
-            offset_y = 0
-            if random.random() < offset_ratio:
-                offset_x = random.uniform(-20, 20)
-                offset_y = random.uniform(-20, 20)
-            
-            result = self.generate_invoice(
-                entity_id=entity_id,
-                document_id=document_id,
-                num_pages=num_pages,
-                rotation=rotation,
-                offset_x=offset_x,
-                offset_y=offset_y
+        def batch_params():
+            for i in range(start, start + count):
+                # Seeded batches derive each invoice from (seed, index) so any
+                # single invoice can be reproduced without replaying the batch
+                if seed is not None:
+                    random.seed(invoice_seed(seed, i))
+                yield self.sample_invoice_params(multi_page_ratio, rotation_ratio, offset_ratio, workload)
+        
+        if pipeline is not None:
+            from invoice_pipeline import InvoicePipeline
+            outcomes = InvoicePipeline(self, pipeline, queue_size, report_interval).run(batch_params())
+        elif workers:
+            from memory_governor import RecyclingWorkerPool
+            pool = RecyclingWorkerPool(
+                self.config(),
+                workers=workers,
+                chunk_size=chunk_size,
+                max_invoices_per_worker=max_invoices_per_worker,
+                max_rss_mb=max_rss_mb,
+                tracemalloc_interval=tracemalloc_interval,
+                render_only=render_only
             )
+            outcomes = pool.run(batch_params())
+        else:
+            outcomes = self._generate_in_process(batch_params(), tracemalloc_interval,
+                                                 render_only=render_only)
+        
+        tracer = None
+        if trace_slowest:
+            from tail_tracer import REPLAY_NAME, TailTracer
+            tracer = TailTracer(trace_slowest)
+            trace_path = Path(trace_path) if trace_path else self.run_path(REPLAY_NAME)
+        
+        checksums = None
+        if manifest:
+            from checksum_manifest import Manifest
+            checksums = Manifest(self.output_dir, self.run_id)
+        
+        # Sinks take rendered invoices in place of loose files; runs sharing a directory get their own
+        sink = None
+        if bundle_size:
+            from bundle_writer import BundleSink
+            sink = BundleSink(self.output_dir, bundle_size,
+                              prefix=f"bundle_{self.run_id}" if self.run_id else "bundle", manifest=checksums)
+        elif pack_segment_mb:
+            from pack_files import PackSink
+            sink = PackSink(self.output_dir, int(pack_segment_mb * 2**20),
+                            name=f"pack_{self.run_id}" if self.run_id else "pack", manifest=checksums)
+        elif metadata_format != "json":
+            from compressed_output import MetadataSink
+            sink = MetadataSink(self, self.pdf_dir, self.json_dir, metadata_format, compress_level,
+                                compress_threads, ndjson_shard_size,
+                                shard_prefix=f"metadata_{self.run_id}" if self.run_id else "metadata",
+                                manifest=checksums)
+        
+        cache_counts = {"hit": 0, "linked": 0, "miss": 0}
+        
+        # Summary entries are spooled to a temp file so memory stays flat on huge batches
+        with tempfile.TemporaryFile("w+", dir=self.output_dir) as spool:
+            for done, (params, result) in enumerate(outcomes, 1):
+                if tracer is not None:
+                    tracer.record(params, result)
+                if sink is not None:
+                    result = sink.write(result)
+                elif checksums is not None:
+                    checksums.add_all(result["checksums"])
+                # Counted after the sink, which links cache hits to loose PDFs
+                if result.get("render_cache"):
+                    cache_counts[result["render_cache"]] += 1
+                if keep_results:
+                    results.append(result)
+                if index is not None:
+                    index.add(params, result["pdf_path"], result["json_path"], result["invoice"],
+                              result["page_count"], result["injections"])
+                entry = {
+                    "invoice_number": result["invoice"].invoice_number,
+                    "document_id": result["metadata"]["documentID"],
+                    "pdf_file": Path(result["pdf_path"]).name,
+                    "json_file": Path(result["json_path"]).name
+                }
+                if checksums is not None and "checksums" in result:
+                    (_, entry["pdf_sha256"], entry["pdf_size"]), (_, entry["json_sha256"], entry["json_size"]) = \
+                        result["checksums"]
+                spool.write(json.dumps(entry) + "\n")
+                
+                print(f"[{done}/{count}] Generated invoice {result['invoice'].invoice_number} "
+                      f"(pages: {params['num_pages']}, rotation: {params['rotation']}°, "
+                      f"offset: {params['offset_x']:.1f},{params['offset_y']:.1f})")
             
-            results.append(result)
+            if sink is not None:
+                sink.close()
+            if checksums is not None:
+                checksums.close()
             
-            print(f"[{i+1}/{count}] Generated invoice {result['invoice_data']['invoiceNumber']} "
-                  f"(pages: {num_pages}, rotation: {rotation}°, offset: {offset_x:.1f},{offset_y:.1f})")
-        
-        # Create summary
-        summary = {
-            "total_generated": count,
-            "output_directory": str(self.output_dir.absolute()),
-            "pdf_directory": str(self.pdf_dir.absolute()),
-            "json_directory": str(self.json_dir.absolute()),
-            "generated_at": datetime.now().isoformat(),
-            "invoices": [
-                {
-                    "invoice_number": r["invoice_data"]["invoiceNumber"],
-                    "document_id": r["metadata"]["documentID"],
-                    "pdf_file": Path(r["pdf_path"]).name,
-                    "json_file": Path(r["json_path"]).name
+            # Create summary
+            summary = {
+                "total_generated": count,
+                "output_directory": str(self.output_dir.absolute()),
+                "pdf_directory": str(self.pdf_dir.absolute()),
+                "json_directory": str(self.json_dir.absolute()),
+                "generated_at": datetime.now().isoformat(),
+            }
+            if self.run_id:
+                summary["run_id"] = self.run_id
+            if sink is not None:
+                summary.update(sink.summary())
+            if checksums is not None:
+                summary.update(checksums.summary())
+            if tracer is not None:
+                tracer.write(trace_path, self.config())
+                summary["latency"] = tracer.latency()
+                summary["tail_trace"] = str(trace_path)
+            if self.render_cache is not None:
+                hits = cache_counts["hit"] + cache_counts["linked"]
+                summary["render_cache"] = {
+                    **self.render_cache.stats(),
+                    "hits": hits,
+                    "linked": cache_counts["linked"],
+                    "misses": cache_counts["miss"],
+                    "hit_rate": hits / count if count else 0.0,
                 }
-                for r in results
-            ]
-        }
-        
-        summary_path = self.output_dir / "generation_summary.json"
-        with open(summary_path, "w") as f:
-            json.dump(summary, f, indent=2)
+            
+            spool.seek(0)
+            if summary_path:
+                summary_path = Path(summary_path)
+            elif self.run_id:
+                summary_path = self.output_dir / "summaries" / f"{self.run_id}.json"
+                summary_path.parent.mkdir(exist_ok=True)
+            else:
+                summary_path = self.output_dir / "generation_summary.json"
+            with atomic_file(summary_path, "w") as f:
+                write_summary(f, summary, (json.loads(line) for line in spool))
         
         print()
         print(f"✓ Generation complete!")
-        print(f"  - PDFs: {self.pdf_dir}")
-        print(f"  - JSON: {self.json_dir}")
+        if sink is not None:
+            print(f"  - {sink.describe()}")
+        else:
+            print(f"  - PDFs: {self.pdf_dir}")
+            print(f"  - JSON: {self.json_dir}")
         print(f"  - Summary: {summary_path}")
+        if tracer is not None:
+            print(f"  - Latency: {tracer.describe()}")
+            print(f"  - Slowest {len(tracer.slowest)} invoices: {trace_path} (profile with 'replay')")
+        if checksums is not None:
+            print(f"  - Manifest: {checksums.path} ({checksums.entries} files, {checksums.bytes / 2**20:.1f} MiB)")
+        if self.render_cache is not None:
+            cache_summary = summary["render_cache"]
+            print(f"  - Render cache: {cache_summary['hits']} hits ({cache_summary['linked']} linked), "
+                  f"{cache_summary['misses']} misses, {cache_summary['size_bytes'] / 2**20:.1f} MiB "
+                  f"in {self.render_cache.directory}")
+        if index is not None:
+            index.flush()
+            print(f"  - Index: {index.path}")
         
         return results
+    
+    def _generate_in_process(self, params_iter, tracemalloc_interval: Optional[int] = None,
+                             render_only: bool = False):
+        """Generate invoices in this process, yielding (params, result) pairs"""
+        produce = self.render_invoice if render_only else self.generate_invoice
+        reporter = None
+        if tracemalloc_interval:
+            from memory_governor import TracemallocReporter
+            reporter = TracemallocReporter(tracemalloc_interval)
+        try:
+            for params in params_iter:
+                yield params, produce(**params)
+                if reporter is not None:
+                    reporter.tick()
+        finally:
+            if reporter is not None:
+                reporter.stop()
 
 
-def main():
+def write_summary(f, summary: Dict[str, Any], invoices) -> None:
+    """
+    Stream a generation summary as JSON: the summary fields followed by an
+    "invoices" list written entry by entry. Output matches json.dump(indent=2).
+    """
+    text = json.dumps(summary, indent=2)
+    f.write(text[:-2] + ",\n" if summary else "{\n")
+    f.write('  "invoices": [')
+    first = True
+    for entry in invoices:
+        f.write("\n" if first else ",\n")
+        f.write("\n".join("    " + line for line in json.dumps(entry, indent=2).split("\n")))
+        first = False
+    f.write("]\n}" if first else "\n  ]\n}")
+
+
+def merge_summaries(fragments: List[Path], target: Path) -> Dict[str, Any]:
+    """
+    Combine summary fragments (runs sharing an output directory, work queue chunks)
+    into one summary at target; returns its header fields. Fragments are loaded one
+    at a time and their invoice lists spooled to disk, so memory is bounded by the
+    largest fragment rather than the corpus.
+    """
+    target = Path(target)
+    summary: Dict[str, Any] = {"total_generated": 0}
+    cache_counts = {"hits": 0, "linked": 0, "misses": 0}
+    runs = []
+    with tempfile.TemporaryFile("w+", dir=target.parent) as spool:
+        for path in fragments:
+            with open(path) as f:
+                fragment = json.load(f)
+            invoices = fragment.pop("invoices", [])
+            for entry in invoices:
+                spool.write(json.dumps(entry) + "\n")
+            summary["total_generated"] += fragment.get("total_generated", len(invoices))
+            for key in ("output_directory", "pdf_directory", "json_directory"):
+                summary.setdefault(key, fragment.get(key))
+            summary["generated_at"] = max(summary.get("generated_at", ""), fragment.get("generated_at", ""))
+            if "render_cache" in fragment:
+                for key in cache_counts:
+                    cache_counts[key] += fragment["render_cache"][key]
+            if "bundles" in fragment:
+                summary.setdefault("bundles", []).extend(fragment["bundles"])
+            if "metadata_shards" in fragment:
+                summary.setdefault("metadata_shards", []).extend(fragment["metadata_shards"])
+            if "metadata_compression" in fragment:
+                merged = summary.setdefault("metadata_compression", {"raw_bytes": 0, "compressed_bytes": 0})
+                merged["raw_bytes"] += fragment["metadata_compression"]["raw_bytes"]
+                merged["compressed_bytes"] += fragment["metadata_compression"]["compressed_bytes"]
+                merged["ratio"] = merged["raw_bytes"] / merged["compressed_bytes"] if merged["compressed_bytes"] else 0.0
+            if "pack_directory" in fragment:
+                summary.setdefault("pack_directories", []).append(fragment["pack_directory"])
+                summary["pack_documents"] = summary.get("pack_documents", 0) + fragment["pack_documents"]
+            if "manifest" in fragment:
+                summary.setdefault("manifests", []).append(fragment["manifest"])
+            if "tail_trace" in fragment:
+                summary.setdefault("tail_traces", []).append(fragment["tail_trace"])
+            runs.append(fragment.get("run_id") or Path(path).stem)
+            del fragment, invoices
+        
+        summary["merged_at"] = datetime.now().isoformat()
+        summary["runs"] = runs
+        if any(cache_counts.values()):
+            lookups = cache_counts["hits"] + cache_counts["misses"]
+            summary["render_cache"] = {**cache_counts, "hit_rate": cache_counts["hits"] / lookups if lookups else 0.0}
+        
+        spool.seek(0)
+        with atomic_file(target, "w") as f:
+            write_summary(f, summary, (json.loads(line) for line in spool))
+    return summary
+
+
+def merge_index_command(argv: List[str]):
+    """merge-index: merge SQLite corpus indexes from parallel or sharded runs"""
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py merge-index",
+        description="Merge SQLite corpus indexes from parallel or sharded runs into one"
+    )
+    parser.add_argument("target", help="Index to merge into (created if missing)")
+    parser.add_argument("sources", nargs="+", help="Shard indexes to merge")
+    args = parser.parse_args(argv)
+    
+    from corpus_index import merge_indexes
+    print(f"Merging {len(args.sources)} indexes into {args.target}...")
+    total = merge_indexes(args.target, args.sources)
+    print(f"✓ Index now holds {total} documents")
+
+
+def merge_summaries_command(argv: List[str]):
+    """merge-summaries: combine the summary fragments of runs sharing an output directory"""
     parser = argparse.ArgumentParser(
-        description="Generate randomized financial invoice PDFs with metadata"
+        prog="generate_invoices.py merge-summaries",
+        description="Combine summary fragments (<output>/summaries/*.json, written by --run-id runs "
+                    "and work queue chunks) into one generation summary"
+    )
+    parser.add_argument("output", nargs="?", default="generated_invoices",
+                        help="Generator output directory (default: generated_invoices)")
+    parser.add_argument("fragments", nargs="*",
+                        help="Fragments to merge (default: every <output>/summaries/*.json)")
+    parser.add_argument("--target", type=str, default=None,
+                        help="Merged summary path (default: <output>/generation_summary.json)")
+    args = parser.parse_args(argv)
+    
+    output_dir = Path(args.output)
+    fragments = [Path(p) for p in args.fragments] or sorted((output_dir / "summaries").glob("*.json"))
+    if not fragments:
+        parser.error(f"no summary fragments in {output_dir / 'summaries'}")
+    target = Path(args.target) if args.target else output_dir / "generation_summary.json"
+    
+    print(f"Merging {len(fragments)} summary fragments into {target}...")
+    summary = merge_summaries(fragments, target)
+    print(f"✓ Summary now lists {summary['total_generated']} invoices from {len(summary['runs'])} runs")
+
+
+def verify_command(argv: List[str]):
+    """verify: check generated PDFs against their JSON ground truth"""
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py verify",
+        description="Extract text from generated PDFs and check it against the JSON metadata"
+    )
+    parser.add_argument("output", nargs="?", default="generated_invoices",
+                        help="Generator output directory (default: generated_invoices)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Verification processes (default: CPU count)")
+    parser.add_argument("--sample", type=float, default=1.0,
+                        help="Fraction of documents to verify, e.g. 0.01 for 1%% (default: 1.0)")
+    parser.add_argument("--report", type=str, default=None,
+                        help="Write the full verification report as JSON to this path")
+    args = parser.parse_args(argv)
+    
+    from verify_invoices import verify_corpus
+    print(f"Verifying {args.sample*100:g}% of invoices in {args.output}...")
+    report = verify_corpus(args.output, workers=args.workers, sample=args.sample)
+    
+    for failure in report["failures"][:20]:
+        name = Path(failure["pdf_path"]).name
+        if "error" in failure:
+            print(f"  ✗ {name}: {failure['error']}")
+        for mismatch in failure["mismatches"]:
+            if "actual" in mismatch:
+                print(f"  ✗ {name}: {mismatch['field']} {mismatch['actual']!r} doesn't resolve to the PDF")
+            else:
+                print(f"  ✗ {name}: {mismatch['field']} {mismatch['expected']!r} not found in PDF text")
+    
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    
+    print()
+    print(f"{'✓' if not report['documents_failed'] else '✗'} Verified {report['documents_checked']} invoices "
+          f"({report['pages_checked']} pages) in {report['elapsed_seconds']:.1f}s")
+    print(f"  - Throughput: {report['documents_per_second']:.1f} docs/s, {report['pages_per_second']:.1f} pages/s")
+    print(f"  - Failed: {report['documents_failed']}")
+    for field, failures in sorted(report["failures_by_field"].items()):
+        print(f"      {field}: {failures}")
+    if args.report:
+        print(f"  - Report: {args.report}")
+    
+    if not report["documents_checked"]:
+        # Nothing verified is not a pass (wrong directory, or a sample too small for the corpus)
+        print(f"✗ No invoices found in {args.output}" + (" (try a larger --sample)" if args.sample < 1.0 else ""))
+        sys.exit(1)
+    if report["documents_failed"]:
+        sys.exit(1)
+
+
+def verify_manifest_command(argv: List[str]):
+    """verify-manifest: re-hash output files against their checksum manifests"""
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py verify-manifest",
+        description="Check every file listed in the output directory's checksum manifests (see --manifest)"
+    )
+    parser.add_argument("output", nargs="?", default="generated_invoices",
+                        help="Generator output directory (default: generated_invoices)")
+    parser.add_argument("--manifest", dest="manifests", action="append", default=None, metavar="PATH",
+                        help="Manifest to check (repeatable; default: manifest.sha256 and manifests/*.sha256)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Hashing threads (default: twice the CPU count, at most 32)")
+    parser.add_argument("--report", type=str, default=None,
+                        help="Write the full verification report as JSON to this path")
+    args = parser.parse_args(argv)
+    
+    from checksum_manifest import find_manifests, verify_manifest
+    manifests = [Path(m) for m in args.manifests] if args.manifests else find_manifests(Path(args.output))
+    if not manifests:
+        parser.error(f"No checksum manifests in {args.output} (generate with --manifest)")
+    print(f"Verifying {len(manifests)} manifests in {args.output}...")
+    report = verify_manifest(args.output, manifests, workers=args.workers)
+    
+    for path in report["missing"][:20]:
+        print(f"  ✗ {path}: missing")
+    for path in report["mismatched"][:20]:
+        print(f"  ✗ {path}: checksum mismatch")
+    
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    
+    failed = len(report["missing"]) + len(report["mismatched"])
+    print()
+    print(f"{'✓' if not failed else '✗'} Verified {report['files_checked']} files "
+          f"({report['bytes_checked'] / 2**20:.1f} MiB) in {report['elapsed_seconds']:.1f}s")
+    print(f"  - Throughput: {report['mb_per_second']:.0f} MiB/s")
+    print(f"  - Missing: {len(report['missing'])}, mismatched: {len(report['mismatched'])}")
+    if args.report:
+        print(f"  - Report: {args.report}")
+    
+    if failed:
+        sys.exit(1)
+
+
+def replay_command(argv: List[str]):
+    """replay: regenerate the slowest invoices of a traced run under cProfile"""
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py replay",
+        description="Regenerate the invoices recorded by --trace-slowest under cProfile"
+    )
+    parser.add_argument("trace", nargs="?", default="generated_invoices/slow_invoices.json",
+                        help="Replay file (default: generated_invoices/slow_invoices.json)")
+    parser.add_argument("-o", "--output", type=str, default="replayed_invoices",
+                        help="Directory for the regenerated invoices (default: replayed_invoices)")
+    parser.add_argument("--top", type=int, default=None,
+                        help="Replay only the N slowest invoices (default: all in the file)")
+    parser.add_argument("--sort", type=str, default="cumulative",
+                        help="pstats sort key (default: cumulative; e.g. tottime, ncalls)")
+    parser.add_argument("--lines", type=int, default=25,
+                        help="Profile lines to print (default: 25)")
+    parser.add_argument("--per-invoice", action="store_true",
+                        help="Also print a short profile of each invoice")
+    parser.add_argument("--profile-output", type=str, default=None,
+                        help="Save the combined profile (pstats format, e.g. for snakeviz)")
+    args = parser.parse_args(argv)
+    
+    from tail_tracer import replay
+    print(f"Replaying {args.trace}...")
+    report = replay(args.trace, args.output, top=args.top, sort=args.sort, lines=args.lines,
+                    per_invoice=args.per_invoice, profile_output=args.profile_output)
+    
+    differing = [r for r in report["invoices"] if not r["reproduced"]]
+    print(f"{'✓' if not differing else '✗'} Replayed {len(report['invoices'])} invoices into {args.output}")
+    if args.profile_output:
+        print(f"  - Profile: {args.profile_output}")
+    if differing:
+        print(f"  - {len(differing)} invoices differ from the recorded ones (different code or generator settings?)")
+        sys.exit(1)
+
+
+def calibrate_command(argv: List[str]):
+    """calibrate: measure this host, pick generation settings and predict run cost"""
+    from calibration import SINKS, calibrate, save_calibration
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py calibrate",
+        description="Run seeded sample batches at several concurrency levels and output sinks, save the "
+                    "fastest settings and predict wall time and output size for a corpus; give the "
+                    "generator options (--fast-path, --images, ...) the corpus will be generated with"
+    )
+    parser.add_argument("-n", "--count", type=int, default=10_000_000,
+                        help="Corpus size to predict for (default: 10000000)")
+    parser.add_argument("-o", "--output", type=str, default="generated_invoices",
+                        help="Scratch directory for trial runs, ideally on the target disk (default: generated_invoices)")
+    parser.add_argument("--sample", type=int, default=200,
+                        help="Invoices generated per trial (default: 200)")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed for the trial batches (default: 1)")
+    parser.add_argument("--workload", type=str, default=None,
+                        help="Workload profile file describing the document mix to predict for")
+    parser.add_argument("--profile", action="append", default=None, metavar="NAME[=WEIGHT]",
+                        help="Profile from --workload to include (repeatable)")
+    parser.add_argument("--max-workers", type=int, default=None,
+                        help="Upper bound on worker processes to try (default: usable CPUs)")
+    parser.add_argument("--sink", action="append", default=None, choices=list(SINKS),
+                        help="Output sink to try (repeatable; default: all; 'files' is loose PDF/JSON files)")
+    parser.add_argument("--save", type=str, default="invoice_calibration.json",
+                        help="Calibration file to write (default: invoice_calibration.json)")
+    # Generator settings of the runs being calibrated, used by every trial
+    parser.add_argument("--dangerous-html", action="store_true", help="Enable dangerous payload injection")
+    parser.add_argument("--pdf-backend", type=str, default=DEFAULT_BACKEND, choices=list(BACKENDS))
+    parser.add_argument("--fast-path", action="store_true", help="Render single-page invoices from templates")
+    parser.add_argument("--render-cache", action="store_true",
+                        help="Trials use a render cache (each starts empty, as a first run does)")
+    parser.add_argument("--render-cache-mb", type=float, default=2048, help="Render cache size bound (default: 2048)")
+    parser.add_argument("--images", action="store_true", help="Add logos, stamps and signatures")
+    parser.add_argument("--image-dir", type=str, default=None, help="Image assets directory")
+    args = parser.parse_args(argv)
+    
+    workload = None
+    if args.workload:
+        from workload_profiles import load_workload
+        workload = load_workload(args.workload, args.profile)
+    elif args.profile:
+        parser.error("--profile requires --workload")
+    
+    calibration = calibrate(
+        args.output,
+        sample=args.sample,
+        count=args.count,
+        seed=args.seed,
+        workload=workload,
+        workload_description=workload.describe() if workload is not None else None,
+        max_workers=args.max_workers,
+        generator_config={
+            "inject_dangerous_html": args.dangerous_html,
+            "pdf_backend": args.pdf_backend,
+            "fast_path": args.fast_path,
+            "render_cache": "render_cache" if args.render_cache else None,
+            "render_cache_mb": args.render_cache_mb,
+            "images": args.images or bool(args.image_dir),
+            "image_dir": str(Path(args.image_dir).absolute()) if args.image_dir else None,
+        },
+        sinks=args.sink
+    )
+    save_calibration(args.save, calibration)
+    
+    prediction = calibration["prediction"]
+    hours = prediction["wall_seconds"] / 3600
+    print()
+    print(f"✓ Calibration complete!")
+    print(f"  - Best settings: {calibration['settings']}")
+    print(f"  - Throughput: {prediction['invoices_per_second']:.1f} invoices/s")
+    print(f"  - Predicted for {prediction['count']} invoices: {hours:.1f} hours, "
+          f"{prediction['output_bytes'] / 2**30:.1f} GiB, {prediction['pages']} pages")
+    print(f"  - Saved: {args.save} (use with --calibration)")
+
+
+def queue_publish_command(argv: List[str]):
+    """queue-publish: publish a generation job to a shared work queue"""
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py queue-publish",
+        description="Publish a job to an SQLite work queue on a shared volume; "
+                    "start any number of 'queue-work' processes to generate it"
+    )
+    parser.add_argument("queue", help="Work queue database (created if missing)")
+    parser.add_argument("--job", type=str, default=None, help="Job name (default: timestamp)")
+    parser.add_argument("-n", "--count", type=int, default=10, help="Number of invoices (default: 10)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Invoices per leased chunk (default: 500)")
+    parser.add_argument("-o", "--output", type=str, default="generated_invoices",
+                        help="Output directory, as seen by the workers (default: generated_invoices)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed (default: random; jobs are always seeded)")
+    parser.add_argument("--multi-page-ratio", type=float, default=0.3)
+    parser.add_argument("--rotation-ratio", type=float, default=0.2)
+    parser.add_argument("--offset-ratio", type=float, default=0.2)
+    parser.add_argument("--dangerous-html", action="store_true", help="Enable dangerous payload injection")
+    parser.add_argument("--pdf-backend", type=str, default=DEFAULT_BACKEND, choices=list(BACKENDS))
+    parser.add_argument("--fast-path", action="store_true", help="Render single-page invoices from templates")
+    parser.add_argument("--render-cache", type=str, default=None, metavar="DIR",
+                        help="Render cache directory shared by the workers")
+    parser.add_argument("--render-cache-mb", type=float, default=2048, help="Render cache size bound (default: 2048)")
+    parser.add_argument("--images", action="store_true", help="Add logos, stamps and signatures")
+    parser.add_argument("--image-dir", type=str, default=None, help="Image assets directory (path as seen by the workers)")
+    parser.add_argument("--workload", type=str, default=None, help="Workload profile file (path as seen by the workers)")
+    parser.add_argument("--profile", action="append", default=None, metavar="NAME[=WEIGHT]")
+    args = parser.parse_args(argv)
+    
+    if args.workload:
+        # Fail here rather than in every worker
+        from workload_profiles import load_workload
+        load_workload(args.workload, args.profile)
+    elif args.profile:
+        parser.error("--profile requires --workload")
+    
+    from work_queue import WorkQueue
+    job_id = args.job or datetime.now().strftime("job-%Y%m%d-%H%M%S")
+    seed = args.seed if args.seed is not None else random.getrandbits(32)
+    settings = {
+        "generator": {
+            "output_dir": str(Path(args.output).absolute()),
+            "inject_dangerous_html": args.dangerous_html,
+            "pdf_backend": args.pdf_backend,
+            "fast_path": args.fast_path,
+            "render_cache": str(Path(args.render_cache).absolute()) if args.render_cache else None,
+            "render_cache_mb": args.render_cache_mb,
+            "images": args.images or bool(args.image_dir),
+            "image_dir": str(Path(args.image_dir).absolute()) if args.image_dir else None,
+        },
+        "seed": seed,
+        "multi_page_ratio": args.multi_page_ratio,
+        "rotation_ratio": args.rotation_ratio,
+        "offset_ratio": args.offset_ratio,
+        "workload": str(Path(args.workload).absolute()) if args.workload else None,
+        "profiles": args.profile,
+    }
+    work_queue = WorkQueue(args.queue)
+    try:
+        work_queue.publish(job_id, args.count, args.chunk_size, settings)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        work_queue.close()
+    print(f"✓ Published job {job_id}: {args.count} invoices in chunks of {args.chunk_size} (seed {seed})")
+    print(f"  - Workers: python generate_invoices.py queue-work {args.queue}")
+    print(f"  - Status:  python generate_invoices.py queue-status {args.queue}")
+
+
+def queue_work_command(argv: List[str]):
+    """queue-work: lease and generate chunks of a queued job until it's done"""
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py queue-work",
+        description="Lease chunks from a work queue and generate them until the job is complete"
+    )
+    parser.add_argument("queue", help="Work queue database")
+    parser.add_argument("--job", type=str, default=None, help="Job to work on (default: the most recent)")
+    parser.add_argument("--worker-id", type=str, default=None, help="Name in status output (default: host:pid)")
+    parser.add_argument("--lease-seconds", type=float, default=120.0,
+                        help="Lease length; a chunk is re-leased this long after its worker stops renewing (default: 120)")
+    parser.add_argument("--index", type=str, default=None, metavar="PATH",
+                        help="Record generated invoices in this worker's own SQLite index (merge with merge-index)")
+    parser.add_argument("--exit-when-idle", action="store_true",
+                        help="Exit when no chunk can be leased instead of waiting for others' leases to expire")
+    args = parser.parse_args(argv)
+    
+    from work_queue import work
+    work(args.queue, job_id=args.job, worker=args.worker_id, lease_seconds=args.lease_seconds,
+         index_path=args.index, exit_when_idle=args.exit_when_idle)
+
+
+def queue_status_command(argv: List[str]):
+    """queue-status: show completion and throughput of a queued job"""
+    parser = argparse.ArgumentParser(
+        prog="generate_invoices.py queue-status",
+        description="Show completion, per-worker progress and throughput of a work queue job"
+    )
+    parser.add_argument("queue", help="Work queue database")
+    parser.add_argument("--job", type=str, default=None, help="Job to show (default: the most recent)")
+    parser.add_argument("--json", action="store_true", help="Print the status as JSON")
+    args = parser.parse_args(argv)
+    
+    from work_queue import WorkQueue
+    work_queue = WorkQueue(args.queue)
+    try:
+        status = work_queue.status(args.job)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        work_queue.close()
+    
+    if args.json:
+        print(json.dumps(status, indent=2))
+        return
+    
+    chunks = status["chunks"]
+    print(f"Job {status['job_id']}: {status['invoices_done']}/{status['count']} invoices "
+          f"({status['percent_complete']:.1f}%){' - complete' if status['complete'] else ''}")
+    print(f"  - Chunks: {chunks['done']} done, {chunks['leased']} leased, {chunks['expired']} expired, "
+          f"{chunks['pending']} pending ({status['chunks_retried']} retried)")
+    print(f"  - Throughput: {status['invoices_per_second']:.1f} invoices/s overall, "
+          f"{status['recent_invoices_per_second']:.1f}/s in the last minute")
+    if status["eta_seconds"]:
+        print(f"  - ETA: {status['eta_seconds'] / 60:.1f} minutes")
+    for worker, stats in sorted(status["workers"].items()):
+        print(f"      {worker}: {stats['invoices_done']} invoices in {stats['chunks_done']} chunks"
+              f"{', working' if stats['leased'] else ''}")
+
+
+# Subcommands, selected by the first argument; anything else is a generation run
+COMMANDS = {
+    "merge-index": merge_index_command,
+    "merge-summaries": merge_summaries_command,
+    "verify": verify_command,
+    "verify-manifest": verify_manifest_command,
+    "replay": replay_command,
+    "calibrate": calibrate_command,
+    "queue-publish": queue_publish_command,
+    "queue-work": queue_work_command,
+    "queue-status": queue_status_command,
+}
+
+
+# Options choosing how generation runs; giving any of them explicitly overrides a calibration
+CALIBRATED_MODES = {"pipeline", "workers", "rate", "bundle_size", "pack", "pack_segment_mb", "metadata_format"}
+
+
+def explicit_options(parser: argparse.ArgumentParser, argv: List[str]) -> set:
+    """Destinations of the options actually given in argv (not left at their defaults)"""
+    defaults = {action: action.default for action in parser._actions}
+    try:
+        for action in parser._actions:
+            action.default = argparse.SUPPRESS
+        return set(vars(parser.parse_args(argv)))
+    finally:
+        for action, default in defaults.items():
+            action.default = default
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+        return
+    
+    parser = argparse.ArgumentParser(
+        description="Generate randomized financial invoice PDFs with metadata",
+        epilog=f"Other commands: {', '.join(COMMANDS)} (run '<command> --help' for details)"
     )
     parser.add_argument(
         "-n", "--count",
@@ -1035,8 +1985,264 @@ def main():
         action="store_true",
         help="Enable dangerous payload injection (HTML, SQL, CSV formulas) for pen testing (files will be labeled with '_dangerous_')"
     )
+    parser.add_argument(
+        "--pdf-backend",
+        type=str,
+        default=DEFAULT_BACKEND,
+        choices=list(BACKENDS),
+        help=f"Library used to flatten and transform PDFs (default: {DEFAULT_BACKEND}); pypdf and pikepdf must be installed"
+    )
+    parser.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="Render single-page invoices from precompiled content-stream templates instead of platypus "
+             "(falls back to platypus for invoices that don't fit the template)"
+    )
+    parser.add_argument(
+        "--render-cache",
+        type=str,
+        nargs="?",
+        const="render_cache",
+        default=None,
+        metavar="DIR",
+        help="Reuse PDFs rendered from identical inputs, cached in DIR (default: render_cache); "
+             "hits are hard-linked into the output"
+    )
+    parser.add_argument(
+        "--render-cache-mb",
+        type=float,
+        default=2048,
+        help="Size bound of the render cache; least recently used entries are evicted (default: 2048)"
+    )
+    parser.add_argument(
+        "--images",
+        action="store_true",
+        help="Add vendor logos, rubber stamps and signatures to the invoices"
+    )
+    parser.add_argument(
+        "--image-dir",
+        type=str,
+        default=None,
+        help="Directory with logos/<company>.png, stamps/<NAME>.png and signatures/*.png "
+             "replacing the generated images (implies --images)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for reproducible output; each invoice is derived from (seed, index)"
+    )
+    parser.add_argument(
+        "--run-id",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="ID",
+        help="Namespace output file names with ID (default: <host>-<pid>-<time>) and write the summary "
+             "to <output>/summaries/ID.json, so several processes can share an output directory "
+             "(combine the summaries with merge-summaries)"
+    )
+    parser.add_argument(
+        "--manifest",
+        action="store_true",
+        help="Record the SHA-256 of every file written in <output>/manifest.sha256 "
+             "(<output>/manifests/ID.sha256 with --run-id); check it with verify-manifest"
+    )
+    parser.add_argument(
+        "--trace-slowest",
+        type=int,
+        default=None,
+        metavar="K",
+        help="Time every invoice, report p50/p99 and write the K slowest invoices' parameters "
+             "to a replay file (profile them with the replay command)"
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=str,
+        default=None,
+        help="Replay file for --trace-slowest (default: <output>/slow_invoices.json)"
+    )
     
-    args = parser.parse_args()
+    parser.add_argument(
+        "--workload",
+        type=str,
+        default=None,
+        help="Workload profile file (JSON) describing the document mix; replaces the ratio options"
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        default=None,
+        metavar="NAME[=WEIGHT]",
+        help="Profile from --workload to include (repeatable; default: all profiles with their own weights)"
+    )
+    
+    parser.add_argument(
+        "--index",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="Maintain an SQLite corpus index while generating (default path: <output>/corpus_index.sqlite)"
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Append invoices to pack segments with an mmap-able index (<output>/pack) instead of loose files"
+    )
+    parser.add_argument(
+        "--pack-segment-mb",
+        type=float,
+        help="Size at which a new pack segment is started, with --pack (default: 1024)"
+    )
+    parser.add_argument(
+        "--calibration",
+        nargs="?",
+        const="invoice_calibration.json",
+        default=None,
+        metavar="PATH",
+        help="Use the worker/pipeline and output sink settings saved by 'calibrate' "
+             "(default path: invoice_calibration.json); "
+             "options given explicitly still win, and choosing --pipeline, --workers, --rate or a bundle, "
+             "pack or compressed-metadata output explicitly ignores the calibration"
+    )
+    parser.add_argument(
+        "--bundle-size",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Write batch-scan bundles of N invoices per PDF with a page-range index instead of one file per invoice"
+    )
+    
+    compression_group = parser.add_argument_group("compressed metadata")
+    compression_group.add_argument(
+        "--metadata-format",
+        type=str,
+        default="json",
+        choices=["json", "json.gz", "ndjson.gz", "ndjson.xz"],
+        help="Metadata output: pretty-printed .json files (default), .json.gz files, "
+             "or rolling NDJSON shards compressed with gzip or xz"
+    )
+    compression_group.add_argument(
+        "--compress-level",
+        type=int,
+        default=None,
+        help="gzip level (1-9, default 6) or xz preset (0-9, default 1)"
+    )
+    compression_group.add_argument(
+        "--compress-threads",
+        type=int,
+        default=2,
+        help="Threads compressing metadata alongside rendering (default: 2)"
+    )
+    compression_group.add_argument(
+        "--ndjson-shard-size",
+        type=int,
+        default=10000,
+        metavar="N",
+        help="Invoices per NDJSON shard (default: 10000)"
+    )
+    
+    memory_group = parser.add_argument_group("parallelism and memory governance")
+    memory_group.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Render on this many worker processes (default: 0, render in this process)"
+    )
+    memory_group.add_argument(
+        "--chunk-size",
+        type=int,
+        default=8,
+        help="Invoices handed to a worker at a time (default: 8)"
+    )
+    memory_group.add_argument(
+        "--recycle-after",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Replace each worker process after it has rendered N invoices"
+    )
+    memory_group.add_argument(
+        "--max-rss-mb",
+        type=float,
+        default=None,
+        help="Replace a worker process once its resident memory exceeds this many MiB"
+    )
+    memory_group.add_argument(
+        "--tracemalloc-every",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Report the top memory allocation growth every N invoices (slows generation)"
+    )
+    
+    pipeline_group = parser.add_argument_group("staged pipeline")
+    pipeline_group.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Generate through the staged pipeline (sample, render, transform, serialize, write)"
+    )
+    pipeline_group.add_argument(
+        "--stage",
+        action="append",
+        default=None,
+        metavar="STAGE=N[:KIND]",
+        help="Workers for a pipeline stage, optionally 'thread' or 'process' (repeatable, e.g. render=6 write=4:thread)"
+    )
+    pipeline_group.add_argument(
+        "--queue-size",
+        type=int,
+        default=16,
+        help="Capacity of the queue in front of each pipeline stage (default: 16)"
+    )
+    
+    emitter_group = parser.add_argument_group("hot-folder emitter mode")
+    emitter_group.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Emit invoices at this steady rate (invoices/sec) instead of as fast as possible"
+    )
+    emitter_group.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Emitter run time in seconds (with --rate; default: emit --count invoices)"
+    )
+    emitter_group.add_argument(
+        "--render-workers",
+        type=int,
+        default=2,
+        help="Processes pre-rendering invoices ahead of the emitter (default: 2)"
+    )
+    emitter_group.add_argument(
+        "--prerender",
+        type=int,
+        default=None,
+        help="Number of invoices rendered ahead of the pacer (default: 2 seconds of output)"
+    )
+    emitter_group.add_argument(
+        "--report-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between emitter rate/lag and pipeline stage reports (default: 10)"
+    )
+    
+    args = parser.parse_args(argv)
+    if args.calibration:
+        from calibration import load_settings
+        explicit = explicit_options(parser, argv)
+        modes = sorted(explicit & CALIBRATED_MODES
+                       - ({"metadata_format"} if args.metadata_format == "json" else set()))
+        if modes:
+            print(f"[Calibration] Ignoring {args.calibration}: "
+                  f"{', '.join('--' + m.replace('_', '-') for m in modes)} given explicitly")
+        else:
+            # Calibrated settings only fill in options that weren't given
+            for name, value in load_settings(args.calibration).items():
+                if name not in explicit:
+                    setattr(args, name, value)
     
     if args.dangerous_html:
         print("⚠️  WARNING: Dangerous payload injection enabled for pen testing!")
@@ -1046,13 +2252,109 @@ def main():
         print("   Files will be labeled with '_dangerous_' prefix")
         print()
     
-    generator = InvoiceGenerator(output_dir=args.output, inject_dangerous_html=args.dangerous_html)
-    generator.generate_batch(
-        count=args.count,
-        multi_page_ratio=args.multi_page_ratio,
-        rotation_ratio=args.rotation_ratio,
-        offset_ratio=args.offset_ratio
-    )
+    workload = None
+    if args.workload:
+        from workload_profiles import load_workload
+        workload = load_workload(args.workload, args.profile)
+    elif args.profile:
+        parser.error("--profile requires --workload")
+    
+    try:
+        generator = InvoiceGenerator(output_dir=args.output, inject_dangerous_html=args.dangerous_html,
+                                     pdf_backend=args.pdf_backend, fast_path=args.fast_path,
+                                     render_cache=args.render_cache, render_cache_mb=args.render_cache_mb,
+                                     images=args.images or bool(args.image_dir), image_dir=args.image_dir,
+                                     run_id=(args.run_id or default_run_id()) if args.run_id is not None else None)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    index = None
+    if args.index is not None:
+        from corpus_index import CorpusIndex
+        index = CorpusIndex(args.index or generator.output_dir / "corpus_index.sqlite")
+    
+    if args.bundle_size is not None and args.rate is not None:
+        parser.error("--bundle-size cannot be combined with --rate")
+    if args.manifest and args.rate is not None:
+        parser.error("--manifest cannot be combined with --rate")
+    if args.trace_slowest is not None and args.rate is not None:
+        parser.error("--trace-slowest cannot be combined with --rate")
+    if args.trace_file and not args.trace_slowest:
+        parser.error("--trace-file requires --trace-slowest")
+    if args.pack_segment_mb is not None and not args.pack:
+        parser.error("--pack-segment-mb requires --pack")
+    if args.pack and (args.rate is not None or args.bundle_size is not None):
+        parser.error("--pack cannot be combined with --rate or --bundle-size")
+    if args.metadata_format != "json" and (args.rate is not None or args.bundle_size is not None or args.pack):
+        parser.error("--metadata-format cannot be combined with --rate, --bundle-size or --pack")
+    
+    pipeline = None
+    if args.stage and not args.pipeline:
+        parser.error("--stage requires --pipeline")
+    if args.pipeline:
+        if (args.rate is not None or args.bundle_size is not None or args.pack or args.workers
+                or args.metadata_format != "json"):
+            parser.error("--pipeline cannot be combined with --rate, --bundle-size, --pack, --workers or --metadata-format")
+        from invoice_pipeline import parse_stage_specs
+        try:
+            pipeline = parse_stage_specs(args.stage)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if args.rate is not None:
+        from hot_folder_emitter import HotFolderEmitter
+        emitter = HotFolderEmitter(
+            generator,
+            rate=args.rate,
+            duration=args.duration,
+            count=None if args.duration is not None else args.count,
+            workers=args.render_workers,
+            prerender=args.prerender,
+            report_interval=args.report_interval
+        )
+        emitter.run(
+            multi_page_ratio=args.multi_page_ratio,
+            rotation_ratio=args.rotation_ratio,
+            offset_ratio=args.offset_ratio,
+            seed=args.seed,
+            workload=workload,
+            index=index
+        )
+    else:
+        workers = args.workers
+        if not workers and pipeline is None and (args.recycle_after or args.max_rss_mb):
+            # Recycling needs the work to happen in a child process
+            workers = 1
+        generator.generate_batch(
+            count=args.count,
+            multi_page_ratio=args.multi_page_ratio,
+            rotation_ratio=args.rotation_ratio,
+            offset_ratio=args.offset_ratio,
+            seed=args.seed,
+            workload=workload,
+            index=index,
+            workers=workers,
+            chunk_size=args.chunk_size,
+            max_invoices_per_worker=args.recycle_after,
+            max_rss_mb=args.max_rss_mb,
+            tracemalloc_interval=args.tracemalloc_every,
+            keep_results=False,
+            bundle_size=args.bundle_size,
+            pack_segment_mb=(args.pack_segment_mb or 1024) if args.pack else None,
+            metadata_format=args.metadata_format,
+            compress_level=args.compress_level,
+            compress_threads=args.compress_threads,
+            ndjson_shard_size=args.ndjson_shard_size,
+            manifest=args.manifest,
+            trace_slowest=args.trace_slowest,
+            trace_path=args.trace_file,
+            pipeline=pipeline,
+            queue_size=args.queue_size,
+            report_interval=args.report_interval
+        )
+    
+    if index is not None:
+        index.close()
 
 
 if __name__ == "__main__":
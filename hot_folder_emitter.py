@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Rate-paced hot-folder emitter
+Drops invoices into a watched output directory at a steady, predictable rate
+for soak-testing document intake pipelines:
+- Token-bucket pacer with a precise sleep/spin wait
+- Invoices are pre-rendered ahead on a process pool to absorb render jitter
+- Atomic writes (temp file plus rename) so watchers never see partial files
+- Periodic reporting of achieved rate and schedule lag
+"""
+
+import json
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from generate_invoices import InvoiceGenerator, atomic_write, invoice_seed
+
+
+class TokenBucket:
+    """
+    Token-bucket pacer releasing `rate` tokens per second.
+    
+    Implemented as a virtual schedule (GCRA): each token has an ideal release
+    time, so short stalls are caught up exactly instead of leaking rate. At most
+    `burst` tokens are released back-to-back after a stall.
+    """
+
+    # Below this many seconds we spin instead of sleeping (sleep granularity is ~1ms)
+    SPIN_THRESHOLD = 0.002
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.interval = 1.0 / rate
+        self.burst = max(1, burst)
+        self.next_release = time.perf_counter()
+
+    def reset(self, now: float):
+        self.next_release = now
+
+    def acquire(self) -> float:
+        """Block until the next token is due and consume it; returns its scheduled time"""
+        now = time.perf_counter()
+        # Don't bank more than `burst` tokens worth of catch-up after a long stall
+        earliest = now - (self.burst - 1) * self.interval
+        if self.next_release < earliest:
+            self.next_release = earliest
+        due = self.next_release
+        while True:
+            remaining = due - time.perf_counter()
+            if remaining <= 0:
+                break
+            if remaining > self.SPIN_THRESHOLD:
+                time.sleep(remaining - self.SPIN_THRESHOLD)
+        self.next_release = due + self.interval
+        return due
+
+
+# Per-process generator used by the pre-render pool
+_worker_generator: Optional[InvoiceGenerator] = None
+
+
+def _init_render_worker(generator_config: Dict[str, Any]):
+    global _worker_generator
+    _worker_generator = InvoiceGenerator(**generator_config)
+
+
+def _render_in_worker(params: Dict[str, Any]) -> Dict[str, Any]:
+    rendered = _worker_generator.render_invoice(**params)
+    # Serialize in the worker so the emitter loop only has to write bytes
+    rendered["json_bytes"] = json.dumps(rendered["metadata"], indent=2).encode("utf-8")
+    return rendered
+
+
+class HotFolderEmitter:
+    """Emits invoices into an InvoiceGenerator's output directory at a fixed rate"""
+
+    def __init__(
+        self,
+        generator: InvoiceGenerator,
+        rate: float,
+        duration: Optional[float] = None,
+        count: Optional[int] = None,
+        workers: int = 2,
+        prerender: Optional[int] = None,
+        burst: Optional[int] = None,
+        report_interval: float = 10.0
+    ):
+        if duration is None and count is None:
+            raise ValueError("Either duration or count must be given")
+        self.generator = generator
+        self.rate = rate
+        self.duration = duration
+        self.count = count
+        self.workers = max(1, workers)
+        # Default look-ahead: two seconds of output, at least a couple per worker
+        self.prerender = prerender or max(2 * self.workers, int(rate * 2))
+        # Default burst: up to 100ms of catch-up after a stall
+        self.pacer = TokenBucket(rate, burst=burst or max(1, round(rate / 10)))
+        self.report_interval = report_interval
+
+    def _emit(self, rendered: Dict[str, Any]):
+        # JSON first: once the PDF appears its ground truth is already in place
+        json_path = self.generator.json_dir / rendered["json_filename"]
+        pdf_path = self.generator.pdf_dir / rendered["pdf_filename"]
+        atomic_write(json_path, rendered["json_bytes"])
+        atomic_write(pdf_path, rendered["pdf_bytes"])
+        return pdf_path, json_path
+
+    def run(
+        self,
+        multi_page_ratio: float = 0.3,
+        rotation_ratio: float = 0.2,
+        offset_ratio: float = 0.2,
+        seed: Optional[int] = None,
+        workload=None,
+        index=None
+    ) -> Dict[str, Any]:
+        """
+        Emit invoices until the duration or count is exhausted; returns the run report.
+        index is an optional CorpusIndex updated as invoices are emitted.
+        """
+        limit = self.count if self.count is not None else float("inf")
+
+        print(f"Emitting invoices at {self.rate:g}/sec into {self.generator.output_dir}")
+        if self.duration is not None:
+            print(f"  - Duration: {self.duration:g}s")
+        if self.count is not None:
+            print(f"  - Count limit: {self.count}")
+        print(f"  - Render workers: {self.workers}, pre-render depth: {self.prerender}")
+        print()
+
+        next_index = 0
+
+        def next_params() -> Dict[str, Any]:
+            nonlocal next_index
+            if seed is not None:
+                random.seed(invoice_seed(seed, next_index))
+            next_index += 1
+            return self.generator.sample_invoice_params(multi_page_ratio, rotation_ratio, offset_ratio, workload)
+
+        emitted = 0
+        underruns = 0
+        max_lag = 0.0
+        timeline: List[Dict[str, Any]] = []
+        pending: Deque = deque()
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_render_worker,
+            initargs=(self.generator.config(),)
+        ) as pool:
+            while len(pending) < self.prerender and next_index < limit:
+                params = next_params()
+                pending.append((params, pool.submit(_render_in_worker, params)))
+            # Fill the look-ahead before starting the clock so worker start-up
+            # doesn't show up as lag in the first seconds
+            wait([future for _, future in pending])
+
+            start = time.perf_counter()
+            self.pacer.reset(start)
+            last_report = start
+            window_start, window_emitted = start, 0
+
+            while pending:
+                now = time.perf_counter()
+                if self.duration is not None and now - start >= self.duration:
+                    break
+
+                params, future = pending.popleft()
+                if not future.done():
+                    underruns += 1
+                rendered = future.result()
+
+                due = self.pacer.acquire()
+                pdf_path, json_path = self._emit(rendered)
+                if index is not None:
+                    index.add(params, pdf_path, json_path, rendered["invoice"],
+                              rendered["page_count"], rendered["injections"])
+                emitted += 1
+                window_emitted += 1
+
+                # Lag: how far behind its scheduled release time this write completed
+                now = time.perf_counter()
+                lag = now - due
+                max_lag = max(max_lag, lag)
+
+                if next_index < limit:
+                    params = next_params()
+                    pending.append((params, pool.submit(_render_in_worker, params)))
+
+                if now - last_report >= self.report_interval:
+                    window_rate = window_emitted / (now - window_start)
+                    sample = {
+                        "elapsed": round(now - start, 3),
+                        "emitted": emitted,
+                        "window_rate": round(window_rate, 3),
+                        "overall_rate": round(emitted / (now - start), 3),
+                        "lag": round(lag, 4),
+                        "prerendered": sum(1 for _, f in pending if f.done()),
+                    }
+                    timeline.append(sample)
+                    print(f"[{sample['elapsed']:.0f}s] emitted {emitted} "
+                          f"(rate: {sample['window_rate']:.2f}/s, overall: {sample['overall_rate']:.2f}/s, "
+                          f"lag: {lag*1000:.1f}ms, ready: {sample['prerendered']}/{len(pending)})")
+                    last_report = now
+                    window_start, window_emitted = now, 0
+
+            for _, future in pending:
+                future.cancel()
+        if index is not None:
+            index.flush()
+
+        # The run covers every slot handed out, including the last one's interval
+        elapsed = max(time.perf_counter(), self.pacer.next_release) - start
+        report = {
+            "target_rate": self.rate,
+            "achieved_rate": emitted / elapsed if elapsed > 0 else 0.0,
+            "emitted": emitted,
+            "elapsed_seconds": elapsed,
+            "max_lag_seconds": max_lag,
+            "prerender_underruns": underruns,
+            "generated_at": datetime.now().isoformat(),
+            "timeline": timeline,
+        }
+
+        report_path = self.generator.run_path("emitter_report.json")
+        atomic_write(report_path, json.dumps(report, indent=2).encode("utf-8"))
+
+        print()
+        print(f"✓ Emission complete!")
+        print(f"  - Emitted: {emitted} in {elapsed:.1f}s")
+        print(f"  - Achieved rate: {report['achieved_rate']:.2f}/s (target {self.rate:g}/s)")
+        print(f"  - Max lag: {max_lag*1000:.1f}ms, pre-render underruns: {underruns}")
+        print(f"  - Report: {report_path}")
+
+        return report
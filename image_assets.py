@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Image assets
+Vendor logos, rubber stamps ("PAID", "RECEIVED", ...) and signatures for
+invoices, as real ones carry them.
+
+- Logos: one per COMPANY_NAMES entry, drawn in the top margin of every page
+- Stamps: on some invoices, rotated and placed over the first page
+- Signatures: on some invoices, in the bottom margin of the first page
+
+Assets are generated procedurally (deterministically, so every process draws
+the same pixels), or loaded from an image directory when one is given:
+
+    <dir>/logos/<company name>.png
+    <dir>/stamps/<NAME>.png
+    <dir>/signatures/<anything>.png
+
+Each image is decoded and compressed into a PDF image XObject once per
+process. A document embeds each image it uses once and every page draws that
+same XObject, so a logo costs one embedded image per invoice however many
+pages it has.
+"""
+
+import colorsys
+import hashlib
+import math
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import PDFImageXObject, PDFObjectReference
+
+STAMP_NAMES = ["PAID", "RECEIVED", "APPROVED", "POSTED", "ENTERED"]
+SIGNATURE_COUNT = 8
+
+# Share of invoices carrying a stamp / a signature
+STAMP_RATE = 0.4
+SIGNATURE_RATE = 0.5
+
+# Drawn sizes (points); bitmaps are rendered at three times that
+LOGO_SIZE = (120, 40)
+STAMP_SIZE = (150, 60)
+SIGNATURE_SIZE = (120, 40)
+SCALE = 3
+
+FONT_DIR = Path("/usr/share/fonts/truetype/dejavu")
+
+
+def _font(bold: bool, size: int):
+    try:
+        return ImageFont.truetype(str(FONT_DIR / ("DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf")), size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _name_rng(kind: str, name: str) -> random.Random:
+    # Independent of the invoice RNG and of PYTHONHASHSEED
+    return random.Random(hashlib.sha256(f"{kind}:{name}".encode("utf-8")).digest())
+
+
+def make_logo(company: str) -> Image.Image:
+    """Monogram badge plus company name in a colour derived from the name"""
+    rng = _name_rng("logo", company)
+    width, height = LOGO_SIZE[0] * SCALE, LOGO_SIZE[1] * SCALE
+    red, green, blue = (int(c * 255) for c in colorsys.hsv_to_rgb(rng.random(), 0.65, 0.6))
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    if rng.random() < 0.5:
+        draw.ellipse((4, 4, height - 4, height - 4), fill=(red, green, blue))
+    else:
+        draw.rounded_rectangle((4, 4, height - 4, height - 4), radius=height // 5, fill=(red, green, blue))
+    initials = "".join(word[0] for word in company.split()[:2]).upper()
+    draw.text((height / 2, height / 2), initials, font=_font(True, height // 3), fill="white", anchor="mm")
+    words = company.split()
+    lines = [" ".join(words[:2]), " ".join(words[2:])] if len(words) > 2 else [company]
+    size = height // (3 if len(lines) > 1 else 2)
+    # Shrink the name until its longest line fits beside the badge
+    while size > 8 and max(draw.textlength(line, font=_font(True, size)) for line in lines) > width - height - 16:
+        size -= 1
+    for i, line in enumerate(lines):
+        y = height / 2 + (i - (len(lines) - 1) / 2) * size * 1.15
+        draw.text((height + 12, y), line, font=_font(True, size), fill=(red, green, blue), anchor="lm")
+    return image
+
+
+def make_stamp(name: str) -> Image.Image:
+    """Double-bordered rubber stamp with uneven ink"""
+    rng = _name_rng("stamp", name)
+    width, height = STAMP_SIZE[0] * SCALE, STAMP_SIZE[1] * SCALE
+    ink = {"PAID": (200, 30, 30), "RECEIVED": (30, 60, 170), "APPROVED": (30, 130, 50)}.get(name, (120, 40, 140))
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((6, 6, width - 6, height - 6), radius=18, outline=ink + (255,), width=10)
+    draw.rounded_rectangle((22, 22, width - 22, height - 22), radius=10, outline=ink + (255,), width=4)
+    draw.text((width / 2, height / 2), name, font=_font(True, int(height * 0.42)), fill=ink + (255,), anchor="mm")
+    # Worn ink: knock random specks out of the alpha channel
+    alpha = image.getchannel("A")
+    specks = Image.new("L", image.size, 0)
+    speck_draw = ImageDraw.Draw(specks)
+    for _ in range(400):
+        x, y, r = rng.uniform(0, width), rng.uniform(0, height), rng.uniform(1, 4)
+        speck_draw.ellipse((x - r, y - r, x + r, y + r), fill=255)
+    alpha = Image.eval(Image.composite(Image.new("L", image.size, 0), alpha, specks), lambda a: a * 4 // 5)
+    image.putalpha(alpha)
+    return image
+
+
+def make_signature(number: int) -> Image.Image:
+    """Handwriting-like scribble: loops travelling left to right, plus an underline"""
+    rng = _name_rng("signature", str(number))
+    width, height = SIGNATURE_SIZE[0] * SCALE, SIGNATURE_SIZE[1] * SCALE
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    loops = rng.randint(5, 9)
+    wobble = [(rng.uniform(0.6, 1.4), rng.uniform(0.5, 1.2)) for _ in range(loops)]
+    points = []
+    for step in range(600):
+        t = step / 599
+        loop = min(int(t * loops), loops - 1)
+        x_scale, y_scale = wobble[loop]
+        # A prolate cycloid: forward drift plus circular loops
+        angle = t * loops * math.tau
+        x = 12 + t * (width - 40) + math.sin(angle) * 14 * x_scale
+        y = height * 0.45 - math.cos(angle) * height * 0.22 * y_scale + math.sin(t * math.pi * 2) * 6
+        points.append((x, y))
+    draw.line(points, fill=(20, 30, 90, 255), width=4, joint="curve")
+    # Underline flourish
+    start = rng.uniform(0.05, 0.2)
+    draw.line([(width * start, height * 0.86), (width * 0.92, height * rng.uniform(0.74, 0.82))],
+              fill=(20, 30, 90, 255), width=3)
+    return image
+
+
+class ImageAssets:
+    """Per-process cache of decoded images and their PDF XObjects"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory) if directory else None
+        self.stamp_names = list(STAMP_NAMES)
+        self.signature_count = SIGNATURE_COUNT
+        if self.directory is not None:
+            stamps = sorted(p.stem for p in (self.directory / "stamps").glob("*.png"))
+            signatures = sorted((self.directory / "signatures").glob("*.png"))
+            self.stamp_names = stamps or self.stamp_names
+            self._signature_files = signatures
+            self.signature_count = len(signatures) or self.signature_count
+        else:
+            self._signature_files = []
+        # key -> XObject attributes (the compressed image), built on first use
+        self._xobjects: Dict[Tuple[str, str], Tuple[Dict[str, Any], Optional[Dict[str, Any]]]] = {}
+
+    def choose(self, company: str) -> Dict[str, Any]:
+        """Assets for one invoice, drawn from the (seeded) global RNG"""
+        assets: Dict[str, Any] = {"logo": company}
+        if random.random() < STAMP_RATE:
+            assets["stamp"] = {
+                "name": random.choice(self.stamp_names),
+                "angle": round(random.uniform(-20, 20), 1),
+                # Centre, as a fraction of the page size
+                "x": round(random.uniform(0.45, 0.75), 3),
+                "y": round(random.uniform(0.15, 0.4), 3),
+            }
+        if random.random() < SIGNATURE_RATE:
+            assets["signature"] = random.randrange(self.signature_count)
+        return assets
+
+    def _load(self, kind: str, name: str) -> Image.Image:
+        if self.directory is not None:
+            if kind == "signature" and self._signature_files:
+                return Image.open(self._signature_files[int(name) % len(self._signature_files)])
+            path = self.directory / f"{kind}s" / f"{name}.png"
+            if path.exists():
+                return Image.open(path)
+        if kind == "logo":
+            return make_logo(name)
+        if kind == "stamp":
+            return make_stamp(name)
+        return make_signature(int(name))
+
+    def _xobject(self, kind: str, name: str):
+        key = (kind, name)
+        if key not in self._xobjects:
+            image = self._load(kind, name)
+            image.load()
+            name_digest = hashlib.md5(f"{kind}:{name}".encode("utf-8")).hexdigest()
+            xobject = PDFImageXObject(name_digest, ImageReader(image), mask="auto")
+            smask = getattr(xobject, "_smask", None)
+            if smask is not None:
+                del xobject._smask
+                smask.name = name_digest + "mask"
+            # Attributes only: ReportLab objects can be registered with one document each
+            self._xobjects[key] = (dict(vars(xobject)), dict(vars(smask)) if smask is not None else None)
+        return self._xobjects[key]
+
+    def _register(self, canvas, kind: str, name: str) -> str:
+        """Add the image to the canvas's document once; returns its XObject name"""
+        image_fields, mask_fields = self._xobject(kind, name)
+        doc = canvas._doc
+        reg_name = doc.getXObjectName(image_fields["name"])
+        if reg_name not in doc.idToObject:
+            xobject = PDFImageXObject.__new__(PDFImageXObject)
+            xobject.__dict__.update(image_fields)
+            if mask_fields is not None:
+                smask = PDFImageXObject.__new__(PDFImageXObject)
+                smask.__dict__.update(mask_fields)
+                mask_name = doc.getXObjectName(smask.name)
+                doc.Reference(smask, mask_name)
+                xobject.smask = PDFObjectReference(mask_name)
+            doc.Reference(xobject, reg_name)
+        # As Canvas.drawImage does: list the image in the page's resources
+        canvas._formsinuse.append(image_fields["name"])
+        canvas._currentPageHasImages = 1
+        return reg_name
+
+    def _draw(self, canvas, kind: str, name: str, x: float, y: float, size: Tuple[float, float],
+              angle: float = 0):
+        reg_name = self._register(canvas, kind, name)
+        canvas.saveState()
+        canvas.translate(x, y)
+        if angle:
+            # Rotate about the image centre
+            canvas.translate(size[0] / 2, size[1] / 2)
+            canvas.rotate(angle)
+            canvas.translate(-size[0] / 2, -size[1] / 2)
+        canvas.scale(*size)
+        canvas._code.append(f"/{reg_name} Do")
+        canvas.restoreState()
+
+    def draw_page(self, canvas, doc, assets: Dict[str, Any]):
+        """Page callback for SimpleDocTemplate.build: logo on every page, stamp and signature on the first"""
+        width, height = doc.pagesize
+        self._draw(canvas, "logo", assets["logo"], doc.leftMargin, height - doc.topMargin + 8, LOGO_SIZE)
+        if canvas.getPageNumber() != 1:
+            return
+        stamp = assets.get("stamp")
+        if stamp:
+            self._draw(canvas, "stamp", stamp["name"], stamp["x"] * width - STAMP_SIZE[0] / 2,
+                       stamp["y"] * height - STAMP_SIZE[1] / 2, STAMP_SIZE, stamp["angle"])
+        if "signature" in assets:
+            self._draw(canvas, "signature", str(assets["signature"]), width - doc.rightMargin - SIGNATURE_SIZE[0],
+                       doc.bottomMargin - SIGNATURE_SIZE[1] - 6, SIGNATURE_SIZE)
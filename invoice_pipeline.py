@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Staged generation pipeline
+Splits batch generation into explicit stages connected by bounded queues:
+
+    sample -> render -> transform -> serialize -> write
+
+- sample:    draw invoice parameters (one thread, keeps seeded runs deterministic)
+- render:    invoice data and ReportLab layout (doc.build)
+- transform: flatten_pdf, i.e. rotation/offset and stripping interactive content
+- serialize: JSON-encode the metadata
+- write:     atomic file writes
+
+Each stage has its own worker count and runs on threads (I/O) or processes (CPU).
+Queue depths and per-stage throughput/utilization are reported live, so the
+bottleneck on a given machine shows up as the stage with a full input queue and
+busy workers.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from generate_invoices import InvoiceGenerator, atomic_write
+
+STAGES = ("render", "transform", "serialize", "write")
+STAGE_KINDS = ("thread", "process")
+
+# Generator used by stage functions: set in the parent for thread stages and by
+# the pool initializer in each worker process for process stages
+_stage_generator: Optional[InvoiceGenerator] = None
+
+
+def _init_stage_worker(generator_config: Dict[str, Any]):
+    global _stage_generator
+    _stage_generator = InvoiceGenerator(**generator_config)
+
+
+def _render_stage(item):
+    params, _ = item
+    return params, _stage_generator.render_invoice(**params, flatten=False)
+
+
+def _transform_stage(item):
+    params, rendered = item
+    start = time.perf_counter()
+    rendered["pdf_bytes"] = _stage_generator.flatten_pdf(
+        rendered["pdf_bytes"], params.get("rotation", 0), params.get("offset_x", 0), params.get("offset_y", 0)
+    )
+    rendered["timings"]["flatten"] = time.perf_counter() - start
+    return params, rendered
+
+
+def _serialize_stage(item):
+    params, rendered = item
+    start = time.perf_counter()
+    rendered["json_bytes"] = json.dumps(rendered["metadata"], indent=2).encode("utf-8")
+    rendered["timings"]["serialize"] = time.perf_counter() - start
+    return params, rendered
+
+
+def _write_stage(item):
+    params, rendered = item
+    start = time.perf_counter()
+    pdf_path = _stage_generator.pdf_dir / rendered["pdf_filename"]
+    json_path = _stage_generator.json_dir / rendered["json_filename"]
+    pdf_digest = atomic_write(pdf_path, rendered["pdf_bytes"])
+    json_digest = atomic_write(json_path, rendered["json_bytes"])
+    rendered["timings"]["write"] = time.perf_counter() - start
+    # Same shape as InvoiceGenerator.generate_invoice
+    return params, {
+        "pdf_path": str(pdf_path),
+        "json_path": str(json_path),
+        "metadata": rendered["metadata"],
+        "invoice": rendered["invoice"],
+        "page_count": rendered["page_count"],
+        "injections": rendered["injections"],
+        "profile": rendered["profile"],
+        "render_cache": rendered["render_cache"],
+        "checksums": [(str(pdf_path), pdf_digest, len(rendered["pdf_bytes"])),
+                      (str(json_path), json_digest, len(rendered["json_bytes"]))],
+        "timings": rendered["timings"]
+    }
+
+
+STAGE_FUNCTIONS: Dict[str, Callable] = {
+    "render": _render_stage,
+    "transform": _transform_stage,
+    "serialize": _serialize_stage,
+    "write": _write_stage,
+}
+
+
+def default_stages() -> Dict[str, Tuple[int, str]]:
+    """Stage concurrency defaults: CPU stages on processes, I/O stages on threads"""
+    cpus = os.cpu_count() or 1
+    return {
+        "render": (max(1, cpus - 1), "process"),
+        "transform": (1, "process"),
+        "serialize": (1, "thread"),
+        "write": (2, "thread"),
+    }
+
+
+def parse_stage_specs(specs: Optional[List[str]]) -> Dict[str, Tuple[int, str]]:
+    """Parse STAGE=WORKERS[:thread|process] overrides on top of the defaults"""
+    stages = default_stages()
+    for spec in specs or []:
+        name, _, value = spec.partition("=")
+        workers, _, kind = value.partition(":")
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage '{name}' (choose from {', '.join(STAGES)})")
+        if kind and kind not in STAGE_KINDS:
+            raise ValueError(f"Stage '{name}': kind must be thread or process, not '{kind}'")
+        try:
+            count = int(workers)
+        except ValueError:
+            raise ValueError(f"Stage '{name}': worker count must be an integer, not '{workers}'")
+        if count < 1:
+            raise ValueError(f"Stage '{name}': needs at least one worker")
+        stages[name] = (count, kind or stages[name][1])
+    if stages["render"][1] != "process":
+        # Rendering reseeds the global RNG and keeps per-invoice state on the generator
+        raise ValueError("The render stage must run on processes")
+    return stages
+
+
+class _StageStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.busy = 0.0
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.processed += 1
+            self.busy += seconds
+
+
+_DONE = object()
+
+
+class InvoicePipeline:
+    """Runs invoice generation as a staged pipeline; see the module docstring"""
+
+    # Seconds between queue depth samples
+    SAMPLE_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        generator: InvoiceGenerator,
+        stages: Optional[Dict[str, Tuple[int, str]]] = None,
+        queue_size: int = 16,
+        report_interval: float = 10.0
+    ):
+        self.generator = generator
+        self.stages = stages or default_stages()
+        self.queue_size = max(1, queue_size)
+        self.report_interval = report_interval
+        self.report: Optional[Dict[str, Any]] = None
+
+    def _describe(self) -> str:
+        return ", ".join(f"{name} {workers}x{kind}" for name, (workers, kind) in self.stages.items())
+
+    def run(self, params_iter: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Generate every parameter set, yielding (params, result) pairs in completion order"""
+        global _stage_generator
+        _stage_generator = self.generator
+
+        print(f"[Pipeline] Stages: {self._describe()}; queue size {self.queue_size}")
+
+        # queues[i] feeds stage i; the last queue holds finished invoices
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(STAGES) + 1)]
+        stats = {name: _StageStats() for name in ("sample",) + STAGES}
+        # Running [sum, count, max] of each stage's input queue depth
+        depth_samples: List[List[int]] = [[0, 0, 0] for _ in STAGES]
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        pools: Dict[str, ProcessPoolExecutor] = {}
+        threads: List[threading.Thread] = []
+
+        def put(q: queue.Queue, item) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fail(e: BaseException):
+            errors.append(e)
+            stop.set()
+
+        def sample_loop():
+            try:
+                iterator = iter(params_iter)
+                while True:
+                    start = time.perf_counter()
+                    params = next(iterator, _DONE)
+                    if params is _DONE:
+                        break
+                    stats["sample"].record(time.perf_counter() - start)
+                    if not put(queues[0], (params, None)):
+                        return
+                for _ in range(self.stages[STAGES[0]][0]):
+                    put(queues[0], _DONE)
+            except BaseException as e:
+                fail(e)
+
+        def stage_loop(position: int, remaining: List[int], lock: threading.Lock):
+            name = STAGES[position]
+            fn = STAGE_FUNCTIONS[name]
+            pool = pools.get(name)
+            inbox, outbox = queues[position], queues[position + 1]
+            try:
+                while not stop.is_set():
+                    try:
+                        item = inbox.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is _DONE:
+                        with lock:
+                            remaining[0] -= 1
+                            last = remaining[0] == 0
+                        if last:
+                            # The last worker out closes the next stage
+                            successors = 1 if position + 1 == len(STAGES) else self.stages[STAGES[position + 1]][0]
+                            for _ in range(successors):
+                                put(outbox, _DONE)
+                        return
+                    start = time.perf_counter()
+                    result = pool.submit(fn, item).result() if pool is not None else fn(item)
+                    stats[name].record(time.perf_counter() - start)
+                    if not put(outbox, result):
+                        return
+            except BaseException as e:
+                fail(e)
+
+        def monitor_loop():
+            run_start = last_report = time.perf_counter()
+            last_counts = {name: 0 for name in STAGES}
+            last_busy = {name: 0.0 for name in STAGES}
+            while not stop.wait(self.SAMPLE_INTERVAL):
+                for i in range(len(STAGES)):
+                    depth = queues[i].qsize()
+                    samples = depth_samples[i]
+                    samples[0] += depth
+                    samples[1] += 1
+                    samples[2] = max(samples[2], depth)
+                now = time.perf_counter()
+                if now - last_report >= self.report_interval:
+                    span = now - last_report
+                    parts = []
+                    for i, name in enumerate(STAGES):
+                        with stats[name].lock:
+                            processed, busy = stats[name].processed, stats[name].busy
+                        rate = (processed - last_counts[name]) / span
+                        utilization = (busy - last_busy[name]) / (span * self.stages[name][0])
+                        parts.append(f"{name} q={queues[i].qsize()}/{self.queue_size} "
+                                     f"{rate:.1f}/s {utilization * 100:.0f}%")
+                        last_counts[name], last_busy[name] = processed, busy
+                    print(f"[Pipeline {now - run_start:.0f}s] " + " | ".join(parts))
+                    self.report = self._build_report(stats, depth_samples, now - run_start)
+                    atomic_write(self.generator.run_path("pipeline_report.json"),
+                                 json.dumps(self.report, indent=2).encode("utf-8"))
+                    last_report = now
+
+        start = time.perf_counter()
+        monitor = threading.Thread(target=monitor_loop, name="pipeline-monitor", daemon=True)
+        try:
+            for name, (workers, kind) in self.stages.items():
+                if kind == "process":
+                    pools[name] = ProcessPoolExecutor(
+                        max_workers=workers,
+                        initializer=_init_stage_worker,
+                        initargs=(self.generator.config(),)
+                    )
+
+            threads.append(threading.Thread(target=sample_loop, name="pipeline-sample", daemon=True))
+            for position, name in enumerate(STAGES):
+                workers = self.stages[name][0]
+                remaining, lock = [workers], threading.Lock()
+                for n in range(workers):
+                    threads.append(threading.Thread(
+                        target=stage_loop, args=(position, remaining, lock),
+                        name=f"pipeline-{name}-{n}", daemon=True
+                    ))
+            for thread in threads + [monitor]:
+                thread.start()
+
+            output = queues[-1]
+            while True:
+                try:
+                    item = output.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        break
+                    continue
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            stop.set()
+            for thread in threads + [monitor]:
+                if thread.is_alive():
+                    thread.join()
+            for pool in pools.values():
+                pool.shutdown(wait=True, cancel_futures=True)
+
+        if errors:
+            raise RuntimeError(f"Pipeline stage failed: {errors[0]!r}") from errors[0]
+
+        self.report = self._build_report(stats, depth_samples, time.perf_counter() - start)
+        report_path = self.generator.run_path("pipeline_report.json")
+        atomic_write(report_path, json.dumps(self.report, indent=2).encode("utf-8"))
+        print(f"[Pipeline] Bottleneck: {self.report['bottleneck']}; report: {report_path}")
+
+    def _build_report(self, stats: Dict[str, _StageStats], depth_samples: List[List[int]], elapsed: float) -> Dict[str, Any]:
+        with stats["sample"].lock:
+            sampled, sample_busy = stats["sample"].processed, stats["sample"].busy
+        stages = {
+            "sample": {
+                "workers": 1,
+                "kind": "thread",
+                "processed": sampled,
+                "throughput": sampled / elapsed if elapsed > 0 else 0.0,
+                "busy_seconds": sample_busy,
+                "utilization": sample_busy / elapsed if elapsed > 0 else 0.0,
+                "mean_seconds": sample_busy / sampled if sampled else 0.0,
+            }
+        }
+        for i, name in enumerate(STAGES):
+            workers, kind = self.stages[name]
+            depth_sum, depth_count, depth_max = depth_samples[i]
+            with stats[name].lock:
+                processed, busy = stats[name].processed, stats[name].busy
+            stages[name] = {
+                "workers": workers,
+                "kind": kind,
+                "processed": processed,
+                "throughput": processed / elapsed if elapsed > 0 else 0.0,
+                "busy_seconds": busy,
+                "utilization": busy / (elapsed * workers) if elapsed > 0 else 0.0,
+                "mean_seconds": busy / processed if processed else 0.0,
+                "input_queue_mean": depth_sum / depth_count if depth_count else 0.0,
+                "input_queue_max": depth_max,
+            }
+        return {
+            "queue_size": self.queue_size,
+            "elapsed_seconds": elapsed,
+            "invoices": stats["write"].processed,
+            "stages": stages,
+            # The busiest stage per worker is the one to give more workers
+            "bottleneck": max(stages, key=lambda name: stages[name]["utilization"]),
+            "reported_at": datetime.now().isoformat(),
+        }
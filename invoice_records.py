@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Invoice records
+Compact invoice and line-item records that the samplers fill in and the
+renderers read. The metadata schema stores most values under two names
+(description/invoiceDescription, invoiceTotal/totalAmount, ...); records hold
+each value once, and the schema dict is only expanded by the serializer when
+the JSON metadata is written.
+
+    invoice.line_items[0].unit_price     # record access while rendering
+    invoice.to_schema()                  # schema dict (duplicated keys) for the metadata
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class LineItem:
+    """One line of an invoice"""
+
+    __slots__ = ("line_id", "description", "quantity", "unit_price", "total", "product_code")
+
+    def __init__(self, line_id: str, description: str, quantity: int, unit_price: float, total: float,
+                 product_code: str = ""):
+        self.line_id = line_id
+        self.description = description
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.total = total
+        self.product_code = product_code
+
+    def values(self) -> Tuple[Any, ...]:
+        return (self.line_id, self.description, self.quantity, self.unit_price, self.total, self.product_code)
+
+    def to_schema(self) -> Dict[str, Any]:
+        """Line item in the metadata schema"""
+        return {
+            "lineID": self.line_id,
+            "description": self.description,
+            "invoiceDescription": self.description,
+            "quantity": self.quantity,
+            "invoiceQuantity": self.quantity,
+            "unitPrice": self.unit_price,
+            "invoiceUnitPrice": self.unit_price,
+            "total": self.total,
+            "invoiceAmount": self.total,
+            "productCode": self.product_code,
+            "invoiceProductCode": self.product_code,
+            "unit": "",
+            "invoiceUnit": "",
+            "poID": None,
+            "poNumber": None
+        }
+
+    def __getstate__(self):
+        return self.values()
+
+    def __setstate__(self, state):
+        (self.line_id, self.description, self.quantity, self.unit_price, self.total, self.product_code) = state
+
+    def __repr__(self) -> str:
+        return f"LineItem({self.description!r}, quantity={self.quantity}, unit_price={self.unit_price})"
+
+
+class Invoice:
+    """Invoice-level fields plus line items; image_assets is set when images are enabled"""
+
+    __slots__ = ("invoice_number", "invoice_date", "due_date", "vendor_name", "vendor_address",
+                 "customer_name", "customer_address", "po_number", "subtotal", "tax", "shipping", "total",
+                 "line_items", "image_assets")
+
+    def __init__(self, invoice_number: str, invoice_date: str, due_date: str, vendor_name: str,
+                 vendor_address: str, customer_name: str, customer_address: str, po_number: str,
+                 subtotal: float, tax: float, shipping: float, total: float, line_items: List[LineItem],
+                 image_assets: Optional[Dict[str, Any]] = None):
+        self.invoice_number = invoice_number
+        self.invoice_date = invoice_date
+        self.due_date = due_date
+        self.vendor_name = vendor_name
+        self.vendor_address = vendor_address
+        self.customer_name = customer_name
+        self.customer_address = customer_address
+        self.po_number = po_number
+        self.subtotal = subtotal
+        self.tax = tax
+        self.shipping = shipping
+        self.total = total
+        self.line_items = line_items
+        self.image_assets = image_assets
+
+    def values(self) -> Tuple[Any, ...]:
+        """Every field once, line items as tuples (e.g. for hashing as JSON)"""
+        return (self.invoice_number, self.invoice_date, self.due_date, self.vendor_name, self.vendor_address,
+                self.customer_name, self.customer_address, self.po_number, self.subtotal, self.tax,
+                self.shipping, self.total, [item.values() for item in self.line_items], self.image_assets)
+
+    def to_schema(self) -> Dict[str, Any]:
+        """Invoice in the metadata schema (extractedData without the processing fields)"""
+        schema = {
+            "invoiceNumber": self.invoice_number,
+            "invoiceDate": self.invoice_date,
+            "dueDate": self.due_date,
+            "vendorName": self.vendor_name,
+            "vendorAddress": self.vendor_address,
+            "customerName": self.customer_name,
+            "customerAddress": self.customer_address,
+            "invoiceTotal": self.total,
+            "totalAmount": self.total,
+            "invoiceSubtotal": self.subtotal,
+            "subTotal": self.subtotal,
+            "invoiceTax": self.tax,
+            "taxAmount": self.tax,
+            "invoiceShipping": self.shipping,
+            "shippingFreight": self.shipping,
+            "lineItems": [item.to_schema() for item in self.line_items],
+            "poNumber": self.po_number,
+            "purchaseOrderNumber": self.po_number,
+            "customer": self.customer_name,
+            "vendor": self.vendor_name,
+        }
+        if self.image_assets is not None:
+            schema["imageAssets"] = self.image_assets
+        return schema
+
+    def __getstate__(self):
+        return self.values()
+
+    def __setstate__(self, state):
+        (self.invoice_number, self.invoice_date, self.due_date, self.vendor_name, self.vendor_address,
+         self.customer_name, self.customer_address, self.po_number, self.subtotal, self.tax,
+         self.shipping, self.total, line_items, self.image_assets) = state
+        self.line_items = [LineItem(*values) for values in line_items]
+
+    def __repr__(self) -> str:
+        return f"Invoice({self.invoice_number!r}, {self.vendor_name!r}, {len(self.line_items)} items)"
+
+
+def serialize_metadata(invoice: Invoice, entity_id: int, document_id: int, pdf_url: str, pdf_filename: str,
+                       processing_date: str) -> Dict[str, Any]:
+    """Metadata record for an invoice; the only place the schema dict is built"""
+    extracted_data = {
+        **invoice.to_schema(),
+        "extractionMethod": "hybrid",
+        "processingDate": processing_date,
+        "shippingFreightAllowance": 0,
+        "surcharges": 0,
+        "paymentTerms": "",
+        "invoicePaymentTerm": "",
+        "id": str(document_id),
+        "invoiceID": str(document_id),
+        "invoiceSubtotalTaxShipping": round(invoice.tax + invoice.shipping, 2),
+        "imageUrls": [pdf_url],
+        "imagePrefixes": [pdf_filename],
+        "pdfImages": {
+            "imageUrls": [pdf_url],
+            "boundingBoxesUrl": ""
+        }
+    }
+
+    return {
+        "entityID": entity_id,
+        "documentID": document_id,
+        "extractedEntitiesPayload": json.dumps({
+            "success": True,
+            "documentId": str(document_id),
+            "extractedEntityId": str(entity_id),
+            "extractedData": extracted_data,
+            "processingSteps": {
+                "imagesGenerated": True,
+                "boundingRegionsExtracted": True,
+                "aiExtractionCompleted": True,
+                "invoiceMapped": True,
+                "transformationCompleted": True,
+                "postProcessingCompleted": True
+            },
+            "completedAt": processing_date
+        }),
+        "stage": "intake",
+        "status": "completed",
+        "substatus": "Extraction Successful",
+        "createdOn": processing_date,
+        "modifiedOn": processing_date,
+        "dateExported": None,
+        "dateFiled": None
+    }
+
+
+def retarget_metadata(metadata: Dict[str, Any], pdf_url: str, prefix: str) -> Dict[str, Any]:
+    """
+    Point a metadata record's image URLs at where its PDF was actually written
+    (a bundle page or a pack byte range) instead of a loose PDF file
+    """
+    payload = json.loads(metadata["extractedEntitiesPayload"])
+    extracted_data = payload["extractedData"]
+    extracted_data["imageUrls"] = [pdf_url]
+    extracted_data["imagePrefixes"] = [prefix]
+    extracted_data["pdfImages"]["imageUrls"] = [pdf_url]
+    return {**metadata, "extractedEntitiesPayload": json.dumps(payload)}
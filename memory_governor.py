@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Memory governance for long batch runs
+- RSS measurement (from /proc on Linux, getrusage peak elsewhere)
+- tracemalloc snapshots every N invoices with top-growth reports
+- A worker pool whose processes are recycled after N invoices or when they
+  exceed an RSS ceiling, without losing in-flight work: a retiring worker hands
+  back the unfinished part of its chunk, and chunks held by a worker that died
+  are re-queued. Invoices are seeded per index, so a re-rendered invoice is
+  byte-for-byte the one that was lost.
+"""
+
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from generate_invoices import InvoiceGenerator
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # No /proc (macOS): fall back to the peak RSS, which only ever grows
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class TracemallocReporter:
+    """Takes a tracemalloc snapshot every `interval` invoices and prints the top allocation growth"""
+
+    # Allocations made by the tracing machinery itself are noise
+    _FILTERS = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ]
+
+    def __init__(self, interval: int, top: int = 10, label: str = "main", frames: int = 1):
+        self.interval = interval
+        self.top = top
+        self.label = label
+        self.count = 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = self._snapshot()
+        self.previous = self.baseline
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self._FILTERS)
+
+    def tick(self):
+        """Count one invoice; report when the interval is reached"""
+        self.count += 1
+        if self.count % self.interval == 0:
+            self.report()
+
+    def report(self):
+        snapshot = self._snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        growth = [s for s in snapshot.compare_to(self.previous, "lineno") if s.size_diff > 0][:self.top]
+        since_start = sum(s.size_diff for s in snapshot.compare_to(self.baseline, "filename"))
+
+        print(f"[Memory:{self.label}] after {self.count} invoices: RSS {current_rss_bytes() / 2**20:.1f} MiB, "
+              f"traced {traced / 2**20:.1f} MiB (peak {peak / 2**20:.1f} MiB), "
+              f"growth since start {since_start / 2**10:+.1f} KiB")
+        for stat in growth:
+            frame = stat.traceback[0]
+            print(f"    {stat.size_diff / 2**10:+9.1f} KiB {stat.count_diff:+7d} blocks  "
+                  f"{frame.filename}:{frame.lineno}")
+        self.previous = snapshot
+
+    def stop(self):
+        tracemalloc.stop()
+
+
+def _worker_main(
+    worker_id: int,
+    generator_config: Dict[str, Any],
+    task_queue,
+    result_queue,
+    max_invoices: Optional[int],
+    max_rss_bytes: Optional[int],
+    tracemalloc_interval: Optional[int],
+    render_only: bool = False
+):
+    """Worker process: render chunks until told to stop or until it should be recycled"""
+    generator = InvoiceGenerator(**generator_config)
+    # render_only hands PDF bytes back to the parent (e.g. for bundling) instead of writing files
+    produce = generator.render_invoice if render_only else generator.generate_invoice
+    reporter = TracemallocReporter(tracemalloc_interval, label=f"worker {worker_id}") if tracemalloc_interval else None
+    done = 0
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        task_id, chunk = task
+        results = []
+        for position, params in enumerate(chunk):
+            results.append((params, produce(**params)))
+            done += 1
+            if reporter is not None:
+                reporter.tick()
+
+            reason = None
+            if max_invoices is not None and done >= max_invoices:
+                reason = f"rendered {done} invoices"
+            elif max_rss_bytes is not None:
+                rss = current_rss_bytes()
+                if rss > max_rss_bytes:
+                    reason = f"RSS {rss / 2**20:.0f} MiB over ceiling"
+
+            if reason is not None:
+                # Hand back the rest of the chunk, then exit so a fresh process takes over
+                result_queue.put(("result", worker_id, task_id, results, chunk[position + 1:]))
+                result_queue.put(("retire", worker_id, reason))
+                return
+        result_queue.put(("result", worker_id, task_id, results, []))
+
+
+class _WorkerHandle:
+    def __init__(self, worker_id: int, process, task_queue):
+        self.worker_id = worker_id
+        self.process = process
+        self.task_queue = task_queue
+        # task_id -> (chunk_id, chunk), for every chunk sent but not yet returned
+        self.outstanding: Dict[int, Tuple[int, List[Dict[str, Any]]]] = {}
+        self.retired = False
+
+
+class RecyclingWorkerPool:
+    """
+    Renders invoices on worker processes that are recycled to keep memory flat.
+
+    Each worker gets its own task queue with at most `prefetch` chunks outstanding,
+    so the parent always knows which chunks a worker holds and can re-queue them
+    if it retires or dies.
+    """
+
+    # How many times a chunk may be lost to crashed workers before giving up
+    MAX_CHUNK_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        generator_config: Dict[str, Any],
+        workers: int,
+        chunk_size: int = 8,
+        max_invoices_per_worker: Optional[int] = None,
+        max_rss_mb: Optional[float] = None,
+        tracemalloc_interval: Optional[int] = None,
+        prefetch: int = 2,
+        render_only: bool = False
+    ):
+        self.generator_config = generator_config
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.max_invoices_per_worker = max_invoices_per_worker
+        self.max_rss_bytes = int(max_rss_mb * 2**20) if max_rss_mb else None
+        self.tracemalloc_interval = tracemalloc_interval
+        self.prefetch = max(1, prefetch)
+        self.render_only = render_only
+        self.recycled = 0
+        self.crashed = 0
+
+    def _spawn(self, ctx, worker_id: int, result_queue) -> _WorkerHandle:
+        task_queue = ctx.Queue()
+        process = ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.generator_config, task_queue, result_queue,
+                  self.max_invoices_per_worker, self.max_rss_bytes, self.tracemalloc_interval,
+                  self.render_only),
+            daemon=True
+        )
+        process.start()
+        return _WorkerHandle(worker_id, process, task_queue)
+
+    def run(self, params_iter: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Render every parameter set, yielding (params, result) pairs in completion order"""
+        ctx = multiprocessing.get_context()
+        result_queue = ctx.Queue()
+        params_iter = iter(params_iter)
+        # Chunks keep their chunk_id through re-queues (task_ids are per dispatch)
+        requeued: Deque[Tuple[int, List[Dict[str, Any]]]] = deque()
+        attempts: Dict[int, int] = {}
+        next_task_id = 0
+        next_chunk_id = 0
+        next_worker_id = 0
+        exhausted = False
+        # Invoices handed out and returned, to check none were lost or duplicated
+        drawn = 0
+        returned = 0
+
+        def next_chunk() -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+            nonlocal exhausted, drawn, next_chunk_id
+            if requeued:
+                return requeued.popleft()
+            if exhausted:
+                return None
+            chunk = []
+            for params in params_iter:
+                chunk.append(params)
+                if len(chunk) >= self.chunk_size:
+                    break
+            if len(chunk) < self.chunk_size:
+                exhausted = True
+            if not chunk:
+                return None
+            drawn += len(chunk)
+            next_chunk_id += 1
+            return next_chunk_id - 1, chunk
+
+        def replace(handle: _WorkerHandle) -> _WorkerHandle:
+            nonlocal next_worker_id
+            handle.process.join(timeout=30)
+            # Chunks the worker never got to go back to the front of the line
+            for item in handle.outstanding.values():
+                requeued.appendleft(item)
+            handle.outstanding.clear()
+            del handles[handle.worker_id]
+            new_handle = self._spawn(ctx, next_worker_id, result_queue)
+            handles[next_worker_id] = new_handle
+            next_worker_id += 1
+            return new_handle
+
+        def handle_message(message) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+            """Book-keeping for one worker message; returns the results to yield"""
+            nonlocal returned
+            kind, worker_id = message[0], message[1]
+            handle = handles.get(worker_id)
+            if kind == "result":
+                _, _, task_id, results, remaining = message
+                if handle is None or task_id not in handle.outstanding:
+                    # The chunk was re-queued when its worker was taken for dead; the retry delivers it
+                    print(f"[WorkerPool] Dropping late result of re-queued chunk {task_id} from worker {worker_id}")
+                    return []
+                chunk_id, _ = handle.outstanding.pop(task_id)
+                if remaining:
+                    requeued.appendleft((chunk_id, remaining))
+                returned += len(results)
+                return results
+            if kind == "retire" and handle is not None:
+                handle.retired = True
+                self.recycled += 1
+                print(f"[WorkerPool] Recycling worker {worker_id}: {message[2]}")
+                replace(handle)
+            return []
+
+        def drain() -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+            """Handle every message already queued (e.g. a dead worker's last result and retire notice)"""
+            results = []
+            while True:
+                try:
+                    message = result_queue.get_nowait()
+                except queue.Empty:
+                    return results
+                results += handle_message(message)
+
+        last_health_check = time.monotonic()
+        handles: Dict[int, _WorkerHandle] = {}
+        for _ in range(self.workers):
+            handles[next_worker_id] = self._spawn(ctx, next_worker_id, result_queue)
+            next_worker_id += 1
+
+        try:
+            while True:
+                # Keep every live worker fed
+                for handle in list(handles.values()):
+                    while not handle.retired and len(handle.outstanding) < self.prefetch:
+                        item = next_chunk()
+                        if item is None:
+                            break
+                        handle.outstanding[next_task_id] = item
+                        handle.task_queue.put((next_task_id, item[1]))
+                        next_task_id += 1
+
+                if exhausted and not requeued and not any(h.outstanding for h in handles.values()):
+                    break
+
+                try:
+                    message = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    message = None
+
+                if message is not None:
+                    for params, result in handle_message(message):
+                        yield params, result
+
+                if time.monotonic() - last_health_check >= 1.0:
+                    last_health_check = time.monotonic()
+                    if any(not h.process.is_alive() and not h.retired for h in handles.values()):
+                        # A worker flushes its messages before exiting: read them before judging it
+                        for params, result in drain():
+                            yield params, result
+                    for handle in list(handles.values()):
+                        if handle.process.is_alive() or handle.retired:
+                            continue
+                        if handle.process.exitcode == 0:
+                            # Clean exit without a retire notice: not a crash, hand its chunks to a new worker
+                            replace(handle)
+                        else:
+                            self.crashed += 1
+                            for chunk_id, _ in handle.outstanding.values():
+                                attempts[chunk_id] = attempts.get(chunk_id, 0) + 1
+                                if attempts[chunk_id] >= self.MAX_CHUNK_ATTEMPTS:
+                                    raise RuntimeError(
+                                        f"Chunk {chunk_id} crashed {attempts[chunk_id]} workers; giving up"
+                                    )
+                            print(f"[WorkerPool] Worker {handle.worker_id} died "
+                                  f"(exit code {handle.process.exitcode}); re-queuing "
+                                  f"{sum(len(chunk) for _, chunk in handle.outstanding.values())} invoices")
+                            replace(handle)
+
+            if returned != drawn:
+                raise RuntimeError(f"Worker pool returned {returned} invoices for {drawn} requested")
+        finally:
+            for handle in handles.values():
+                if handle.process.is_alive():
+                    handle.task_queue.put(None)
+            deadline = time.monotonic() + 30
+            for handle in handles.values():
+                handle.process.join(timeout=max(0.0, deadline - time.monotonic()))
+                if handle.process.is_alive():
+                    handle.process.terminate()
+
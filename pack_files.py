@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Pack files
+Append-only output format for corpora too large for loose files:
+
+- Segments (pack_00000.seg, ...): each invoice's PDF followed by its metadata
+  JSON, appended back to back; a new segment starts at --pack-segment-mb
+- Index (pack.idx): a header followed by fixed-width entries
+  (documentID, segment, offset, PDF length, JSON length) sorted by documentID,
+  so readers can mmap it and binary-search without loading anything
+
+Metadata image URLs point at the PDF's byte range in its segment
+(file://<segment>#offset=N&length=M), as no loose PDF is written.
+
+Reopening a pack appends new segments and rebuilds the index. Index entries
+are sorted in bounded memory: sorted runs are spilled to disk and merged.
+
+    with PackReader("generated_invoices/pack") as pack:
+        record = pack.get(4711)           # first record with documentID 4711
+        pdf = record.pdf                  # memoryview into the mmapped segment
+        metadata = record.metadata()      # parsed JSON
+        record = pack.record(12345)       # random access by position
+
+documentIDs aren't unique in generated corpora; find() returns every record
+with a given ID, in the order they were written.
+"""
+
+import heapq
+import json
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from checksum_manifest import HashingFile
+from generate_invoices import FILE_MODE
+from invoice_records import retarget_metadata
+
+INDEX_NAME = "pack.idx"
+INDEX_MAGIC = b"INVPACK1"
+# magic, entry count, segment count
+INDEX_HEADER = struct.Struct("<8sQI4x")
+# documentID, sequence number (keeps duplicates in write order), segment, offset, PDF length, JSON length
+INDEX_ENTRY = struct.Struct("<QQIQII")
+
+# Entries held in memory before a sorted run is spilled to disk
+RUN_ENTRIES = 1 << 18
+
+
+def segment_name(segment: int) -> str:
+    return f"pack_{segment:05d}.seg"
+
+
+class PackEntry(NamedTuple):
+    document_id: int
+    sequence: int
+    segment: int
+    offset: int
+    pdf_length: int
+    json_length: int
+
+
+def _read_entries(path: Path, skip: int = 0) -> Iterator[tuple]:
+    with open(path, "rb") as f:
+        f.seek(skip)
+        while True:
+            chunk = f.read(INDEX_ENTRY.size * 4096)
+            if not chunk:
+                return
+            yield from INDEX_ENTRY.iter_unpack(chunk)
+
+
+class PackWriter:
+    """Appends invoices to segment files and writes the sorted index on close"""
+
+    def __init__(self, directory: str, segment_bytes: int = 1 << 30, manifest=None):
+        self.directory = Path(directory)
+        # Optional checksum_manifest.Manifest recording finished segments and the index
+        self.manifest = manifest
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.entries: List[tuple] = []
+        self.runs: List[Path] = []
+        self.count = 0
+        self.sequence = 0
+        self.segment = 0
+
+        index_path = self.directory / INDEX_NAME
+        if index_path.exists():
+            # Appending to an existing pack: its index is already a sorted run
+            with open(index_path, "rb") as f:
+                magic, count, segments = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{index_path} is not a pack index")
+            self.existing = index_path
+            self.count = self.sequence = count
+            self.segment = segments
+        else:
+            self.existing = None
+        self.file = None
+        self._open_segment()
+
+    def _close_segment(self):
+        self.file.close()
+        if self.manifest is not None:
+            self.manifest.add(*self.file.checksum(self.path))
+
+    def _open_segment(self):
+        if self.file is not None:
+            self._close_segment()
+            self.segment += 1
+        self.path = self.directory / segment_name(self.segment)
+        # Segments are hashed as written; leftovers of an interrupted run are hashed once on reopening
+        self.file = HashingFile(open(self.path, "ab"))
+        if self.file.tell():
+            with open(self.path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    self.file.hash.update(chunk)
+                    self.file.size += len(chunk)
+
+    def _spill(self):
+        self.entries.sort()
+        fd, name = tempfile.mkstemp(prefix=".run.", suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            for entry in self.entries:
+                f.write(INDEX_ENTRY.pack(*entry))
+        self.runs.append(Path(name))
+        self.entries.clear()
+
+    def reserve(self, size: int) -> Tuple[int, int]:
+        """
+        Start a new segment if a record of `size` bytes doesn't fit in this one;
+        returns the (segment, offset) the next record is written at
+        """
+        if self.file.tell() and self.file.tell() + size > self.segment_bytes:
+            self._open_segment()
+        return self.segment, self.file.tell()
+
+    def append(self, document_id: int, pdf_bytes: bytes, json_bytes: bytes) -> PackEntry:
+        """Append one invoice; returns its index entry"""
+        _, offset = self.reserve(len(pdf_bytes) + len(json_bytes))
+        self.file.write(pdf_bytes)
+        self.file.write(json_bytes)
+        entry = PackEntry(document_id, self.sequence, self.segment, offset, len(pdf_bytes), len(json_bytes))
+        self.entries.append(tuple(entry))
+        self.sequence += 1
+        self.count += 1
+        if len(self.entries) >= RUN_ENTRIES:
+            self._spill()
+        return entry
+
+    def close(self):
+        """Flush the segment and write the index (merging spilled runs and the previous index)"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self._close_segment()
+        self.entries.sort()
+
+        sources = [iter(self.entries)] + [_read_entries(run) for run in self.runs]
+        if self.existing is not None:
+            sources.append(_read_entries(self.existing, INDEX_HEADER.size))
+
+        index_path = self.directory / INDEX_NAME
+        fd, name = tempfile.mkstemp(prefix=f".{INDEX_NAME}.", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                f = HashingFile(raw)
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, self.count, self.segment + 1))
+                buffer = bytearray()
+                for entry in heapq.merge(*sources):
+                    buffer += INDEX_ENTRY.pack(*entry)
+                    if len(buffer) >= 1 << 20:
+                        f.write(buffer)
+                        buffer.clear()
+                f.write(buffer)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(name, FILE_MODE)
+            os.replace(name, index_path)
+            if self.manifest is not None:
+                self.manifest.add(*f.checksum(index_path))
+        except BaseException:
+            os.unlink(name)
+            raise
+        finally:
+            for run in self.runs:
+                run.unlink()
+        self.entries.clear()
+
+
+class PackRecord(NamedTuple):
+    entry: PackEntry
+    pdf: memoryview
+    json: memoryview
+
+    def metadata(self) -> Dict[str, Any]:
+        return json.loads(bytes(self.json))
+
+
+class PackReader:
+    """
+    Random access to a pack through mmap. Records are zero-copy memoryviews into
+    the segments; release them (or copy with bytes()) before closing the reader.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._index_file = open(self.directory / INDEX_NAME, "rb")
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.segments = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{self.directory / INDEX_NAME} is not a pack index")
+        self._segments: Dict[int, mmap.mmap] = {}
+        self._views: Dict[int, memoryview] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def entry(self, position: int) -> PackEntry:
+        """Index entry at a position in documentID order"""
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        return PackEntry(*INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + position * INDEX_ENTRY.size))
+
+    def _document_id(self, position: int) -> int:
+        return struct.unpack_from("<Q", self._index, INDEX_HEADER.size + position * INDEX_ENTRY.size)[0]
+
+    def _lower_bound(self, document_id: int) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._document_id(mid) < document_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _segment(self, segment: int) -> memoryview:
+        view = self._views.get(segment)
+        if view is None:
+            with open(self.directory / segment_name(segment), "rb") as f:
+                self._segments[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = self._views[segment] = memoryview(self._segments[segment])
+        return view
+
+    def read(self, entry: PackEntry) -> PackRecord:
+        view = self._segment(entry.segment)
+        pdf_end = entry.offset + entry.pdf_length
+        return PackRecord(entry, view[entry.offset:pdf_end], view[pdf_end:pdf_end + entry.json_length])
+
+    def record(self, position: int) -> PackRecord:
+        """Record at a position in documentID order (e.g. for uniform random sampling)"""
+        return self.read(self.entry(position))
+
+    def find(self, document_id: int) -> List[PackEntry]:
+        """Every entry with this documentID, in write order"""
+        entries = []
+        position = self._lower_bound(document_id)
+        while position < self.count and self._document_id(position) == document_id:
+            entries.append(self.entry(position))
+            position += 1
+        return entries
+
+    def get(self, document_id: int) -> Optional[PackRecord]:
+        """The first record written with this documentID, or None"""
+        position = self._lower_bound(document_id)
+        if position < self.count and self._document_id(position) == document_id:
+            return self.record(position)
+        return None
+
+    def __iter__(self) -> Iterator[PackRecord]:
+        for position in range(self.count):
+            yield self.record(position)
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        for segment in self._segments.values():
+            segment.close()
+        self._index.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackSink:
+    """Output sink for generate_batch writing invoices into a pack instead of loose files"""
+
+    def __init__(self, output_dir: Path, segment_bytes: int = 1 << 30, name: str = "pack", manifest=None):
+        self.writer = PackWriter(Path(output_dir) / name, segment_bytes, manifest)
+
+    def write(self, rendered: Dict[str, Any]) -> Dict[str, Any]:
+        """Append one rendered invoice (see InvoiceGenerator.render_invoice)"""
+        pdf_bytes = rendered["pdf_bytes"]
+        json_bytes = json.dumps(rendered["metadata"], indent=2).encode("utf-8")
+        # The image URLs name the PDF's byte range, which is only known once the record's
+        # segment is: retarget until the record fits where the URLs point (at most twice)
+        position = self.writer.reserve(len(pdf_bytes) + len(json_bytes))
+        while True:
+            segment_path = (self.writer.directory / segment_name(position[0])).absolute()
+            pdf_ref = f"{segment_path}#offset={position[1]}&length={len(pdf_bytes)}"
+            metadata = retarget_metadata(rendered["metadata"], f"file://{pdf_ref}", segment_path.name)
+            json_bytes = json.dumps(metadata, indent=2).encode("utf-8")
+            reserved = self.writer.reserve(len(pdf_bytes) + len(json_bytes))
+            if reserved == position:
+                break
+            position = reserved
+        entry = self.writer.append(metadata["documentID"], pdf_bytes, json_bytes)
+        return {
+            # Byte ranges keep pack members distinct (e.g. as corpus index keys)
+            "pdf_path": pdf_ref,
+            "json_path": f"{segment_path}#offset={entry.offset + entry.pdf_length}&length={entry.json_length}",
+            "metadata": metadata,
+            "invoice": rendered["invoice"],
+            "page_count": rendered["page_count"],
+            "injections": rendered["injections"],
+            "profile": rendered["profile"],
+            "render_cache": rendered["render_cache"],
+        }
+
+    def close(self):
+        self.writer.close()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "pack_directory": str(self.writer.directory.absolute()),
+            "pack_segments": self.writer.segment + 1,
+            "pack_documents": self.writer.count,
+        }
+
+    def describe(self) -> str:
+        return f"Pack: {self.writer.directory} ({self.writer.count} documents in {self.writer.segment + 1} segments)"
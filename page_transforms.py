@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Page transforms
+The page transformation flatten_pdf applies (rotation about the page centre
+plus an offset) as a single affine matrix:
+
+- The rotation part is computed once per (angle, page size) and cached;
+  generate_batch only draws from the ten ROTATION_ANGLES, so a batch needs a
+  handful of them. The offset is added to the cached matrix's translation.
+- Pages are transformed by wrapping their existing content streams in
+  `q <matrix> cm ... Q`, without decoding or re-encoding them (PyPDF2's and
+  pypdf's add_transformation parse and rewrite the whole content stream).
+- Within a document, pages are grouped by transform: every page with the
+  same matrix references the same two wrapper streams.
+
+    matrix = page_matrix(612, 792, rotation=3, offset_x=4.5)
+    wrapper = ContentWrapper(writer, PyPDF2.generic)
+    wrapper.wrap(writer.add_page(page), matrix)
+"""
+
+import math
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+Matrix = Tuple[float, float, float, float, float, float]
+
+
+def multiply(m1: Matrix, m2: Matrix) -> Matrix:
+    """Concatenate two PDF matrices: applying the result is applying m1, then m2"""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (
+        a1 * a2 + b1 * c2,
+        a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2,
+        c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2,
+        e1 * b2 + f1 * d2 + f2,
+    )
+
+
+@lru_cache(maxsize=256)
+def rotation_matrix(width: float, height: float, rotation: float) -> Matrix:
+    """Rotation about the page centre: translate to the origin, rotate, translate back"""
+    center_x, center_y = width / 2, height / 2
+    angle = math.radians(rotation)
+    cos_angle, sin_angle = math.cos(angle), math.sin(angle)
+    matrix = multiply((1, 0, 0, 1, -center_x, -center_y), (cos_angle, sin_angle, -sin_angle, cos_angle, 0, 0))
+    return multiply(matrix, (1, 0, 0, 1, center_x, center_y))
+
+
+def page_matrix(width: float, height: float, rotation: float = 0, offset_x: float = 0, offset_y: float = 0) -> Optional[Matrix]:
+    """
+    Combined matrix for a rotation about the page centre followed by an offset,
+    or None when the page is left as is.
+    """
+    if rotation == 0 and offset_x == 0 and offset_y == 0:
+        return None
+    if rotation == 0:
+        return (1, 0, 0, 1, offset_x, offset_y)
+    a, b, c, d, e, f = rotation_matrix(width, height, rotation)
+    return (a, b, c, d, e + offset_x, f + offset_y)
+
+
+def cm_operator(matrix: Matrix) -> bytes:
+    return (" ".join(f"{value:.6f}" for value in matrix) + " cm\n").encode("ascii")
+
+
+class ContentWrapper:
+    """
+    Wraps pages of one PdfWriter (PyPDF2 or pypdf; pass the library's generic
+    module) in q/cm/Q, sharing the wrapper streams between pages with the same matrix
+    """
+
+    def __init__(self, writer, generic):
+        self.writer = writer
+        self.generic = generic
+        self._streams: Dict[Matrix, Tuple[object, object]] = {}
+
+    def _stream(self, data: bytes):
+        stream = self.generic.DecodedStreamObject()
+        stream.set_data(data)
+        return self.writer._add_object(stream)
+
+    def wrap(self, page, matrix: Matrix):
+        """Transform a page already added to the writer"""
+        if matrix not in self._streams:
+            self._streams[matrix] = (self._stream(b"q\n" + cm_operator(matrix)), self._stream(b"\nQ\n"))
+        prefix, suffix = self._streams[matrix]
+        generic = self.generic
+        contents = page.get("/Contents")
+        if contents is None:
+            return
+        # Content arrays are concatenated by readers, so the page's own streams stay as they are
+        resolved = contents.get_object()
+        streams = list(resolved) if isinstance(resolved, generic.ArrayObject) else [contents]
+        page[generic.NameObject("/Contents")] = generic.ArrayObject([prefix, *streams, suffix])
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+PDF post-processing backends
+flatten_pdf strips annotations and AcroForm data and applies the page
+transformation (rotation about the page centre plus offset). This module puts
+that behind a small interface with one implementation per PDF library:
+
+- pypdf2:  PyPDF2 (always available)
+- pypdf:   pypdf, PyPDF2's maintained successor
+- pikepdf: qpdf bindings
+
+All three apply the transform as one cached matrix, wrapped around each
+page's content streams without parsing them (see page_transforms.py).
+
+pypdf and pikepdf are optional; get_backend() raises a helpful error when the
+selected one isn't installed.
+"""
+
+import io
+from typing import Dict, List
+
+# Matrix helpers live in page_transforms; re-exported for existing callers
+from page_transforms import ContentWrapper, Matrix, cm_operator, multiply, page_matrix
+
+
+class PdfBackend:
+    """Strips interactive content from a PDF and applies the page transformation"""
+
+    name = ""
+
+    def flatten(self, pdf_bytes: bytes, rotation: float = 0, offset_x: float = 0, offset_y: float = 0) -> bytes:
+        raise NotImplementedError
+
+
+class PyPDF2Backend(PdfBackend):
+    """PyPDF2 PdfReader/PdfWriter"""
+
+    name = "pypdf2"
+
+    def __init__(self):
+        from PyPDF2 import PdfReader, PdfWriter, generic
+        self.PdfReader, self.PdfWriter, self.generic = PdfReader, PdfWriter, generic
+
+    def flatten(self, pdf_bytes: bytes, rotation: float = 0, offset_x: float = 0, offset_y: float = 0) -> bytes:
+        input_pdf = self.PdfReader(io.BytesIO(pdf_bytes))
+        output_pdf = self.PdfWriter()
+        wrapper = ContentWrapper(output_pdf, self.generic)
+
+        for page in input_pdf.pages:
+            # Remove any form fields or annotations to ensure content is flattened
+            if '/Annots' in page:
+                del page['/Annots']
+            if '/AcroForm' in page:
+                del page['/AcroForm']
+
+            # PdfWriter.add_page doesn't carry over the reader's catalog, so no AcroForm survives
+            page_out = output_pdf.add_page(page)
+
+            # One wrap per page, with the matrix cached per rotation angle and page size
+            matrix = page_matrix(float(page.mediabox.width), float(page.mediabox.height), rotation, offset_x, offset_y)
+            if matrix is not None:
+                wrapper.wrap(page_out, matrix)
+
+        output_buffer = io.BytesIO()
+        output_pdf.write(output_buffer)
+        return output_buffer.getvalue()
+
+
+class PypdfBackend(PdfBackend):
+    """pypdf, PyPDF2's maintained successor"""
+
+    name = "pypdf"
+
+    def __init__(self):
+        from pypdf import PdfReader, PdfWriter, generic
+        self.PdfReader, self.PdfWriter, self.generic = PdfReader, PdfWriter, generic
+
+    def flatten(self, pdf_bytes: bytes, rotation: float = 0, offset_x: float = 0, offset_y: float = 0) -> bytes:
+        reader = self.PdfReader(io.BytesIO(pdf_bytes))
+        writer = self.PdfWriter()
+        wrapper = ContentWrapper(writer, self.generic)
+        for page in reader.pages:
+            if "/Annots" in page:
+                del page["/Annots"]
+            page_out = writer.add_page(page)
+            matrix = page_matrix(float(page.mediabox.width), float(page.mediabox.height), rotation, offset_x, offset_y)
+            if matrix is not None:
+                wrapper.wrap(page_out, matrix)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+
+class PikepdfBackend(PdfBackend):
+    """pikepdf (qpdf): wraps each page's content in q/cm/Q without parsing it"""
+
+    name = "pikepdf"
+
+    def __init__(self):
+        import pikepdf
+        self.pikepdf = pikepdf
+
+    def flatten(self, pdf_bytes: bytes, rotation: float = 0, offset_x: float = 0, offset_y: float = 0) -> bytes:
+        with self.pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+            if "/AcroForm" in pdf.Root:
+                del pdf.Root.AcroForm
+            for page in pdf.pages:
+                if "/Annots" in page.obj:
+                    del page.obj.Annots
+                box = [float(v) for v in page.mediabox]
+                matrix = page_matrix(box[2] - box[0], box[3] - box[1], rotation, offset_x, offset_y)
+                if matrix is not None:
+                    page.contents_add(b"q\n" + cm_operator(matrix), prepend=True)
+                    page.contents_add(b"\nQ\n", prepend=False)
+            buffer = io.BytesIO()
+            pdf.save(buffer)
+            return buffer.getvalue()
+
+
+BACKENDS = {
+    PyPDF2Backend.name: PyPDF2Backend,
+    PypdfBackend.name: PypdfBackend,
+    PikepdfBackend.name: PikepdfBackend,
+}
+
+DEFAULT_BACKEND = PyPDF2Backend.name
+
+# One instance per backend and process
+_instances: Dict[str, PdfBackend] = {}
+
+
+def get_backend(name: str = DEFAULT_BACKEND) -> PdfBackend:
+    """Backend instance by name; raises ValueError if it's unknown or its library isn't installed"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{name}' (choose from {', '.join(BACKENDS)})")
+    if name not in _instances:
+        try:
+            _instances[name] = BACKENDS[name]()
+        except ImportError:
+            raise ValueError(f"PDF backend '{name}' is not installed (pip install {name})")
+    return _instances[name]
+
+
+def available_backends() -> List[str]:
+    """Names of the backends whose libraries are installed"""
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ValueError:
+            continue
+        names.append(name)
+    return names
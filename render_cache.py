@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Render cache
+Content-addressed on-disk cache of rendered PDFs. The key is a SHA-256 of the
+invoice data plus everything else that shapes the PDF (page count, rotation,
+offset, page size, flattening, renderer), so rerunning a seeded build after a
+metadata schema change, or rebuilding a subset, reuses every PDF whose inputs
+didn't change.
+
+Entries live in <cache>/<key[:2]>/<key>.<pages>.pdf. A hit refreshes the
+entry's mtime, and when the cache grows past its size bound the least recently
+used entries are evicted. Output files are hard-linked to the entry (or
+reflinked where hard links aren't possible), so a hit costs no copy; outputs
+are always replaced rather than modified in place, which keeps the shared
+inode intact.
+
+The cache directory can be shared by any number of worker processes.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from generate_invoices import FILE_MODE
+
+# Bump when the layout or the key changes, so stale renders are never served
+CACHE_VERSION = 3
+
+# Eviction trims the cache to this fraction of its bound
+EVICT_TO = 0.9
+
+# ioctl request to clone a file's extents (Linux, btrfs/XFS/...)
+FICLONE = 0x40049409
+
+
+def cache_key(invoice_values: Sequence[Any], **layout) -> str:
+    """SHA-256 of the invoice's field values (see Invoice.values) and layout parameters"""
+    payload = json.dumps({"version": CACHE_VERSION, "invoice": invoice_values, "layout": layout},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Size-bounded LRU cache of rendered PDFs in a directory"""
+
+    def __init__(self, directory: str, max_bytes: int = 2 << 30):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # Bytes in the cache as far as this process knows; scanned on the first put
+        self.total_bytes: Optional[int] = None
+        self.evictions = 0
+
+    def _path(self, key: str, pages: int) -> Path:
+        return self.directory / key[:2] / f"{key}.{pages}.pdf"
+
+    def get(self, key: str, pages_hint: int = 1) -> Optional[Tuple[Path, bytes, int]]:
+        """(entry path, PDF bytes, page count) for a cached render, or None"""
+        path = self._path(key, pages_hint)
+        if not path.exists():
+            # The page count can differ from the requested one (e.g. overflowing tables)
+            try:
+                path = next(self.directory.joinpath(key[:2]).glob(f"{key}.*.pdf"))
+            except (StopIteration, FileNotFoundError):
+                return None
+        try:
+            pdf_bytes = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            return None
+        return path, pdf_bytes, int(path.name.split(".")[1])
+
+    def put(self, key: str, pdf_bytes: bytes, pages: int) -> Optional[Path]:
+        """Store a render; returns the entry path (None if it could not be written)"""
+        path = self._path(key, pages)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_bytes)
+            # Cache entries are linked into output directories, so they get the output files' permissions
+            os.chmod(tmp_path, FILE_MODE)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            print(f"[RenderCache] Warning: could not store {path.name}: {e}")
+            return None
+
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, size, _ in self._entries())
+        else:
+            self.total_bytes += len(pdf_bytes)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        return path
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".pdf"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache is below its bound"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def link(self, source: Path, destination: Path) -> bool:
+        """
+        Atomically place a cache entry at destination as a hard link, or a reflink
+        where hard links fail (other filesystem limits); False if neither works
+        """
+        destination = Path(destination)
+        tmp_path = destination.with_name(f".{destination.name}.{os.getpid()}.link")
+        try:
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            os.replace(tmp_path, destination)
+            return True
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "directory": str(self.directory.absolute()),
+            "max_bytes": self.max_bytes,
+            "size_bytes": sum(size for _, size, _ in entries),
+            "entries": len(entries),
+        }
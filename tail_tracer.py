@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Tail-latency tracing
+Aggregate throughput hides the invoices that take 50x the median. The tracer
+times every invoice (render_invoice reports seconds per phase, so this costs a
+few perf_counter calls) and keeps:
+
+- a log-bucketed latency histogram, for p50/p90/p99 in constant memory
+- the K slowest invoices with their complete generation parameters, including
+  the content seed, page count, injected payloads and per-phase timings
+
+Phases: data (sampling the invoice), layout (story + doc.build, or the
+template fill), flatten (flatten_pdf), cache (render cache lookup and store),
+metadata, serialize and write.
+
+The slowest invoices are written to a replay file, <output>/slow_invoices.json:
+
+    python generate_invoices.py -n 100000 --workers 8 --trace-slowest 20
+    python generate_invoices.py replay generated_invoices/slow_invoices.json --lines 30
+
+replay regenerates exactly those invoices (same generator settings, same
+parameters and content seed) under cProfile.
+"""
+
+import cProfile
+import heapq
+import io
+import json
+import math
+import pstats
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from generate_invoices import InvoiceGenerator, atomic_file
+
+REPLAY_NAME = "slow_invoices.json"
+
+# Histogram buckets grow by 5% from 100 µs, so percentiles are within 5%
+BUCKET_BASE = 1e-4
+BUCKET_GROWTH = math.log(1.05)
+
+
+class TailTracer:
+    """Latency histogram plus the top_k slowest invoices of a batch"""
+
+    def __init__(self, top_k: int = 20):
+        self.top_k = max(1, top_k)
+        # Min-heap of (seconds, sequence, entry): the fastest of the slowest on top
+        self.slowest: List[Tuple[float, int, Dict[str, Any]]] = []
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, params: Dict[str, Any], result: Dict[str, Any]):
+        """Account one generated (or rendered) invoice from its result's timings"""
+        timings = result.get("timings")
+        if not timings:
+            return
+        seconds = sum(timings.values())
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        bucket = max(0, int(math.log(max(seconds, BUCKET_BASE) / BUCKET_BASE) / BUCKET_GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+        if len(self.slowest) >= self.top_k and seconds <= self.slowest[0][0]:
+            return
+        # Only candidates pay for building the entry
+        entry = {
+            "seconds": round(seconds, 6),
+            "timings": {phase: round(value, 6) for phase, value in timings.items()},
+            "invoice_number": result["invoice"].invoice_number,
+            "page_count": result["page_count"],
+            "line_items": len(result["invoice"].line_items),
+            "injections": [
+                {"field": i["field"], "injection_type": i["injection_type"], "payload_length": len(i["payload"])}
+                for i in result["injections"]
+            ],
+            "render_cache": result.get("render_cache"),
+            "params": params,
+        }
+        item = (seconds, self.count, entry)
+        if len(self.slowest) < self.top_k:
+            heapq.heappush(self.slowest, item)
+        else:
+            heapq.heapreplace(self.slowest, item)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of invoices"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(BUCKET_BASE * math.exp((bucket + 1) * BUCKET_GROWTH), self.max_seconds)
+        return self.max_seconds
+
+    def latency(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_seconds": self.total_seconds / self.count if self.count else 0.0,
+            "p50_seconds": self.percentile(0.5),
+            "p90_seconds": self.percentile(0.9),
+            "p99_seconds": self.percentile(0.99),
+            "max_seconds": self.max_seconds,
+        }
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """The slowest invoices, slowest first"""
+        return [entry for _, _, entry in sorted(self.slowest, key=lambda item: -item[0])]
+
+    def write(self, path: Path, generator_config: Dict[str, Any]):
+        """Write the replay file"""
+        with atomic_file(Path(path), "w") as f:
+            json.dump({
+                "generator": generator_config,
+                "top_k": self.top_k,
+                "latency": self.latency(),
+                "invoices": self.entries(),
+            }, f, indent=2)
+
+    def describe(self) -> str:
+        latency = self.latency()
+        slowest = self.entries()[:1]
+        worst = ""
+        if slowest:
+            phase, seconds = max(slowest[0]["timings"].items(), key=lambda item: item[1])
+            worst = f"; slowest {slowest[0]['seconds']:.3f}s, {seconds:.3f}s of it in {phase}"
+        return (f"p50 {latency['p50_seconds'] * 1000:.1f} ms, p99 {latency['p99_seconds'] * 1000:.1f} ms, "
+                f"max {latency['max_seconds'] * 1000:.1f} ms{worst}")
+
+
+def replay(trace_path: str, output_dir: str, top: Optional[int] = None, sort: str = "cumulative",
+           lines: int = 25, per_invoice: bool = False, profile_output: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Regenerate the invoices of a replay file under cProfile and print the profile;
+    returns per-invoice replay timings and whether each invoice came out the same
+    """
+    with open(trace_path) as f:
+        trace = json.load(f)
+    entries = trace["invoices"][:top] if top else trace["invoices"]
+    # Fresh output, and no cache: a cache hit would skip the work being profiled
+    config = {**trace["generator"], "output_dir": output_dir, "render_cache": None, "run_id": None}
+    generator = InvoiceGenerator(**config)
+    if not entries:
+        return {"invoices": []}
+
+    # Warm-up outside the profile: font registration, templates and image XObjects are per-process costs
+    generator.render_invoice(**entries[0]["params"])
+
+    combined: Optional[pstats.Stats] = None
+    replayed = []
+    for i, entry in enumerate(entries, 1):
+        params = entry["params"]
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        result = generator.generate_invoice(**params)
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        reproduced = result["invoice"].invoice_number == entry["invoice_number"]
+        replayed.append({"document_id": params["document_id"], "recorded_seconds": entry["seconds"],
+                         "replay_seconds": elapsed, "reproduced": reproduced, "pdf_path": result["pdf_path"]})
+        print(f"[Replay] {i}/{len(entries)} document {params['document_id']} "
+              f"({entry['page_count']} pages, rotation {params.get('rotation', 0)}°, "
+              f"{len(entry['injections'])} injections): {elapsed:.3f}s under the profiler, "
+              f"recorded {entry['seconds']:.3f}s{'' if reproduced else ' ✗ invoice differs from the recorded one'}")
+        if per_invoice:
+            _print_stats(pstats.Stats(profiler), sort, min(lines, 10))
+        if combined is None:
+            combined = pstats.Stats(profiler)
+        else:
+            combined.add(profiler)
+
+    if profile_output:
+        combined.dump_stats(profile_output)
+    print()
+    print(f"[Replay] Profile of {len(entries)} invoices, top {lines} by {sort}:")
+    _print_stats(combined, sort, lines)
+    return {"invoices": replayed, "profile": profile_output}
+
+
+def _print_stats(stats: pstats.Stats, sort: str, lines: int):
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.strip_dirs().sort_stats(sort).print_stats(lines)
+    print(stream.getvalue().strip("\n"))
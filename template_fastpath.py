@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Template fast path for single-page invoices
+A single-page invoice always has the same geometry: title, From/To block,
+3-4 detail rows and an items table of at most 15 rows with fixed column widths.
+Instead of running platypus layout and ReportLab's PDF serializer for every
+invoice, the layout is compiled once per page size and layout variant (PO row,
+item count, shipping row) into a content-stream template: static operators
+(title, labels, backgrounds, grid) with slots for each text field. Filling a
+template only measures and places the values, using the embedded fonts' glyph
+widths for right alignment.
+
+The two DejaVu fonts are embedded as fixed printable-ASCII subsets, built once
+per process, so the PDF objects around the content stream are static too.
+The page transform (rotation/offset) is applied as a cm operator in the content
+stream, which replaces the flatten_pdf round trip.
+
+fill() returns None when an invoice doesn't fit the template (header text that
+would wrap, characters outside printable ASCII, ...); the caller then renders
+it with platypus as before. Geometry mirrors create_invoice_pdf's styles; check
+it with `python benchmarks.py fast-path` after changing them.
+"""
+
+import re
+import zlib
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import FF_NONSYMBOLIC, FF_SYMBOLIC, SUBSETN, makeToUnicodeCMap
+
+from invoice_records import Invoice
+from pdf_backends import Matrix
+
+REGULAR_FONT = "DejaVuSans"
+BOLD_FONT = "DejaVuSans-Bold"
+
+# Character codes of the embedded subsets: printable ASCII maps to itself
+SUBSET = [0] * 32 + list(range(32, 127))
+_PRINTABLE = re.compile(r"[ -~]*\Z")
+_LITERAL_ESCAPES = str.maketrans({"\\": "\\\\", "(": "\\(", ")": "\\)"})
+
+# Layout of create_invoice_pdf (points)
+MARGIN = 0.75 * inch
+FRAME_PADDING = 6
+TITLE_SIZE, TITLE_LEADING, TITLE_SPACE_AFTER = 24, 28, 12
+HEADER_SIZE, HEADER_LEADING, HEADER_BOTTOM_PADDING = 10, 12, 12
+HEADER_COLUMN = 3.25 * inch
+DETAIL_COLUMNS = (2 * inch, 4.5 * inch)
+DETAIL_ROW, DETAIL_BOTTOM_PADDING = 21, 6
+ITEM_COLUMNS = (3.5 * inch, 0.75 * inch, 1 * inch, 1.25 * inch)
+ITEM_HEADER_ROW, ITEM_ROW = 28, 18
+CELL_PADDING, CELL_LEADING = 6, 12
+MAX_ITEMS = 15
+
+TITLE_COLOR = b".101961 .329412 .564706"
+HEADER_TEXT_COLOR = b".2 .2 .2"
+ITEM_HEADER_TEXT_COLOR = b".960784 .960784 .960784"
+ROW_COLORS = (b"1 1 1", b".941176 .941176 .941176")
+GRID_COLOR = b".501961 .501961 .501961"
+
+# Object numbers: 1-4 per document, 5-12 the static font objects, 13 info
+_FONT_OBJECTS = 5
+_INFO_OBJECT = 13
+_OBJECT_COUNT = 13
+
+
+def _fmt(value: float) -> str:
+    text = ("%.4f" % value).rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _pdf_object(number: int, body: bytes) -> bytes:
+    return b"%d 0 obj\n" % number + body + b"\nendobj\n"
+
+
+def _pdf_stream(number: int, data: bytes, extra: bytes = b"") -> bytes:
+    data = zlib.compress(data)
+    return _pdf_object(number, b"<< /Filter /FlateDecode /Length %d%s >>\nstream\n" % (len(data), extra)
+                       + data + b"\nendstream")
+
+
+class EmbeddedFont(NamedTuple):
+    resource: str
+    widths: List[float]
+    objects: List[bytes]
+
+    def width(self, text: str, size: float) -> float:
+        return sum(map(self.widths.__getitem__, text.encode("ascii"))) * size / 1000
+
+
+def _embed_font(font_name: str, resource: str, first_object: int) -> EmbeddedFont:
+    """Font dict, ToUnicode CMap, descriptor and subset font file of a registered TrueType font"""
+    face = pdfmetrics.getFont(font_name).face
+    base_font = (SUBSETN(0) + b"+" + face.name + face.subfontNameX).decode("ascii")
+    widths = [face.getCharWidth(code) for code in SUBSET]
+    font_dict, cmap, descriptor, font_file = range(first_object, first_object + 4)
+    subset_font = face.makeSubset(SUBSET)
+    flags = (face.flags & ~FF_NONSYMBOLIC) | FF_SYMBOLIC
+    objects = [
+        _pdf_object(font_dict, (
+            f"<< /Type /Font /Subtype /TrueType /Name /{resource} /BaseFont /{base_font} "
+            f"/FirstChar 0 /LastChar {len(SUBSET) - 1} /Widths [{' '.join(_fmt(w) for w in widths)}] "
+            f"/ToUnicode {cmap} 0 R /FontDescriptor {descriptor} 0 R >>").encode("ascii")),
+        _pdf_stream(cmap, makeToUnicodeCMap(base_font, SUBSET).encode("ascii")),
+        _pdf_object(descriptor, (
+            f"<< /Type /FontDescriptor /FontName /{base_font} /Ascent {face.ascent} /CapHeight {face.capHeight} "
+            f"/Descent {face.descent} /Flags {flags} /FontBBox [{' '.join(str(v) for v in face.bbox)}] "
+            f"/ItalicAngle {face.italicAngle} /StemV {face.stemV} /MissingWidth {_fmt(face.defaultWidth)} "
+            f"/FontFile2 {font_file} 0 R >>").encode("ascii")),
+        _pdf_stream(font_file, subset_font, b" /Length1 %d" % len(subset_font)),
+    ]
+    return EmbeddedFont(resource, [widths[code] if code < len(widths) else 0 for code in range(128)], objects)
+
+
+class Slot(NamedTuple):
+    """A text field: font, size and anchor (left edge, or right edge when right-aligned)"""
+    font: EmbeddedFont
+    size: float
+    x: float
+    y: float
+    right_aligned: bool = False
+
+
+class SinglePageTemplate:
+    """Compiled single-page layout for one page size"""
+
+    def __init__(self, page_size: Tuple[float, float], regular: EmbeddedFont, bold: EmbeddedFont,
+                 static_objects: bytes, static_offsets: List[int]):
+        self.width, self.height = page_size
+        self.regular, self.bold = regular, bold
+        self.frame_x = MARGIN + FRAME_PADDING
+        self.frame_width = self.width - 2 * MARGIN - 2 * FRAME_PADDING
+        self.frame_top = self.height - MARGIN - FRAME_PADDING
+        self.frame_bottom = MARGIN + FRAME_PADDING
+        # All three tables are 6.5in wide and centred in the frame
+        self.table_x = self.frame_x + (self.frame_width - sum(ITEM_COLUMNS)) / 2
+        self.header_width = HEADER_COLUMN - 2 * CELL_PADDING
+        self._variants: Dict[Tuple[bool, int, bool], List[Any]] = {}
+
+        self.prefix = b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n"
+        self.prefix_offsets = []
+        for number, body in (
+            (1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+            (2, b"<< /Type /Pages /Kids [ 3 0 R ] /Count 1 >>"),
+            (3, (f"<< /Type /Page /Parent 2 0 R /MediaBox [ 0 0 {_fmt(self.width)} {_fmt(self.height)} ] "
+                 f"/Resources << /Font << /{regular.resource} {_FONT_OBJECTS} 0 R "
+                 f"/{bold.resource} {_FONT_OBJECTS + 4} 0 R >> /ProcSet [ /PDF /Text ] >> "
+                 f"/Contents 4 0 R >>").encode("ascii")),
+        ):
+            self.prefix_offsets.append(len(self.prefix))
+            self.prefix += _pdf_object(number, body)
+        self.static_objects = static_objects
+        self.static_offsets = static_offsets
+
+    def _text(self, font: EmbeddedFont, size: float, x: float, y: float, text: str) -> bytes:
+        return (f"BT /{font.resource} {size} Tf {_fmt(x)} {_fmt(y)} Td ("
+                f"{text.translate(_LITERAL_ESCAPES)}) Tj ET\n").encode("ascii")
+
+    def _right(self, font: EmbeddedFont, size: float, right: float, y: float, text: str) -> bytes:
+        return self._text(font, size, right - font.width(text, size), y, text)
+
+    def _compile(self, has_po: bool, items: int, shipping: bool) -> Optional[List[Any]]:
+        """Static operators and slots, in drawing order, for one layout variant"""
+        parts: List[Any] = []
+        x0 = self.table_x
+        y = self.frame_top
+
+        # Title, centred in the frame
+        title_width = self.bold.width("INVOICE", TITLE_SIZE)
+        y -= TITLE_LEADING
+        parts.append(b"q\n" + TITLE_COLOR + b" rg\n")
+        parts.append(self._text(self.bold, TITLE_SIZE, self.frame_x + (self.frame_width - title_width) / 2,
+                                y + TITLE_LEADING - TITLE_SIZE, "INVOICE"))
+        y -= TITLE_SPACE_AFTER + 0.3 * inch
+
+        # From/To paragraphs: label, name and two address lines each
+        parts.append(HEADER_TEXT_COLOR + b" rg\n")
+        for column, label in enumerate(("From:", "To:")):
+            x = x0 + column * HEADER_COLUMN + CELL_PADDING
+            baseline = y - HEADER_SIZE
+            parts.append(self._text(self.regular, HEADER_SIZE, x, baseline, label))
+            for line in range(1, 4):
+                parts.append(Slot(self.regular, HEADER_SIZE, x, baseline - line * HEADER_LEADING))
+        y -= 4 * HEADER_LEADING + HEADER_BOTTOM_PADDING + 0.2 * inch
+
+        # Invoice details
+        parts.append(b"0 0 0 rg\n")
+        labels = ["Invoice Number:", "Invoice Date:", "Due Date:"] + (["PO Number:"] if has_po else [])
+        for label in labels:
+            y -= DETAIL_ROW
+            baseline = y + DETAIL_BOTTOM_PADDING + CELL_LEADING - 10
+            parts.append(self._text(self.bold, 10, x0 + CELL_PADDING, baseline, label))
+            parts.append(Slot(self.regular, 10, x0 + DETAIL_COLUMNS[0] + CELL_PADDING, baseline))
+        y -= 0.3 * inch
+
+        # Items table: header, items, totals
+        totals = ["Subtotal:"] + (["Shipping:"] if shipping else []) + ["Tax:", "Total:"]
+        rows = 1 + items + len(totals)
+        table_top = y
+        bottoms = [table_top - ITEM_HEADER_ROW - ITEM_ROW * row for row in range(rows)]
+        if bottoms[-1] < self.frame_bottom:
+            return None
+        table_width = sum(ITEM_COLUMNS)
+        lefts = [x0 + sum(ITEM_COLUMNS[:i]) for i in range(len(ITEM_COLUMNS))]
+        rights = [left + width - CELL_PADDING for left, width in zip(lefts, ITEM_COLUMNS)]
+
+        backgrounds = [b"1 0 0 1 %s %s cm\n" % (_fmt(x0).encode(), _fmt(table_top).encode())]
+        backgrounds.append(b"%s rg\nn 0 0 %s %d re f*\n" % (TITLE_COLOR, _fmt(table_width).encode(), -ITEM_HEADER_ROW))
+        # Row backgrounds stop five rows from the end, as in the platypus table style
+        for row in range(1, rows - 4):
+            top = bottoms[row - 1] - table_top
+            backgrounds.append(b"%s rg\nn 0 %s %s %d re f*\n" % (
+                ROW_COLORS[(row - 1) % 2], _fmt(top).encode(), _fmt(table_width).encode(), -ITEM_ROW))
+        parts.append(b"q\n" + b"".join(backgrounds) + b"Q\n")
+
+        parts.append(ITEM_HEADER_TEXT_COLOR + b" rg\n")
+        header_baseline = bottoms[0] + 8 + CELL_LEADING - 10
+        parts.append(self._text(self.bold, 10, lefts[0] + CELL_PADDING, header_baseline, "Description"))
+        for column, label in enumerate(("Qty", "Unit Price", "Amount"), 1):
+            parts.append(self._right(self.bold, 10, rights[column], header_baseline, label))
+
+        parts.append(b"0 0 0 rg\n")
+        for row in range(1, rows):
+            # The last four rows are bold: the totals, plus the last item when there's no shipping row
+            font = self.bold if row >= rows - 4 else self.regular
+            baseline = bottoms[row] + 3 + CELL_LEADING - 9
+            if row <= items:
+                parts.append(Slot(font, 9, lefts[0] + CELL_PADDING, baseline))
+                for column in range(1, 4):
+                    parts.append(Slot(font, 9, rights[column], baseline, True))
+            else:
+                parts.append(self._right(font, 9, rights[2], baseline, totals[row - items - 1]))
+                parts.append(Slot(font, 9, rights[3], baseline, True))
+
+        grid = [b"q\n1 J\n1 j\n", GRID_COLOR, b" RG\n.5 w\n"]
+        table_bottom = bottoms[-1]
+        for line_y in [table_top] + bottoms:
+            grid.append(b"n %s %s m %s %s l S\n" % (_fmt(x0).encode(), _fmt(line_y).encode(),
+                                                      _fmt(x0 + table_width).encode(), _fmt(line_y).encode()))
+        for line_x in lefts + [x0 + table_width]:
+            grid.append(b"n %s %s m %s %s l S\n" % (_fmt(line_x).encode(), _fmt(table_bottom).encode(),
+                                                      _fmt(line_x).encode(), _fmt(table_top).encode()))
+        grid.append(b"Q\nQ\n")
+        parts.append(b"".join(grid))
+
+        # Merge adjacent static operators
+        merged: List[Any] = []
+        for part in parts:
+            if isinstance(part, bytes) and merged and isinstance(merged[-1], bytes):
+                merged[-1] += part
+            else:
+                merged.append(part)
+        return merged
+
+    def variant(self, has_po: bool, items: int, shipping: bool) -> Optional[List[Any]]:
+        key = (has_po, items, shipping)
+        if key not in self._variants:
+            self._variants[key] = self._compile(has_po, items, shipping)
+        return self._variants[key]
+
+    def fill(self, invoice: Invoice, escape: Callable[[str], str], matrix: Optional[Matrix] = None) -> Optional[bytes]:
+        """
+        PDF bytes for an invoice, or None if it doesn't fit the template.
+        escape is the generator's HTML escaping, which the platypus layout applies
+        to the table cells; matrix is the page transform (see pdf_backends.page_matrix).
+        """
+        # Paragraphs collapse whitespace; anything that would wrap or add lines falls back
+        header = []
+        for name, address in ((invoice.vendor_name, invoice.vendor_address),
+                              (invoice.customer_name, invoice.customer_address)):
+            lines = [" ".join(name.split())] + [" ".join(line.split()) for line in address.split("\n")]
+            if len(lines) != 3 or not all(lines):
+                return None
+            header += lines
+
+        po_number = invoice.po_number
+        values = header + [escape(str(invoice.invoice_number)), invoice.invoice_date, invoice.due_date]
+        if po_number:
+            values.append(escape(str(po_number)))
+        items = invoice.line_items[:MAX_ITEMS]
+        for item in items:
+            values += [escape(item.description), str(item.quantity),
+                       f"${item.unit_price:.2f}", f"${item.total:.2f}"]
+        shipping = invoice.shipping > 0
+        values.append(f"${invoice.subtotal:.2f}")
+        if shipping:
+            values.append(f"${invoice.shipping:.2f}")
+        values += [f"${invoice.tax:.2f}", f"${invoice.total:.2f}"]
+
+        if not _PRINTABLE.match("".join(values)):
+            return None
+        if any(self.regular.width(line, HEADER_SIZE) > self.header_width for line in header):
+            return None
+        parts = self.variant(bool(po_number), len(items), shipping)
+        if parts is None:
+            return None
+
+        # Full precision for the transform: rounding errors grow with distance from the origin
+        content = [b"q\n" + " ".join("%.6f" % v for v in matrix).encode("ascii") + b" cm\n"] if matrix else []
+        values_iter = iter(values)
+        for part in parts:
+            if isinstance(part, bytes):
+                content.append(part)
+                continue
+            text = next(values_iter)
+            x = part.x - part.font.width(text, part.size) if part.right_aligned else part.x
+            content.append(self._text(part.font, part.size, x, part.y, text))
+        if matrix:
+            content.append(b"Q\n")
+
+        pdf = bytearray(self.prefix)
+        offsets = list(self.prefix_offsets)
+        offsets.append(len(pdf))
+        pdf += _pdf_stream(4, b"".join(content))
+        base = len(pdf)
+        offsets += [base + offset for offset in self.static_offsets]
+        pdf += self.static_objects
+        xref = len(pdf)
+        pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (_OBJECT_COUNT + 1)
+        pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        pdf += b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            _OBJECT_COUNT + 1, _INFO_OBJECT, xref)
+        return bytes(pdf)
+
+
+# Per-process state: the embedded fonts and one template per page size
+_static: Optional[Tuple[EmbeddedFont, EmbeddedFont, bytes, List[int]]] = None
+_templates: Dict[Tuple[float, float], SinglePageTemplate] = {}
+
+
+def available() -> bool:
+    """Whether the DejaVu fonts the template embeds are registered"""
+    try:
+        pdfmetrics.getFont(REGULAR_FONT)
+        pdfmetrics.getFont(BOLD_FONT)
+    except KeyError:
+        return False
+    return True
+
+
+def get_template(page_size: Tuple[float, float]) -> SinglePageTemplate:
+    """Compiled template for a page size (fonts and templates are built once per process)"""
+    global _static
+    if _static is None:
+        regular = _embed_font(REGULAR_FONT, "F1", _FONT_OBJECTS)
+        bold = _embed_font(BOLD_FONT, "F2", _FONT_OBJECTS + 4)
+        objects = regular.objects + bold.objects + [
+            _pdf_object(_INFO_OBJECT, b"<< /Producer (generate_invoices.py template fast path) >>")]
+        offsets, position = [], 0
+        for body in objects:
+            offsets.append(position)
+            position += len(body)
+        _static = (regular, bold, b"".join(objects), offsets)
+    key = tuple(page_size)
+    if key not in _templates:
+        _templates[key] = SinglePageTemplate(key, *_static)
+    return _templates[key]
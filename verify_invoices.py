@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Round-trip verification of generated PDFs against their JSON ground truth
+Extracts the text of each PDF and checks that the invoice number, totals and
+line-item amounts from the metadata actually appear in it. Escaping of
+dangerous payloads and the rotation transforms are the usual suspects when
+they don't.
+
+Runs on a process pool and supports sampled verification for huge corpora.
+Metadata may be plain .json, .json.gz or NDJSON shards (see compressed_output.py);
+batch-scan bundles (see bundle_writer.py) and packs (see pack_files.py) are
+verified through their indexes.
+"""
+
+import io
+import json
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+
+from compressed_output import iter_shard, open_metadata
+
+
+def _squash(text: str) -> str:
+    # Text extraction inserts line breaks and spaces where the layout splits
+    # strings, so compare with all whitespace removed
+    return "".join(text.split())
+
+
+def expected_values(extracted_data: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(field, rendered text) pairs that must appear in the PDF"""
+    values = [
+        ("invoiceNumber", str(extracted_data["invoiceNumber"])),
+        ("invoiceSubtotal", f"${extracted_data['invoiceSubtotal']:.2f}"),
+        ("invoiceTax", f"${extracted_data['invoiceTax']:.2f}"),
+        ("invoiceTotal", f"${extracted_data['invoiceTotal']:.2f}"),
+    ]
+    if extracted_data.get("invoiceShipping", 0) > 0:
+        values.append(("invoiceShipping", f"${extracted_data['invoiceShipping']:.2f}"))
+    for i, item in enumerate(extracted_data["lineItems"]):
+        values.append((f"lineItems[{i}].total", f"${item['total']:.2f}"))
+    return values
+
+
+# Bundle last opened by this process; a bundle's invoices are verified back to back
+_bundle: Tuple[Optional[str], Optional[PdfReader]] = (None, None)
+
+
+def _read_pages(pdf_path: str) -> List[Any]:
+    """
+    Pages of a PDF reference: a file, a bundle page range (<bundle>#pages=A-B)
+    or a pack byte range (<segment>#offset=N&length=M)
+    """
+    global _bundle
+    path, _, fragment = pdf_path.partition("#")
+    if fragment.startswith("pages="):
+        if _bundle[0] != path:
+            _bundle = (path, PdfReader(path))
+        first, last = (int(n) for n in fragment[len("pages="):].split("-"))
+        return _bundle[1].pages[first - 1:last]
+    if fragment.startswith("offset="):
+        return list(PdfReader(io.BytesIO(_read_range(pdf_path))).pages)
+    return list(PdfReader(path).pages)
+
+
+def _read_range(reference: str) -> bytes:
+    """Bytes of a pack reference, <segment>#offset=N&length=M"""
+    path, _, fragment = reference.partition("#")
+    fields = dict(part.split("=") for part in fragment.split("&"))
+    with open(path, "rb") as f:
+        f.seek(int(fields["offset"]))
+        return f.read(int(fields["length"]))
+
+
+def verify_document(json_path: str, pdf_path: str, metadata_text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Verify one PDF against its metadata JSON. metadata_text is the record itself
+    for NDJSON shards, bundle indexes and packs. For shards pdf_path is the PDF
+    directory and the file name comes from the record; for bundles and packs it
+    carries a page or byte range (see _read_pages).
+    """
+    result = {"json_path": json_path, "pdf_path": pdf_path, "pages": 0, "mismatches": []}
+    try:
+        if metadata_text is None:
+            with open_metadata(json_path) as f:
+                metadata = json.load(f)
+        else:
+            metadata = json.loads(metadata_text)
+        payload = json.loads(metadata["extractedEntitiesPayload"])
+        extracted_data = payload["extractedData"]
+        if metadata_text is not None and "#" not in pdf_path:
+            pdf_path = result["pdf_path"] = str(Path(pdf_path) / extracted_data["imagePrefixes"][0])
+
+        pages = _read_pages(pdf_path)
+        result["pages"] = len(pages)
+        text = _squash("".join(page.extract_text() for page in pages))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    # Pack records carry no loose file: their image URLs must name the record's own byte range
+    if "#offset=" in pdf_path:
+        for field, urls in (("imageUrls", extracted_data["imageUrls"]),
+                            ("pdfImages.imageUrls", extracted_data["pdfImages"]["imageUrls"])):
+            url = urls[0] if urls else ""
+            try:
+                resolves = url.startswith("file://") and _read_range(url[len("file://"):]) == _read_range(pdf_path)
+            except (OSError, ValueError, KeyError):
+                resolves = False
+            if not resolves:
+                result["mismatches"].append({"field": field, "expected": pdf_path, "actual": url})
+
+    # Line-item amounts can legitimately repeat, so check them as a multiset
+    remaining = text
+    for field, value in expected_values(extracted_data):
+        needle = _squash(value)
+        if field.startswith("lineItems"):
+            position = remaining.find(needle)
+            if position >= 0:
+                remaining = remaining[:position] + remaining[position + len(needle):]
+                continue
+        elif needle in text:
+            continue
+        result["mismatches"].append({"field": field, "expected": value})
+    return result
+
+
+def _verify_chunk(pairs: List[Tuple[str, str, Optional[str]]]) -> List[Dict[str, Any]]:
+    return [verify_document(*pair) for pair in pairs]
+
+
+def _sampled(name: str, sample: float) -> bool:
+    # Deterministic: the same files are picked on every run for the same rate
+    return zlib.crc32(name.encode("utf-8")) < sample * 0x100000000
+
+
+def find_documents(output_dir: str, sample: float = 1.0) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """Yield verify_document arguments for every invoice in a generator output directory"""
+    output_dir = Path(output_dir)
+    pdf_dir = output_dir / "pdfs"
+    json_dir = output_dir / "json"
+    for json_path in sorted(json_dir.iterdir()) if json_dir.is_dir() else []:
+        name = json_path.name
+        if name.startswith("."):
+            # Temp file of a write in progress
+            continue
+        if name.endswith((".ndjson.gz", ".ndjson.xz")):
+            for line_number, text in iter_shard(str(json_path)):
+                reference = f"{json_path}#line={line_number}"
+                if sample >= 1.0 or _sampled(reference, sample):
+                    yield reference, str(pdf_dir), text
+            continue
+        if not name.endswith((".json", ".json.gz")):
+            continue
+        if sample < 1.0 and not _sampled(name, sample):
+            continue
+        stem = name[:-len(".json.gz")] if name.endswith(".json.gz") else name[:-len(".json")]
+        yield str(json_path), str(pdf_dir / f"{stem}.pdf"), None
+
+    # Bundles: one index line (page range and metadata) per invoice
+    for index_path in sorted((output_dir / "bundles").glob("*.index.ndjson")):
+        bundle_path = index_path.with_name(index_path.name[:-len(".index.ndjson")] + ".pdf")
+        with open(index_path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                reference = f"{index_path}#line={line_number}"
+                if not line.strip() or (sample < 1.0 and not _sampled(reference, sample)):
+                    continue
+                entry = json.loads(line)
+                yield (reference, f"{bundle_path}#pages={entry['first_page']}-{entry['last_page']}",
+                       json.dumps(entry["metadata"]))
+
+    # Packs: PDF and metadata byte ranges from the index
+    from pack_files import INDEX_NAME, PackReader, segment_name
+    for index_path in sorted(output_dir.glob(f"pack*/{INDEX_NAME}")):
+        with PackReader(str(index_path.parent)) as pack:
+            for record in pack:
+                entry = record.entry
+                segment = index_path.parent / segment_name(entry.segment)
+                reference = f"{segment}#offset={entry.offset}&length={entry.pdf_length}"
+                if sample < 1.0 and not _sampled(reference, sample):
+                    continue
+                text = bytes(record.json).decode("utf-8")
+                # Release the views before yielding, so the pack can close if the caller stops early
+                del record
+                yield (f"{segment}#offset={entry.offset + entry.pdf_length}&length={entry.json_length}",
+                       reference, text)
+
+
+def verify_corpus(
+    output_dir: str,
+    workers: Optional[int] = None,
+    sample: float = 1.0,
+    chunk_size: int = 16,
+    max_reported: int = 100
+) -> Dict[str, Any]:
+    """Verify every (or a sample of every) generated invoice; returns the report"""
+    start = time.perf_counter()
+    checked = pages = 0
+    failed: List[Dict[str, Any]] = []
+    failed_count = 0
+    field_failures: Dict[str, int] = {}
+
+    # Bounded window of chunks in flight: shard, bundle and pack records carry their
+    # metadata, so reading ahead of the workers would hold the corpus in memory
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 4
+    documents = find_documents(output_dir, sample)
+    pending: Deque[Future] = deque()
+
+    def results() -> Iterator[Dict[str, Any]]:
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(islice(documents, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_verify_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in results():
+            checked += 1
+            pages += result["pages"]
+            if result["mismatches"] or "error" in result:
+                failed_count += 1
+                for mismatch in result["mismatches"]:
+                    field = mismatch["field"].split("[")[0]
+                    field_failures[field] = field_failures.get(field, 0) + 1
+                if "error" in result:
+                    field_failures["error"] = field_failures.get("error", 0) + 1
+                if len(failed) < max_reported:
+                    failed.append(result)
+            if checked % 1000 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"[{checked}] verified ({checked / elapsed:.1f} docs/s, {failed_count} failed)")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "output_directory": str(Path(output_dir).absolute()),
+        "sample_rate": sample,
+        "documents_checked": checked,
+        "pages_checked": pages,
+        "documents_failed": failed_count,
+        "failures_by_field": field_failures,
+        "elapsed_seconds": elapsed,
+        "documents_per_second": checked / elapsed if elapsed > 0 else 0.0,
+        "pages_per_second": pages / elapsed if elapsed > 0 else 0.0,
+        "verified_at": datetime.now().isoformat(),
+        "failures": failed,
+    }
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Shared work queue
+Lets any number of generator processes, on one host or several, share one job
+through an SQLite file on a shared volume, with no other services:
+
+- publish: a job is a range of invoice indices split into chunks
+- work:    processes lease a chunk, renew the lease while generating it with
+           generate_batch, then mark it done; chunks whose lease expired (the
+           worker died) are leased again by someone else
+- status:  completion, per-worker progress and throughput, queryable any time
+
+Jobs are always seeded, so a re-leased chunk renders exactly the invoices the
+dead worker would have written, overwriting any partial output.
+
+The database uses the rollback journal rather than WAL because WAL needs shared
+memory, which network filesystems don't provide. Lease expiry compares wall
+clocks, so hosts should be NTP-synced; keep --lease-seconds well above the
+clock skew.
+"""
+
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL,
+    pages INTEGER,
+    PRIMARY KEY (job_id, chunk_id)
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_status ON chunks (job_id, status, lease_expires);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """SQLite-backed chunk queue; every method is a short transaction, so many processes can share it"""
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: transactions are explicit (BEGIN IMMEDIATE takes the write lock up front)
+        self.conn = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def _write(self, sql: str, args=()) -> sqlite3.Cursor:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self.conn.execute(sql, args)
+                self.conn.execute("COMMIT")
+                return cursor
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def publish(self, job_id: str, count: int, chunk_size: int, settings: Dict[str, Any]):
+        """Create a job of `count` invoices split into chunks of `chunk_size` indices"""
+        chunk_size = max(1, chunk_size)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone():
+                    raise ValueError(f"Job '{job_id}' already exists in {self.path}")
+                self.conn.execute(
+                    "INSERT INTO jobs (job_id, count, chunk_size, settings, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, count, chunk_size, json.dumps(settings), time.time())
+                )
+                self.conn.executemany(
+                    "INSERT INTO chunks (job_id, chunk_id, start, stop) VALUES (?, ?, ?, ?)",
+                    ((job_id, n, start, min(start + chunk_size, count))
+                     for n, start in enumerate(range(0, count, chunk_size)))
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def jobs(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT job_id FROM jobs ORDER BY created_at")]
+
+    def job(self, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """A job's definition; the most recent job when job_id is None"""
+        with self.lock:
+            if job_id is None:
+                row = self.conn.execute(
+                    "SELECT job_id, count, chunk_size, settings FROM jobs ORDER BY created_at DESC LIMIT 1"
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT job_id, count, chunk_size, settings FROM jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()
+        if row is None:
+            raise ValueError(f"No job {f'{job_id!r} ' if job_id else ''}in {self.path}")
+        return {"job_id": row[0], "count": row[1], "chunk_size": row[2], "settings": json.loads(row[3])}
+
+    def lease(self, job_id: str, worker: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Lease the next pending chunk, or one whose lease expired; None if nothing is available"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT chunk_id, start, stop, attempts FROM chunks WHERE job_id = ? AND "
+                    "(status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                    "ORDER BY chunk_id LIMIT 1",
+                    (job_id, now)
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE chunks SET status = 'leased', worker = ?, lease_expires = ?, "
+                        "attempts = attempts + 1, started_at = ? WHERE job_id = ? AND chunk_id = ?",
+                        (worker, now + lease_seconds, now, job_id, row[0])
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"chunk_id": row[0], "start": row[1], "stop": row[2], "attempt": row[3] + 1}
+
+    def renew(self, job_id: str, chunk_id: int, worker: str, lease_seconds: float) -> bool:
+        """Extend a lease; False if the worker no longer holds it (it expired and was re-leased)"""
+        cursor = self._write(
+            "UPDATE chunks SET lease_expires = ? WHERE job_id = ? AND chunk_id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease_seconds, job_id, chunk_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, chunk_id: int, worker: str, pages: int) -> bool:
+        """Mark a chunk done; the output is deterministic, so a late finisher's result is as good as any"""
+        cursor = self._write(
+            "UPDATE chunks SET status = 'done', worker = ?, lease_expires = NULL, finished_at = ?, pages = ? "
+            "WHERE job_id = ? AND chunk_id = ? AND status != 'done'",
+            (worker, time.time(), pages, job_id, chunk_id)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, job_id: str, chunk_id: int, worker: str):
+        """Give a chunk back unfinished (e.g. on Ctrl-C) so it's re-leased immediately"""
+        self._write(
+            "UPDATE chunks SET status = 'pending', lease_expires = NULL "
+            "WHERE job_id = ? AND chunk_id = ? AND worker = ? AND status = 'leased'",
+            (job_id, chunk_id, worker)
+        )
+
+    def status(self, job_id: Optional[str] = None, window: float = 60.0) -> Dict[str, Any]:
+        """Completion and throughput of a job (the most recent one when job_id is None)"""
+        job = self.job(job_id)
+        job_id = job["job_id"]
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, worker, lease_expires, attempts, start, stop, started_at, finished_at, pages "
+                "FROM chunks WHERE job_id = ?", (job_id,)
+            ).fetchall()
+
+        chunks = {"pending": 0, "leased": 0, "expired": 0, "done": 0}
+        invoices_done = pages_done = recent = retried = 0
+        first_start = last_finish = None
+        workers: Dict[str, Dict[str, Any]] = {}
+        for status, worker, lease_expires, attempts, start, stop, started_at, finished_at, pages in rows:
+            if status == "leased" and lease_expires < now:
+                status = "expired"
+            chunks[status] += 1
+            if attempts > 1:
+                retried += 1
+            if started_at is not None:
+                first_start = started_at if first_start is None else min(first_start, started_at)
+            if worker is not None and status in ("leased", "done"):
+                stats = workers.setdefault(worker, {"chunks_done": 0, "invoices_done": 0, "leased": 0})
+                if status == "leased":
+                    stats["leased"] += 1
+            if status == "done":
+                size = stop - start
+                invoices_done += size
+                pages_done += pages or 0
+                stats["chunks_done"] += 1
+                stats["invoices_done"] += size
+                last_finish = finished_at if last_finish is None else max(last_finish, finished_at)
+                if finished_at >= now - window:
+                    recent += size
+
+        elapsed = ((last_finish if chunks["done"] == len(rows) else now) - first_start) if first_start else 0.0
+        rate = invoices_done / elapsed if elapsed > 0 else 0.0
+        remaining = job["count"] - invoices_done
+        return {
+            "job_id": job_id,
+            "count": job["count"],
+            "chunk_size": job["chunk_size"],
+            "chunks": chunks,
+            "chunks_total": len(rows),
+            "chunks_retried": retried,
+            "invoices_done": invoices_done,
+            "pages_done": pages_done,
+            "percent_complete": invoices_done / job["count"] * 100 if job["count"] else 100.0,
+            "elapsed_seconds": elapsed,
+            "invoices_per_second": rate,
+            "recent_invoices_per_second": recent / window,
+            "eta_seconds": remaining / rate if rate > 0 and remaining else (0.0 if not remaining else None),
+            "complete": chunks["done"] == len(rows),
+            "workers": workers,
+            "checked_at": datetime.now().isoformat(),
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+class _LeaseKeeper(threading.Thread):
+    """Renews a chunk lease in the background while the chunk is generated"""
+
+    def __init__(self, work_queue_path: str, job_id: str, chunk_id: int, worker: str, lease_seconds: float):
+        super().__init__(daemon=True)
+        self.args = (job_id, chunk_id, worker, lease_seconds)
+        self.path = work_queue_path
+        self.interval = lease_seconds / 3
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        # A connection of its own: sqlite3 connections shouldn't be shared across threads
+        queue = WorkQueue(self.path)
+        try:
+            while not self.stopped.wait(self.interval):
+                if not queue.renew(*self.args):
+                    self.lost = True
+                    print(f"[WorkQueue] Lost the lease on chunk {self.args[1]}; another worker will redo it")
+                    return
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def work(
+    queue_path: str,
+    job_id: Optional[str] = None,
+    worker: Optional[str] = None,
+    lease_seconds: float = 120.0,
+    poll_seconds: float = 5.0,
+    index_path: Optional[str] = None,
+    exit_when_idle: bool = False
+) -> int:
+    """Lease and generate chunks until the job is complete; returns the number of chunks this worker did"""
+    from generate_invoices import InvoiceGenerator
+
+    worker = worker or default_worker_id()
+    queue = WorkQueue(queue_path)
+    job = queue.job(job_id)
+    job_id = job["job_id"]
+    settings = job["settings"]
+
+    workload = None
+    if settings.get("workload"):
+        from workload_profiles import load_workload
+        workload = load_workload(settings["workload"], settings.get("profiles"))
+    generator = InvoiceGenerator(**settings["generator"])
+    index = None
+    if index_path:
+        from corpus_index import CorpusIndex
+        index = CorpusIndex(index_path)
+    summary_dir = generator.output_dir / "summaries"
+    summary_dir.mkdir(exist_ok=True)
+
+    print(f"[WorkQueue] Worker {worker} joined job {job_id} ({job['count']} invoices in chunks of {job['chunk_size']})")
+    done = 0
+    try:
+        while True:
+            chunk = queue.lease(job_id, worker, lease_seconds)
+            if chunk is None:
+                status = queue.status(job_id)
+                if status["complete"] or exit_when_idle:
+                    break
+                # Everything left is leased by others; wait in case one of them dies
+                time.sleep(poll_seconds * random.uniform(0.5, 1.5))
+                continue
+
+            retry = f" (attempt {chunk['attempt']})" if chunk["attempt"] > 1 else ""
+            print(f"[WorkQueue] Chunk {chunk['chunk_id']}: invoices {chunk['start']}-{chunk['stop'] - 1}{retry}")
+            keeper = _LeaseKeeper(queue_path, job_id, chunk["chunk_id"], worker, lease_seconds)
+            keeper.start()
+            try:
+                results = generator.generate_batch(
+                    count=chunk["stop"] - chunk["start"],
+                    start=chunk["start"],
+                    seed=settings["seed"],
+                    multi_page_ratio=settings["multi_page_ratio"],
+                    rotation_ratio=settings["rotation_ratio"],
+                    offset_ratio=settings["offset_ratio"],
+                    workload=workload,
+                    index=index,
+                    summary_path=summary_dir / f"{job_id}_chunk_{chunk['chunk_id']:06d}.json"
+                )
+            except BaseException:
+                keeper.stop()
+                queue.release(job_id, chunk["chunk_id"], worker)
+                raise
+            keeper.stop()
+            queue.complete(job_id, chunk["chunk_id"], worker, sum(r["page_count"] for r in results))
+            done += 1
+    finally:
+        if index is not None:
+            index.close()
+        queue.close()
+
+    print(f"[WorkQueue] Worker {worker} finished: {done} chunks")
+    return done
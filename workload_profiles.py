@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Workload profiles
+Describes production document mixes as distributions over invoice parameters
+and compiles them into fast samplers for batch generation.
+
+A workload file is JSON with one or more named profiles:
+
+    {
+      "profiles": {
+        "retail": {
+          "weight": 70,
+          "pages": {"weights": {"1": 80, "2": 15, "3": 5}},
+          "items": {"randint": [3, 15]},
+          "rotation": {"weights": {"0": 90, "-2": 5, "2": 5}},
+          "offset": {"probability": 0.2, "x": {"uniform": [-20, 20]}, "y": {"uniform": [-20, 20]}},
+          "injection": {"vendorName": 0.3, "description": 0.1},
+          "layout": {"weights": {"letter": 90, "A4": 10}}
+        }
+      }
+    }
+
+Distribution specs:
+- a plain number/string: constant
+- {"weights": {value: weight, ...}} or {"values": [...], "weights": [...]}: discrete (alias table)
+- {"randint": [lo, hi]}: uniform integer, inclusive
+- {"uniform": [lo, hi]}: uniform float
+- {"normal": [mean, stddev], "clip": [lo, hi]}: clipped normal float
+
+"items" is optional; without it the item count is derived from the page count
+as in plain batch generation. With it, invoices get at least as many pages as
+their items need (15 rows on a single page, 20 per page otherwise).
+Continuous distributions for pages, items and rotation are rounded to integers.
+"""
+
+import json
+import random
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from generate_invoices import DEFAULT_INJECTION_RATES, PAGE_SIZES, min_pages
+
+
+Sampler = Callable[[], Any]
+
+
+class AliasTable:
+    """Vose alias table: O(1) sampling from a discrete weighted distribution"""
+
+    def __init__(self, values: Sequence[Any], weights: Sequence[float]):
+        if len(values) != len(weights) or not values:
+            raise ValueError("values and weights must be non-empty and of equal length")
+        total = float(sum(weights))
+        if total <= 0 or any(w < 0 for w in weights):
+            raise ValueError("weights must be non-negative with a positive sum")
+
+        n = len(values)
+        self.values = list(values)
+        self.n = n
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self) -> Any:
+        column = int(random.random() * self.n)
+        if random.random() < self.prob[column]:
+            return self.values[column]
+        return self.values[self.alias[column]]
+
+
+def _coerce(value: Any, kind: Optional[type]) -> Any:
+    # JSON object keys are always strings; turn "2" back into 2 for numeric fields
+    if kind is None or isinstance(value, kind):
+        return value
+    return kind(value)
+
+
+def compile_distribution(spec: Any, kind: Optional[type] = None) -> Sampler:
+    """Compile a distribution spec into a zero-argument sampler"""
+    if not isinstance(spec, dict):
+        constant = _coerce(spec, kind)
+        return lambda: constant
+
+    if "weights" in spec:
+        weights = spec["weights"]
+        if isinstance(weights, dict):
+            values = [_coerce(v, kind) for v in weights]
+            weights = list(weights.values())
+        else:
+            values = [_coerce(v, kind) for v in spec["values"]]
+        if len(values) == 1:
+            only = values[0]
+            return lambda: only
+        return AliasTable(values, weights).sample
+
+    if "randint" in spec:
+        lo, hi = spec["randint"]
+        return lambda: random.randint(lo, hi)
+
+    if "uniform" in spec:
+        lo, hi = spec["uniform"]
+        sampler = lambda: random.uniform(lo, hi)
+    elif "normal" in spec:
+        mean, stddev = spec["normal"]
+        lo, hi = spec.get("clip", (float("-inf"), float("inf")))
+        sampler = lambda: min(hi, max(lo, random.gauss(mean, stddev)))
+    else:
+        raise ValueError(f"Unknown distribution spec: {spec!r}")
+    if kind is int:
+        # Continuous distributions for integer fields (pages, items, rotation) round to the nearest value
+        return lambda: int(round(sampler()))
+    return sampler
+
+
+class WorkloadProfile:
+    """One named document mix compiled into per-parameter samplers"""
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        self.name = name
+        self.weight = float(spec.get("weight", 1))
+
+        self._pages = compile_distribution(spec.get("pages", 1), int)
+        self._items = compile_distribution(spec["items"], int) if "items" in spec else None
+        self._rotation = compile_distribution(spec.get("rotation", 0), int)
+
+        offset = spec.get("offset", {})
+        self._offset_probability = float(offset.get("probability", 1.0 if offset else 0.0))
+        self._offset_x = compile_distribution(offset.get("x", 0), float)
+        self._offset_y = compile_distribution(offset.get("y", 0), float)
+
+        layout = spec.get("layout", "letter")
+        self._layout = compile_distribution(layout, str)
+        if isinstance(layout, dict):
+            layouts = layout.get("values") or list(layout.get("weights", {}))
+        else:
+            layouts = [layout]
+        for page_size in layouts:
+            if page_size not in PAGE_SIZES:
+                raise ValueError(f"Profile '{name}': unknown layout '{page_size}' (choose from {', '.join(PAGE_SIZES)})")
+
+        self.injection_rates = dict(spec.get("injection", {}))
+        for field in self.injection_rates:
+            if field not in DEFAULT_INJECTION_RATES:
+                raise ValueError(f"Profile '{name}': unknown injection field '{field}'")
+
+    def sample(self) -> Dict[str, Any]:
+        """Sample generation parameters (everything except IDs and seed) for one invoice"""
+        offset_x = offset_y = 0.0
+        if self._offset_probability and random.random() < self._offset_probability:
+            offset_x = self._offset_x()
+            offset_y = self._offset_y()
+
+        num_pages = max(1, self._pages())
+        params = {
+            "num_pages": num_pages,
+            "rotation": self._rotation(),
+            "offset_x": offset_x,
+            "offset_y": offset_y,
+            "page_size": self._layout(),
+            "profile": self.name,
+        }
+        if self._items is not None:
+            params["num_items"] = max(1, self._items())
+            # Items are sampled independently of pages; add pages so the layout shows all of them
+            params["num_pages"] = max(num_pages, min_pages(params["num_items"]))
+        if self.injection_rates:
+            params["injection_rates"] = self.injection_rates
+        return params
+
+
+class WorkloadMix:
+    """Weighted mix of workload profiles; each invoice is drawn from one profile"""
+
+    def __init__(self, profiles: List[WorkloadProfile]):
+        if not profiles:
+            raise ValueError("A workload mix needs at least one profile")
+        self.profiles = profiles
+        self._pick = AliasTable(profiles, [p.weight for p in profiles]).sample
+
+    def sample(self) -> Dict[str, Any]:
+        return self._pick().sample()
+
+    def describe(self) -> str:
+        total = sum(p.weight for p in self.profiles)
+        return ", ".join(f"{p.name} ({p.weight / total * 100:.0f}%)" for p in self.profiles)
+
+
+def load_workload(path: str, selections: Optional[List[str]] = None) -> WorkloadMix:
+    """
+    Load a workload file and compile the selected profiles into a mix.
+
+    selections are profile names, optionally with a weight override ("retail=3");
+    by default every profile in the file is used with its own weight.
+    """
+    with open(Path(path)) as f:
+        specs = json.load(f).get("profiles", {})
+    if not specs:
+        raise ValueError(f"No profiles defined in {path}")
+
+    if not selections:
+        return WorkloadMix([WorkloadProfile(name, spec) for name, spec in specs.items()])
+
+    profiles = []
+    for selection in selections:
+        name, _, weight = selection.partition("=")
+        if name not in specs:
+            raise ValueError(f"Unknown profile '{name}' in {path} (available: {', '.join(specs)})")
+        profile = WorkloadProfile(name, specs[name])
+        if weight:
+            profile.weight = float(weight)
+        profiles.append(profile)
+    return WorkloadMix(profiles)